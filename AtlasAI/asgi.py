@@ -14,3 +14,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'AtlasAI.settings')
 
 application = get_asgi_application()
+
+from projects.agent.agent import warm_up  # noqa: E402
+
+warm_up()
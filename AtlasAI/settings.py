@@ -58,7 +58,12 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 25,
 }
 
+# Serve task tables from the denormalized TaskRow read model (projects.readmodel).
+# Run `python manage.py rebuild_task_rows` after turning this on.
+TASK_ROW_READ_MODEL = False
+
 MIDDLEWARE = [
+    'projects.querybudget.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -148,4 +153,80 @@ import dotenv
 dotenv.load_dotenv()
 
 XAI_API_KEY = os.environ.get('XAI_API_KEY')
-LOGFIRE_KEY = os.environ.get('LOGFIRE_KEY')
\ No newline at end of file
+LOGFIRE_KEY = os.environ.get('LOGFIRE_KEY')
+
+# The agents' model (projects.agent.llm): 'grok' (the Grok API), or the offline 'scripted' / 'test'
+# stubs for development and benchmarks without network. AGENT_STUB_LATENCY adds a fixed number of
+# seconds per stub model request to stand in for LLM time.
+AGENT_MODEL = os.environ.get('AGENT_MODEL', 'grok')
+AGENT_STUB_LATENCY = float(os.environ.get('AGENT_STUB_LATENCY', 0))
+
+# Agent chat concurrency (projects.agent.concurrency): agent runs in flight per process (extra
+# chats wait up to AGENT_CHAT_QUEUE_TIMEOUT seconds) and per user (extra chats get a 429), and
+# the size of the thread pool that runs the synchronous ORM tools.
+AGENT_CHAT_MAX_CONCURRENCY = int(os.environ.get('AGENT_CHAT_MAX_CONCURRENCY', 32))
+AGENT_CHAT_MAX_CONCURRENCY_PER_USER = int(os.environ.get('AGENT_CHAT_MAX_CONCURRENCY_PER_USER', 2))
+AGENT_CHAT_QUEUE_TIMEOUT = 30
+AGENT_TOOL_THREADS = int(os.environ.get('AGENT_TOOL_THREADS', 8))
+AGENT_CHAT_MAX_WAITING = 64
+# Agent chat rate limits (projects.agent.ratelimit), shared by all processes through the database:
+# chats and estimated prompt tokens per minute, per user and overall (0 = no limit). Chats over
+# the limit wait up to AGENT_RATE_MAX_WAIT seconds for the buckets to refill (at most
+# AGENT_RATE_MAX_WAITING at a time per process), else get a 429 with Retry-After.
+AGENT_RATE_USER_REQUESTS = int(os.environ.get('AGENT_RATE_USER_REQUESTS', 20))
+AGENT_RATE_USER_TOKENS = int(os.environ.get('AGENT_RATE_USER_TOKENS', 50_000))
+AGENT_RATE_GLOBAL_REQUESTS = int(os.environ.get('AGENT_RATE_GLOBAL_REQUESTS', 600))
+AGENT_RATE_GLOBAL_TOKENS = int(os.environ.get('AGENT_RATE_GLOBAL_TOKENS', 1_000_000))
+AGENT_RATE_MAX_WAIT = 2
+AGENT_RATE_MAX_WAITING = 32
+# Seconds of silence after which /api/agent/chat/stream sends an SSE keep-alive comment.
+AGENT_STREAM_HEARTBEAT = 15
+# Chat context snapshots (projects.agent.context): token budget of the selected object's snapshot
+# (~4 characters a token, so 512 keeps it near the 2 KB target) and how long snapshots stay cached.
+AGENT_CONTEXT_MAX_TOKENS = 512
+AGENT_CONTEXT_CACHE_TIMEOUT = 600
+# Chat history compaction (projects.agent.history): past AGENT_HISTORY_MAX_TOKENS of previous_messages,
+# all but the last AGENT_HISTORY_KEEP_MESSAGES are folded into a rolling summary of at most
+# AGENT_HISTORY_SUMMARY_TOKENS, kept per session for AGENT_HISTORY_CACHE_TIMEOUT seconds.
+AGENT_HISTORY_MAX_TOKENS = int(os.environ.get('AGENT_HISTORY_MAX_TOKENS', 2000))
+AGENT_HISTORY_KEEP_MESSAGES = int(os.environ.get('AGENT_HISTORY_KEEP_MESSAGES', 6))
+AGENT_HISTORY_SUMMARY_TOKENS = 400
+AGENT_HISTORY_CACHE_TIMEOUT = 3600
+# Answers of read-only chats (projects.agent.answers) are cached for AGENT_ANSWER_CACHE_TIMEOUT
+# seconds, keyed on the user's data versions so writes make them stale at once (0 = no cache).
+AGENT_ANSWER_CACHE_TIMEOUT = int(os.environ.get('AGENT_ANSWER_CACHE_TIMEOUT', 600))
+
+# Background jobs (projects.jobs, run by manage.py worker): leases last JOB_LEASE_SECONDS and are
+# renewed every JOB_HEARTBEAT_SECONDS, so a crashed worker's job is picked up again after at most
+# JOB_LEASE_SECONDS (JOB_MAX_ATTEMPTS tries in all). Per user, at most JOB_MAX_RUNNING_PER_USER
+# jobs run at a time and JOB_MAX_PENDING_PER_USER wait or run.
+JOB_LEASE_SECONDS = 60
+JOB_HEARTBEAT_SECONDS = 10
+JOB_MAX_ATTEMPTS = 3
+JOB_MAX_RUNNING_PER_USER = int(os.environ.get('JOB_MAX_RUNNING_PER_USER', 2))
+JOB_MAX_PENDING_PER_USER = 20
+JOB_WORKER_THREADS = int(os.environ.get('JOB_WORKER_THREADS', 4))
+JOB_POLL_INTERVAL = 1
+
+# Query instrumentation (projects.querybudget): fail requests that exceed a view's declared
+# query_budget (meant for test runs: QUERY_BUDGET_STRICT=1 python manage.py test), and the
+# number of repeats of one statement shape reported as a likely N+1.
+QUERY_BUDGET_STRICT = os.environ.get('QUERY_BUDGET_STRICT', '') == '1'
+QUERY_REPEAT_THRESHOLD = 5
+
+# Metrics (projects.metrics, served at /api/metrics to staff): with several worker processes, set
+# METRICS_DIR to a directory they share; each writes its snapshot there at most every
+# METRICS_FLUSH_INTERVAL seconds and /api/metrics adds them up.
+METRICS_DIR = os.environ.get('METRICS_DIR') or None
+METRICS_FLUSH_INTERVAL = 1
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {'console': {'class': 'logging.StreamHandler'}},
+    'loggers': {
+        # one JSON line per request / agent tool call; INFO for all, WARNING for N+1 or over budget
+        'projects.queries': {'handlers': ['console'], 'level': os.environ.get('QUERY_LOG_LEVEL', 'WARNING'),
+                             'propagate': False},
+    },
+}
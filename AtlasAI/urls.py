@@ -28,12 +28,15 @@ router.register(r'tasks', TaskViewSet, basename='task')
 router.register(r'tags', TagViewSet, basename='tag')
 router.register(r'comments', CommentViewSet, basename='comment')
 
-from projects.views import AgentChatView, AgentChatStreamView, spv_view
+from projects.views import AgentChatView, AgentChatStreamView, JobView, JobEventsView, MetricsView, spv_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include(router.urls)),
     path('api/agent/chat', AgentChatView.as_view(), name='agent-chat'),
     path('api/agent/chat/stream', AgentChatStreamView.as_view(), name='agent-chat-stream'),
+    path('api/jobs/<int:pk>', JobView.as_view(), name='job'),
+    path('api/jobs/<int:pk>/events', JobEventsView.as_view(), name='job-events'),
+    path('api/metrics', MetricsView.as_view(), name='metrics'),
     path('spv/', spv_view, name='spv'),
 ]
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Project, Task, Tag, Comment
+from .models import Project, Task, Tag, Comment, Job
 
 
 @admin.register(Tag)
@@ -36,3 +36,10 @@ class CommentAdmin(admin.ModelAdmin):
     list_display = ("id", "title", "task", "owner", "created")
     search_fields = ("title", "description")
     autocomplete_fields = ("task", "owner")
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "user", "status", "attempts", "lease_owner", "created", "finished")
+    list_filter = ("kind", "status")
+    raw_id_fields = ("user",)
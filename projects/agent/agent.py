@@ -1,18 +1,25 @@
+import functools
+import inspect
+import time
+from dataclasses import dataclass, field
 from typing import Any, Dict, Union
 from pydantic_ai import Agent, RunContext
-from pydantic_ai.models.openai import OpenAIChatModel
-from pydantic_ai.providers.grok import GrokProvider
 from django.conf import settings
+from .tools.cache import ToolCache, memoized
 from .tools.generic import CreateAction, ReadAction, QueryAction, UpdateAction, DeleteAction, tool_orm_action
 import logfire
 
-model = OpenAIChatModel('grok-code-fast-1',
-                        provider=GrokProvider(api_key=settings.XAI_API_KEY),
-                        )
+from .. import metrics
+from .concurrency import ToolTimings, as_async_tool, write_lock
+from .llm import build_model
+
+model = build_model()  # settings.AGENT_MODEL: the Grok API, or an offline stub (see .llm)
 
 from .tools.task import (
-    tool_create_task, tool_get_task, tool_list_tasks, tool_update_task, tool_delete_task,
-    CreateTaskIn, UpdateTaskIn, GetTaskIn, ListTasksIn, DeleteTaskIn, TaskOut,
+    tool_create_task, tool_get_task, tool_list_tasks, tool_update_task, tool_delete_task, tool_search_tasks,
+    tool_bulk_create_tasks, tool_bulk_update_tasks, tool_bulk_assign,
+    CreateTaskIn, UpdateTaskIn, GetTaskIn, ListTasksIn, DeleteTaskIn, SearchTasksIn, TaskOut,
+    BulkCreateTasksIn, BulkUpdateTasksIn, BulkAssignIn, BulkTasksOut,
 )
 from .tools.project import (
     tool_create_project, tool_get_project, tool_list_projects, tool_update_project, tool_delete_project,
@@ -24,7 +31,9 @@ from .tools.tag import (
 )
 from .tools.comment import (
     tool_create_comment, tool_get_comment, tool_list_comments, tool_update_comment, tool_delete_comment,
+    tool_bulk_create_comments,
     CreateCommentIn, UpdateCommentIn, GetCommentIn, ListCommentsIn, DeleteCommentIn, CommentOut,
+    BulkCreateCommentsIn, BulkCommentsOut,
 )
 
 
@@ -34,6 +43,9 @@ Follow permissions equivalent to the REST API:
 - Only the task owner or staff can update/delete a task.
 - Non-staff can see tasks they own or are assigned to.
 
+To create or change several tasks or comments at once, use one bulk_* tool call instead of many
+single calls; check its per-item results for the items that failed.
+
 Maintain and enrich the llm_context field to store brief, helpful context for future RAG use and for traceability.
 Keep it concise and structured, without replicating information from the rest of the fields
  (e.g., source, last_action, actor_user_id, summary_text).
@@ -44,122 +56,255 @@ return it as { 'message': '...' }. Otherwise, return the objects resulting from
 """
 
 
-def agent_factory(user=None):
-    """Create an Agent pre-wired with task CRUD tools.
-
-    Pass the current user (request.user) when constructing the agent so tools can
-    enforce permissions and attribute actions.
-    """
-    logfire.configure(token=settings.LOGFIRE_KEY)
+@dataclass
+class AgentDeps:
+    """Per-run dependencies, passed as ``deps=`` to ``run``/``run_sync`` and read by tools from ``ctx.deps``."""
+    user: Any = None
+    # write actions ('create' / 'update' / 'delete') completed by tools during the run, in order
+    actions: list = field(default_factory=list)
+    # the run's memoized read tool results (see .tools.cache)
+    tool_cache: ToolCache = field(default_factory=ToolCache)
+    # the compacted chat history the run started from (see .history), if any
+    history: Any = None
+    # held by write tool calls, which run one at a time (see .concurrency)
+    write_lock: Any = field(default_factory=write_lock)
+    tool_timings: ToolTimings = field(default_factory=ToolTimings)
+
+    def meta(self):
+        """The ``meta`` of a chat response for this run."""
+        return {
+            'changed': bool(self.actions),
+            'last_action': self.actions[-1] if self.actions else None,
+            'actions': self.actions,
+            'user_id': getattr(self.user, 'id', None),
+            'tool_cache': self.tool_cache.stats(),
+            'tool_time': self.tool_timings.stats(),
+            'history': self.history.meta() if self.history else None,
+        }
+
+
+@functools.cache
+def configure_observability():
+    """Configure logfire and pydantic-ai instrumentation once per process."""
+    logfire.configure(token=settings.LOGFIRE_KEY, send_to_logfire='if-token-present')
     logfire.instrument_pydantic_ai()
 
-    agent = Agent(
-        model=model,
-        name="Project DB handler agent",
-        system_prompt=SYSTEM_PROMPT,
-        output_type=dict,
-    )
 
-    # Register tools. Each tool wraps underlying function adding the user context.
-    # We annotate input and output types for pydantic_ai.
+# Tools take the acting user from the run's deps, so one agent serves every request.
 
-    # Task tools
-    @agent.tool
-    def create_task(ctx: RunContext[str], payload: CreateTaskIn) -> TaskOut:  # type: ignore[no-redef]
-        return tool_create_task(user, payload)
+# Task tools
+def create_task(ctx: RunContext[AgentDeps], payload: CreateTaskIn) -> TaskOut:
+    return tool_create_task(ctx.deps.user, payload)
 
-    @agent.tool
-    def get_task(ctx: RunContext[str], payload: GetTaskIn) -> TaskOut:  # type: ignore[no-redef]
-        return tool_get_task(user, payload)
 
-    @agent.tool
-    def list_tasks(ctx: RunContext[str], payload: ListTasksIn) -> list[TaskOut]:  # type: ignore[no-redef]
-        return tool_list_tasks(user, payload)
+def get_task(ctx: RunContext[AgentDeps], payload: GetTaskIn) -> TaskOut:
+    return tool_get_task(ctx.deps.user, payload)
 
-    @agent.tool
-    def update_task(ctx: RunContext[str], payload: UpdateTaskIn) -> TaskOut:  # type: ignore[no-redef]
-        return tool_update_task(user, payload)
 
-    @agent.tool
-    def delete_task(ctx: RunContext[str], payload: DeleteTaskIn) -> Dict[str, Any]:  # type: ignore[no-redef]
-        return tool_delete_task(user, payload)
+def list_tasks(ctx: RunContext[AgentDeps], payload: ListTasksIn) -> list[TaskOut]:
+    return tool_list_tasks(ctx.deps.user, payload)
 
-    # Project tools
-    @agent.tool
-    def create_project(ctx: RunContext[str], payload: CreateProjectIn) -> ProjectOut:  # type: ignore[no-redef]
-        return tool_create_project(user, payload)
 
-    @agent.tool
-    def get_project(ctx: RunContext[str], payload: GetProjectIn) -> ProjectOut:  # type: ignore[no-redef]
-        return tool_get_project(user, payload)
+def search_tasks(ctx: RunContext[AgentDeps], payload: SearchTasksIn) -> list[TaskOut]:
+    """Full-text search over visible tasks, including their tags, project title and comments."""
+    return tool_search_tasks(ctx.deps.user, payload)
 
-    @agent.tool
-    def list_projects(ctx: RunContext[str], payload: ListProjectsIn) -> list[ProjectOut]:  # type: ignore[no-redef]
-        return tool_list_projects(user, payload)
 
-    @agent.tool
-    def update_project(ctx: RunContext[str], payload: UpdateProjectIn) -> ProjectOut:  # type: ignore[no-redef]
-        return tool_update_project(user, payload)
+def update_task(ctx: RunContext[AgentDeps], payload: UpdateTaskIn) -> TaskOut:
+    return tool_update_task(ctx.deps.user, payload)
 
-    @agent.tool
-    def delete_project(ctx: RunContext[str], payload: DeleteProjectIn) -> Dict[str, Any]:  # type: ignore[no-redef]
-        return tool_delete_project(user, payload)
 
-    # Tag tools
-    @agent.tool
-    def create_tag(ctx: RunContext[str], payload: CreateTagIn) -> TagOut:  # type: ignore[no-redef]
-        return tool_create_tag(user, payload)
+def delete_task(ctx: RunContext[AgentDeps], payload: DeleteTaskIn) -> Dict[str, Any]:
+    return tool_delete_task(ctx.deps.user, payload)
 
-    @agent.tool
-    def get_tag(ctx: RunContext[str], payload: GetTagIn) -> TagOut:  # type: ignore[no-redef]
-        return tool_get_tag(user, payload)
 
-    @agent.tool
-    def list_tags(ctx: RunContext[str], payload: ListTagsIn) -> list[TagOut]:  # type: ignore[no-redef]
-        return tool_list_tags(user, payload)
+def bulk_create_tasks(ctx: RunContext[AgentDeps], payload: BulkCreateTasksIn) -> BulkTasksOut:
+    """Create several tasks in one transaction; returns a result (task or error) per item."""
+    return tool_bulk_create_tasks(ctx.deps.user, payload)
 
-    @agent.tool
-    def update_tag(ctx: RunContext[str], payload: UpdateTagIn) -> TagOut:  # type: ignore[no-redef]
-        return tool_update_tag(user, payload)
 
-    @agent.tool
-    def delete_tag(ctx: RunContext[str], payload: DeleteTagIn) -> Dict[str, Any]:  # type: ignore[no-redef]
-        return tool_delete_tag(user, payload)
+def bulk_update_tasks(ctx: RunContext[AgentDeps], payload: BulkUpdateTasksIn) -> BulkTasksOut:
+    """Update several tasks in one transaction; returns a result (task or error) per item."""
+    return tool_bulk_update_tasks(ctx.deps.user, payload)
 
-    # Comment tools
-    @agent.tool
-    def create_comment(ctx: RunContext[str], payload: CreateCommentIn) -> CommentOut:  # type: ignore[no-redef]
-        return tool_create_comment(user, payload)
 
-    @agent.tool
-    def get_comment(ctx: RunContext[str], payload: GetCommentIn) -> CommentOut:  # type: ignore[no-redef]
-        return tool_get_comment(user, payload)
+def bulk_assign(ctx: RunContext[AgentDeps], payload: BulkAssignIn) -> BulkTasksOut:
+    """Assign users to several tasks in one transaction; returns a result (task or error) per task."""
+    return tool_bulk_assign(ctx.deps.user, payload)
 
-    @agent.tool
-    def list_comments(ctx: RunContext[str], payload: ListCommentsIn) -> list[CommentOut]:  # type: ignore[no-redef]
-        return tool_list_comments(user, payload)
 
-    @agent.tool
-    def update_comment(ctx: RunContext[str], payload: UpdateCommentIn) -> CommentOut:  # type: ignore[no-redef]
-        return tool_update_comment(user, payload)
+# Project tools
+def create_project(ctx: RunContext[AgentDeps], payload: CreateProjectIn) -> ProjectOut:
+    return tool_create_project(ctx.deps.user, payload)
 
-    @agent.tool
-    def delete_comment(ctx: RunContext[str], payload: DeleteCommentIn) -> Dict[str, Any]:  # type: ignore[no-redef]
-        return tool_delete_comment(user, payload)
 
-    return agent
+def get_project(ctx: RunContext[AgentDeps], payload: GetProjectIn) -> ProjectOut:
+    return tool_get_project(ctx.deps.user, payload)
+
+
+def list_projects(ctx: RunContext[AgentDeps], payload: ListProjectsIn) -> list[ProjectOut]:
+    return tool_list_projects(ctx.deps.user, payload)
+
+
+def update_project(ctx: RunContext[AgentDeps], payload: UpdateProjectIn) -> ProjectOut:
+    return tool_update_project(ctx.deps.user, payload)
+
+
+def delete_project(ctx: RunContext[AgentDeps], payload: DeleteProjectIn) -> Dict[str, Any]:
+    return tool_delete_project(ctx.deps.user, payload)
+
+
+# Tag tools
+def create_tag(ctx: RunContext[AgentDeps], payload: CreateTagIn) -> TagOut:
+    return tool_create_tag(ctx.deps.user, payload)
+
+
+def get_tag(ctx: RunContext[AgentDeps], payload: GetTagIn) -> TagOut:
+    return tool_get_tag(ctx.deps.user, payload)
+
+
+def list_tags(ctx: RunContext[AgentDeps], payload: ListTagsIn) -> list[TagOut]:
+    return tool_list_tags(ctx.deps.user, payload)
+
+
+def update_tag(ctx: RunContext[AgentDeps], payload: UpdateTagIn) -> TagOut:
+    return tool_update_tag(ctx.deps.user, payload)
+
+
+def delete_tag(ctx: RunContext[AgentDeps], payload: DeleteTagIn) -> Dict[str, Any]:
+    return tool_delete_tag(ctx.deps.user, payload)
+
+
+# Comment tools
+def create_comment(ctx: RunContext[AgentDeps], payload: CreateCommentIn) -> CommentOut:
+    return tool_create_comment(ctx.deps.user, payload)
 
 
-def orm_agent_factory(user=None):
+def get_comment(ctx: RunContext[AgentDeps], payload: GetCommentIn) -> CommentOut:
+    return tool_get_comment(ctx.deps.user, payload)
+
+
+def list_comments(ctx: RunContext[AgentDeps], payload: ListCommentsIn) -> list[CommentOut]:
+    return tool_list_comments(ctx.deps.user, payload)
+
+
+def update_comment(ctx: RunContext[AgentDeps], payload: UpdateCommentIn) -> CommentOut:
+    return tool_update_comment(ctx.deps.user, payload)
+
+
+def delete_comment(ctx: RunContext[AgentDeps], payload: DeleteCommentIn) -> Dict[str, Any]:
+    return tool_delete_comment(ctx.deps.user, payload)
+
+
+def bulk_create_comments(ctx: RunContext[AgentDeps], payload: BulkCreateCommentsIn) -> BulkCommentsOut:
+    """Create several comments in one transaction; returns a result (comment or error) per item."""
+    return tool_bulk_create_comments(ctx.deps.user, payload)
+
+
+def orm_action(ctx: RunContext[AgentDeps],
+               action: Union[CreateAction, ReadAction, UpdateAction, DeleteAction, QueryAction]) -> Dict[str, Any]:
     """
-    Create an agent that can directly use the django ORM
-    :return: 
-    :rtype: 
+    Execute a Django ORM action on a specified model.
+
+    You can create, read, update, delete or query any of the allowed models:
+    Project, Task, Tag, Comment.
+
+    For create or update actions, provide the data as a dictionary.
+    For read or delete actions, provide the id of the instance. A read also lists the ids of the rows
+    pointing at the instance that you may see (e.g. a task's comment_ids, a tag's task_ids).
+    For query actions, provide optional filters as a dictionary. Queries can also return only some
+    fields, sort (order_by), skip rows (offset) or page with a cursor, and count or sum rows instead of
+    returning them (aggregate, with group_by): prefer these to fetching whole rows to count them.
+
+    Examples:
+    - Create a new task: {"model_name": "task", "type": "create", "data": {"title": "New Task", "description": "...", "project_id": 1}}
+    - Read a task: {"model_name": "task", "type": "read", "id": 1}
+    - Update a task: {"model_name": "task", "type": "update", "id": 1, "data": {"status": "IN_PROGRESS"}}
+    - Delete a task: {"model_name": "task", "type": "delete", "id": 1}
+    - Query tasks: {"model_name": "task", "type": "query", "filters": {"project_id": 1}}
+    - Titles of the next tasks due: {"model_name": "task", "type": "query", "fields": ["id", "title", "due_date"],
+      "order_by": ["due_date"], "limit": 10}
+    - Count tasks by status in project 4: {"model_name": "task", "type": "query", "filters": {"project_id": 4},
+      "aggregate": ["count", "sum:estimated_hours"], "group_by": ["status"]}
     """
-    logfire.configure(token=settings.LOGFIRE_KEY)
-    logfire.instrument_pydantic_ai()
+    return tool_orm_action(ctx.deps.user, action)
+
+
+CRUD_TOOLS = [
+    create_task, get_task, list_tasks, search_tasks, update_task, delete_task,
+    bulk_create_tasks, bulk_update_tasks, bulk_assign,
+    create_project, get_project, list_projects, update_project, delete_project,
+    create_tag, get_tag, list_tags, update_tag, delete_tag,
+    create_comment, get_comment, list_comments, update_comment, delete_comment,
+    bulk_create_comments,
+]
+
+
+ORM_WRITE_ACTIONS = {CreateAction: 'create', UpdateAction: 'update', DeleteAction: 'delete'}
+BULK_WRITE_ACTIONS = {
+    'bulk_create_tasks': 'create', 'bulk_update_tasks': 'update', 'bulk_assign': 'update',
+    'bulk_create_comments': 'create',
+}
+
+
+def write_action(tool_name, arguments):
+    """'create' / 'update' / 'delete' when a call of ``tool_name`` with ``arguments`` writes, else None."""
+    if tool_name == 'orm_action':
+        return ORM_WRITE_ACTIONS.get(type(arguments.get('action')))
+    if tool_name in BULK_WRITE_ACTIONS:
+        return BULK_WRITE_ACTIONS[tool_name]
+    verb = tool_name.split('_', 1)[0]
+    return verb if verb in ('create', 'update', 'delete') else None
+
+
+def guard_writes(func):
+    """Run write calls of the tool one at a time (``ctx.deps.write_lock``) and append their action
+    to ``ctx.deps.actions`` once they succeed. Read calls run unguarded, side by side."""
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def tool(ctx, *args, **kwargs):
+        action = write_action(func.__name__, signature.bind(ctx, *args, **kwargs).arguments)
+        if not action:
+            return func(ctx, *args, **kwargs)
+        with ctx.deps.write_lock:
+            result = func(ctx, *args, **kwargs)
+        ctx.deps.actions.append(action)
+        return result
+    return tool
+
+
+def timed(func):
+    """Record the call's start and end in ``ctx.deps.tool_timings``."""
+    @functools.wraps(func)
+    def tool(ctx, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(ctx, *args, **kwargs)
+        finally:
+            ctx.deps.tool_timings.add(started, time.perf_counter())
+    return tool
+
+
+def register_tools(agent, tools):
+    """Register ``tools`` on ``agent`` as async tools run on the bounded tool pool (see .concurrency)."""
+    for func in tools:
+        agent.tool(as_async_tool(guard_writes(timed(memoized(func)))))
+    return agent
+
 
-    agent = Agent(
+def build_agent() -> Agent[AgentDeps, dict]:
+    return register_tools(Agent(
+        model=model,
+        name="Project DB handler agent",
+        system_prompt=SYSTEM_PROMPT,
+        deps_type=AgentDeps,
+        output_type=dict,
+    ), CRUD_TOOLS)
+
+
+def build_orm_agent() -> Agent[AgentDeps, dict]:
+    return register_tools(Agent(
         model=model,
         name="Django ORM agent",
         system_prompt="""
@@ -176,7 +321,8 @@ def orm_agent_factory(user=None):
         - Read existing instances: Use orm_action with model_name and id
         - Update instances: Use orm_action with model_name, id and data
         - Delete instances: Use orm_action with model_name and id
-        - Query instances: Use orm_action with model_name and optional filters
+        - Query instances: Use orm_action with model_name and optional filters, fields, order_by, offset,
+          cursor, or aggregate and group_by to count or sum instead of listing rows
         
         Always specify the model_name in lowercase (e.g., "project", "task").
         Always output JSON. If the response can be factually represented as a simple message, 
@@ -184,34 +330,35 @@ def orm_agent_factory(user=None):
         Otherwise, return the objects resulting from your tool calls, for example:
         { 'tasks': [ { 'id': 1, 'title': 'Task 1' }, { 'id': 2, 'title': 'Task 2' } ] }. 
         """,
+        deps_type=AgentDeps,
         output_type=dict,
-    )
-    
-    @agent.tool
-    def orm_action(ctx: RunContext[str], action: Union[CreateAction, ReadAction, UpdateAction, DeleteAction, QueryAction]) -> Dict[str, Any]:
-        """
-        Execute a Django ORM action on a specified model.
-
-        You can create, read, update, delete or query any of the allowed models:
-        Project, Task, Tag, Comment.
-
-        For create or update actions, provide the data as a dictionary.
-        For read or delete actions, provide the id of the instance.
-        For query actions, provide optional filters as a dictionary.
-
-        Examples:
-        - Create a new task: {"model_name": "task", "type": "create", "data": {"title": "New Task", "description": "...", "project_id": 1}}
-        - Read a task: {"model_name": "task", "type": "read", "id": 1}
-        - Update a task: {"model_name": "task", "type": "update", "id": 1, "data": {"status": "IN_PROGRESS"}}
-        - Delete a task: {"model_name": "task", "type": "delete", "id": 1}
-        - Query tasks: {"model_name": "task", "type": "query", "filters": {"project_id": 1}}
-        """
-        return tool_orm_action(user, action)
+    ), [orm_action])
+
+
+@functools.cache
+def agent_factory() -> Agent[AgentDeps, dict]:
+    """The process-wide agent with the task/project/tag/comment CRUD tools.
+
+    Built on first use and shared by all requests; pass the current user per run with
+    ``deps=AgentDeps(user=request.user)`` so tools enforce permissions and attribute actions.
+    """
+    configure_observability()
+    return build_agent()
+
+
+@functools.cache
+def orm_agent_factory() -> Agent[AgentDeps, dict]:
+    """The process-wide agent exposing the generic Django ORM tool (see ``agent_factory``)."""
+    configure_observability()
+    return build_orm_agent()
 
-    return agent
 
+def warm_up():
+    """Build both agents at worker start so the first chat request doesn't pay for it."""
+    agent_factory()
+    orm_agent_factory()
 
 
-def run_orm_agent(task):
-    agent = orm_agent_factory()
-    return agent.run_sync(task)
\ No newline at end of file
+def run_orm_agent(task, user=None):
+    with metrics.observe_run('orm'):
+        return orm_agent_factory().run_sync(task, deps=AgentDeps(user=user))
@@ -0,0 +1,56 @@
+"""
+Cache of agent answers to read-only chats, so a repeated question ("list my overdue tasks")
+skips the model round trips.
+
+An answer is stored only when its run called no write tool (``ToolCache.writes``) and is keyed
+on the user, the normalized message, the chat's context object, the conversation it continues
+(compacted, see ``.history``; empty on a first turn) and the data versions of the user
+(``projects.versions``) read before the run. Every write to the user's tasks, projects,
+comments or to tags bumps a version, so the next lookup computes another key and the stale
+answer is never served; it just expires after ``AGENT_ANSWER_CACHE_TIMEOUT`` seconds (0 turns
+the cache off). The versions are kept in the database, so writes in any process count.
+
+Clients skip the cache with ``options.no_cache``; ``meta.answer_cache`` reports
+``{"hit", "stored"}``.
+"""
+import hashlib
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .. import versions
+from .context import dumps
+
+TRAILING = re.compile(r'[\s?!.]+$')
+
+
+def normalize(message: str) -> str:
+    """``message`` lower-cased, with runs of whitespace collapsed and without trailing punctuation."""
+    return TRAILING.sub('', ' '.join(str(message).split()).lower())
+
+
+def enabled(options) -> bool:
+    return bool(settings.AGENT_ANSWER_CACHE_TIMEOUT) and not options.get('no_cache')
+
+
+def key(user, message, context, history) -> str:
+    """The cache key of the chat; reads the user's data versions (one query)."""
+    context = [context.get('type'), str(context.get('id', ''))] if context else None
+    conversation = [history.summary, history.recent] if history else None
+    parts = [user.id, normalize(message), context, conversation, versions.current(user)]
+    return 'agent-answer:' + hashlib.sha1(dumps(parts).encode()).hexdigest()
+
+
+def lookup(key):
+    """The cached ``{"output", "meta"}`` of the chat, or None."""
+    return cache.get(key)
+
+
+def cacheable(deps) -> bool:
+    """Whether the run only read: no write tool was called, not even one that failed."""
+    return not deps.tool_cache.writes and not deps.actions
+
+
+def store(key, output, meta):
+    cache.set(key, {'output': output, 'meta': meta}, settings.AGENT_ANSWER_CACHE_TIMEOUT)
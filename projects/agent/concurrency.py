@@ -0,0 +1,171 @@
+"""
+Concurrency controls for agent runs.
+
+Tools are synchronous ORM code; ``as_async_tool`` turns each into a coroutine that runs it
+on a dedicated, bounded thread pool (``settings.AGENT_TOOL_THREADS``), so an awaited agent
+run never blocks the event loop and the number of threads (and DB connections) used by
+tools stays fixed however many chats are in flight. The tool calls of one model response
+run concurrently, each on its own pool thread and connection; write calls take
+``write_lock()`` so they still run one at a time, each in its own transaction.
+``ToolTimings`` measures what running them side by side saved.
+
+``chat_limiter`` caps agent runs in flight per process (``AGENT_CHAT_MAX_CONCURRENCY``;
+extra chats wait up to ``AGENT_CHAT_QUEUE_TIMEOUT`` seconds, at most ``AGENT_CHAT_MAX_WAITING``
+of them, further ones are rejected at once) and per user (``AGENT_CHAT_MAX_CONCURRENCY_PER_USER``;
+extra chats are rejected at once). Its counters are guarded by a thread lock, so it also holds
+when async views run on per-request loops under WSGI. Rates across processes are limited by
+``projects.agent.ratelimit``.
+"""
+import asyncio
+import functools
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from .. import metrics
+from ..querybudget import track_queries
+
+
+class ChatLimitExceeded(Exception):
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@functools.cache
+def tool_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=getattr(settings, 'AGENT_TOOL_THREADS', 8),
+                              thread_name_prefix='agent-tool')
+
+
+def _call_tool(name, func, *args, **kwargs):
+    """One tool call on a pool thread: on a fresh connection, queries tracked (projects.querybudget), metered."""
+    close_old_connections()
+    outcome, stats = 'error', None
+    try:
+        with track_queries(f'tool:{name}', log=True) as stats:
+            result = func(*args, **kwargs)
+        outcome = 'ok'
+        return result
+    finally:
+        metrics.TOOL_CALLS.inc(tool=name, outcome=outcome)
+        if stats is not None:  # else the query tracking itself failed to start
+            metrics.TOOL_SECONDS.observe(stats.elapsed_ms / 1000, tool=name)
+            metrics.TOOL_QUERIES.observe(stats.count, tool=name)
+
+
+def as_async_tool(func):
+    """Async tool running ``func`` on the tool pool (see ``_call_tool``)."""
+    run = sync_to_async(_call_tool, thread_sensitive=False, executor=tool_executor())
+
+    @functools.wraps(func)
+    async def tool(*args, **kwargs):
+        return await run(func.__name__, func, *args, **kwargs)
+    return tool
+
+
+# SQLite takes one writer at a time, and a second write transaction fails with "database is locked"
+# rather than waiting, so there every agent write in the process shares one lock.
+_sqlite_write_lock = threading.Lock()
+
+
+def write_lock():
+    """The lock a run's write tools hold: one per run, or process-wide on SQLite."""
+    return _sqlite_write_lock if connection.vendor == 'sqlite' else threading.Lock()
+
+
+class ToolTimings:
+    """Start and end times of a run's tool calls: their total time against the wall clock they took."""
+
+    def __init__(self):
+        self._calls = []  # (start, end) in time.perf_counter() seconds; appends are atomic
+
+    def add(self, start, end):
+        self._calls.append((start, end))
+
+    def stats(self):
+        calls = sorted(self._calls)
+        busy = sum(end - start for start, end in calls)
+        wall, reach = 0.0, None  # the length of the union of the call intervals
+        for start, end in calls:
+            if reach is None or start >= reach:
+                wall, reach = wall + end - start, end
+            elif end > reach:
+                wall, reach = wall + end - reach, end
+        busy_ms, wall_ms = round(busy * 1000, 1), round(wall * 1000, 1)
+        return {'calls': len(calls), 'busy_ms': busy_ms, 'wall_ms': wall_ms, 'saved_ms': round(busy_ms - wall_ms, 1)}
+
+
+class ChatLimiter:
+    poll_interval = 0.01
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.waiting = 0
+        self.per_user = Counter()
+
+    @property
+    def global_limit(self):
+        return getattr(settings, 'AGENT_CHAT_MAX_CONCURRENCY', 32)
+
+    @property
+    def per_user_limit(self):
+        return getattr(settings, 'AGENT_CHAT_MAX_CONCURRENCY_PER_USER', 2)
+
+    def _try_acquire(self, user_id, waiting):
+        with self._lock:
+            if self.per_user[user_id] >= self.per_user_limit:
+                raise ChatLimitExceeded(f'At most {self.per_user_limit} concurrent chats per user')
+            if self.in_flight >= self.global_limit:
+                if not waiting:
+                    if self.waiting >= getattr(settings, 'AGENT_CHAT_MAX_WAITING', 64):
+                        raise ChatLimitExceeded('Too many chats waiting', retry_after=5)
+                    self.waiting += 1
+                return False
+            if waiting:
+                self.waiting -= 1
+            self.in_flight += 1
+            self.per_user[user_id] += 1
+            return True
+
+    def release(self, user_id):
+        with self._lock:
+            self.in_flight -= 1
+            self.per_user[user_id] -= 1
+            if not self.per_user[user_id]:
+                del self.per_user[user_id]
+
+    async def acquire(self, user_id):
+        """Take one chat slot for ``user_id``, waiting in line if need be; give it back with ``release``."""
+        deadline = time.monotonic() + getattr(settings, 'AGENT_CHAT_QUEUE_TIMEOUT', 30)
+        waiting = False
+        try:
+            while not self._try_acquire(user_id, waiting):
+                waiting = True
+                if time.monotonic() >= deadline:
+                    raise ChatLimitExceeded('Too many chats in progress', retry_after=5)
+                await asyncio.sleep(self.poll_interval)
+        except BaseException:
+            if waiting:
+                with self._lock:
+                    self.waiting -= 1
+            raise
+
+    @asynccontextmanager
+    async def slot(self, user_id):
+        """Hold one chat slot for ``user_id`` for the duration of the block."""
+        await self.acquire(user_id)
+        try:
+            yield
+        finally:
+            self.release(user_id)
+
+
+chat_limiter = ChatLimiter()
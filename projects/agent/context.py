@@ -0,0 +1,207 @@
+"""
+Context snapshots: the compact view of the chat's selected object that goes into the prompt.
+
+``snapshot(user, context)`` returns a small, JSON-ready dict per object type, as laid out in
+Requirements.md (Context Injection Strategy):
+
+- ``task``     fields, project (id, title), owner and assignee emails, tag names, the latest
+               comments and llm_context
+- ``project``  fields, owner email, tag names, the latest tasks (id, title, status) the user
+               can see and llm_context
+- ``comment``  fields, author, its task (id, title, status) and llm_context
+
+Related rows are fetched with a fixed number of queries, texts are clipped, and the snapshot is
+trimmed to ``AGENT_CONTEXT_MAX_TOKENS`` (``estimate_tokens``). The output only depends on the
+data, so the same selection always gives the same prompt text.
+
+Snapshots are cached (Django's cache) under (type, id, version), the version being the
+``updated`` stamps of the object and of the rows it shows. A turn on an unchanged selection then
+costs one indexed query, which also checks that the user may see the object. Changes that don't
+touch any ``updated`` (e.g. renaming a tag) show up after ``AGENT_CONTEXT_CACHE_TIMEOUT``.
+"""
+import copy
+import hashlib
+import json
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Max, Q
+
+from .. import scoping
+from ..models import Comment, Project, Task
+
+LATEST_COMMENTS = 3
+LATEST_TASKS = 3
+TEXT_CHARS = 280
+SHORT_CHARS = 120
+SUMMARY_KEYS = ('last_action', 'source', 'summary_text')
+
+
+def dumps(value) -> str:
+    """Compact, key-sorted JSON: the form snapshots take in the prompt."""
+    return json.dumps(value, sort_keys=True, separators=(',', ':'), ensure_ascii=False, cls=DjangoJSONEncoder)
+
+
+def estimate_tokens(value) -> int:
+    """Rough token count of a string, or of a value's compact JSON (about 4 characters a token)."""
+    return math.ceil(len(value if isinstance(value, str) else dumps(value)) / 4)
+
+
+def clip(text, chars: int) -> str:
+    text = ' '.join(str(text or '').split())
+    return text if len(text) <= chars else text[:chars - 1].rstrip() + '…'
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+def _visible_comments(user):
+    qs = Comment.objects.all()
+    if scoping.is_unrestricted(user):
+        return qs
+    return qs.filter(Q(owner_id=user.id) | Q(task__in=scoping.visible_tasks(user).values('id')))
+
+
+# Versions: one query per turn, None when the object doesn't exist or the user may not see it.
+
+def _task_version(user, task_id):
+    qs = scoping.visible_tasks(user, Task.objects.filter(id=task_id))
+    return qs.annotate(comments=Max('comment__updated')).values_list('updated', 'project__updated', 'comments').first()
+
+
+def _project_version(user, project_id):
+    row = (Project.objects.filter(id=project_id).annotate(tasks=Max('task__updated'))
+           .values_list('owner_id', 'updated', 'tasks').first())
+    if row is None:
+        return None
+    owner_id, *version = row
+    # the task list depends on who is asking, unless they see every task of the project
+    viewer = 'all' if scoping.is_unrestricted(user) or user.id == owner_id else user.id
+    return (*version, viewer)
+
+
+def _comment_version(user, comment_id):
+    return _visible_comments(user).filter(id=comment_id).values_list('updated', 'task__updated').first()
+
+
+# Builders: the full snapshot, in a fixed number of queries.
+
+def _task_snapshot(user, task_id):
+    task = Task.objects.select_related('owner', 'project').get(id=task_id)
+    comments = (Comment.objects.select_related('owner').filter(task_id=task.id)
+                .order_by('-created', '-id')[:LATEST_COMMENTS])
+    return {
+        'type': 'task',
+        'id': task.id,
+        'title': task.title,
+        'description': clip(task.description, TEXT_CHARS),
+        'status': task.status,
+        'priority': task.priority,
+        'due_date': _iso(task.due_date),
+        'estimated_hours': float(task.estimated_hours) if task.estimated_hours is not None else None,
+        'depends_on_id': task.depends_on_id,
+        'project': {'id': task.project_id, 'title': task.project.title},
+        'owner': task.owner.email,
+        'assignees': list(task.assignees.order_by('email').values_list('email', flat=True)),
+        'tags': list(task.tags.order_by('name').values_list('name', flat=True)),
+        'comments': [{'id': c.id, 'title': c.title, 'author': c.owner.email, 'created': _iso(c.created),
+                      'text': clip(c.description, SHORT_CHARS)} for c in comments],
+        'llm_context': task.llm_context or {},
+    }
+
+
+def _project_snapshot(user, project_id):
+    project = Project.objects.select_related('owner').get(id=project_id)
+    tasks = (scoping.visible_tasks(user, Task.objects.filter(project_id=project.id))
+             .order_by('-updated', '-id').values('id', 'title', 'status')[:LATEST_TASKS])
+    return {
+        'type': 'project',
+        'id': project.id,
+        'title': project.title,
+        'description': clip(project.description, TEXT_CHARS),
+        'category': project.category,
+        'deadline': _iso(project.deadline),
+        'owner': project.owner.email,
+        'tags': list(project.tags.order_by('name').values_list('name', flat=True)),
+        'tasks': list(tasks),
+        'llm_context': project.llm_context or {},
+    }
+
+
+def _comment_snapshot(user, comment_id):
+    comment = Comment.objects.select_related('owner', 'task').get(id=comment_id)
+    return {
+        'type': 'comment',
+        'id': comment.id,
+        'title': comment.title,
+        'text': clip(comment.description, TEXT_CHARS),
+        'author': comment.owner.email,
+        'created': _iso(comment.created),
+        'task': {'id': comment.task_id, 'title': comment.task.title, 'status': comment.task.status},
+        'llm_context': comment.llm_context or {},
+    }
+
+
+SNAPSHOTS = {
+    'task': (_task_version, _task_snapshot),
+    'project': (_project_version, _project_snapshot),
+    'comment': (_comment_version, _comment_snapshot),
+}
+
+
+def _trims(snap):
+    """Make ``snap`` smaller one step at a time (a step per ``next``), least useful parts first."""
+    llm_context = snap.get('llm_context')
+    if llm_context:
+        snap['llm_context'] = {k: clip(llm_context[k], SHORT_CHARS) for k in SUMMARY_KEYS if k in llm_context}
+        yield
+    for related in ('comments', 'tasks'):
+        while snap.get(related):
+            snap[related].pop()  # the oldest
+            yield
+    for text in ('description', 'text'):
+        if snap.get(text):
+            snap[text] = clip(snap[text], 80)
+            yield
+    if 'llm_context' in snap:
+        del snap['llm_context']
+        yield
+
+
+def fit(snap, max_tokens: int) -> dict:
+    """A copy of ``snap`` trimmed until ``estimate_tokens`` fits ``max_tokens``, marked ``truncated`` if it was."""
+    snap = copy.deepcopy(snap)
+    trims = _trims(snap)
+    while estimate_tokens(snap) > max_tokens and next(trims, False) is None:
+        snap['truncated'] = True
+    return snap
+
+
+def snapshot(user, context) -> dict:
+    """The snapshot of the chat ``context`` ({"type", "id"}) for ``user``; see the module docstring."""
+    ctx_type = context.get('type') or 'none'
+    if ctx_type not in SNAPSHOTS:
+        return {'type': 'none'}
+    try:
+        ctx_id = int(context.get('id'))
+    except (TypeError, ValueError):
+        return {'type': 'none'}
+    version_of, build = SNAPSHOTS[ctx_type]
+    version = version_of(user, ctx_id)
+    if version is None:
+        return {'type': ctx_type, 'id': ctx_id, 'missing': True}
+
+    max_tokens = settings.AGENT_CONTEXT_MAX_TOKENS
+    digest = hashlib.md5(dumps([*version, max_tokens]).encode()).hexdigest()
+    key = f'chat-context:{ctx_type}:{ctx_id}:{digest}'
+    snap = cache.get(key)
+    if snap is None:
+        try:
+            snap = fit(build(user, ctx_id), max_tokens)
+        except (Task.DoesNotExist, Project.DoesNotExist, Comment.DoesNotExist):  # deleted since
+            return {'type': ctx_type, 'id': ctx_id, 'missing': True}
+        cache.set(key, snap, settings.AGENT_CONTEXT_CACHE_TIMEOUT)
+    return snap
@@ -0,0 +1,130 @@
+"""
+Compaction of the chat history that clients replay as ``previous_messages``.
+
+Clients send the conversation so far ({"role": "user" | "assistant", "content": str}; other
+entries such as tool notes are ignored) with every turn. Up to ``AGENT_HISTORY_MAX_TOKENS`` it is
+passed on as is. Past that, ``compact`` keeps the last ``AGENT_HISTORY_KEEP_MESSAGES`` messages
+verbatim and folds the older ones into a rolling summary: one clipped line per message, the
+newest lines kept within ``AGENT_HISTORY_SUMMARY_TOKENS``. The summary is extractive, so compaction
+costs no extra model round trip.
+
+Summaries are kept per chat session in Django's cache along with a digest of the messages they
+cover, so each turn only folds the messages that left the verbatim window since the last one.
+With ``persist_summary`` the summary is also stored as ``chat_summary`` in the selected object's
+``llm_context``. ``History.meta()`` reports the prompt tokens saved (``estimate_tokens``).
+"""
+import hashlib
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from pydantic_ai.messages import ModelRequest, ModelResponse, SystemPromptPart, TextPart, UserPromptPart
+
+from ..models import Comment, Project, Task
+from .context import SHORT_CHARS, clip, dumps, estimate_tokens
+from .tools.utils import can_write
+
+ROLES = ('user', 'assistant')
+CONTEXT_MODELS = {'task': Task, 'project': Project, 'comment': Comment}
+
+
+def turns(previous_messages) -> list:
+    """The (role, content) pairs of the user and assistant messages in ``previous_messages``."""
+    return [(m['role'], m['content']) for m in previous_messages or []
+            if isinstance(m, dict) and m.get('role') in ROLES and m.get('type') != 'tool'
+            and isinstance(m.get('content'), str) and m['content']]
+
+
+def _tokens(pairs) -> int:
+    return sum(estimate_tokens(f'{role}: {content}') for role, content in pairs)
+
+
+def _digest(pairs) -> str:
+    return hashlib.sha1(dumps(pairs).encode()).hexdigest()
+
+
+def _fold(lines, pairs) -> list:
+    """``lines`` with a line per message of ``pairs`` added, the oldest dropped to fit the summary budget."""
+    lines = lines + [f'{role}: {clip(content, SHORT_CHARS)}' for role, content in pairs]
+    budget, kept = settings.AGENT_HISTORY_SUMMARY_TOKENS, []
+    for line in reversed(lines):
+        budget -= estimate_tokens(line)
+        if budget < 0:
+            break
+        kept.append(line)
+    return kept[::-1]
+
+
+@dataclass
+class History:
+    """The history to run with: the summary of the folded messages and the ones kept verbatim."""
+    summary: str = ''
+    recent: list = field(default_factory=list)
+    summarized: int = 0  # messages folded into the summary
+    tokens_before: int = 0
+
+    @property
+    def tokens(self) -> int:
+        return (estimate_tokens(self.summary) if self.summary else 0) + _tokens(self.recent)
+
+    def messages(self, system_prompt: str) -> list:
+        """``message_history`` for ``Agent.run``. The agent only adds its system prompt to an empty
+        history, so it is repeated here."""
+        if not self.summary and not self.recent:
+            return []
+        parts = [SystemPromptPart(system_prompt)]
+        if self.summary:
+            parts.append(UserPromptPart(f'Summary of the earlier conversation:\n{self.summary}'))
+        messages = [ModelRequest(parts=parts)]
+        for role, content in self.recent:
+            messages.append(ModelRequest(parts=[UserPromptPart(content)]) if role == 'user'
+                            else ModelResponse(parts=[TextPart(content)]))
+        return messages
+
+    def meta(self) -> dict:
+        return {
+            'messages': self.summarized + len(self.recent),
+            'summarized': self.summarized,
+            'tokens': self.tokens,
+            'tokens_saved': self.tokens_before - self.tokens,
+        }
+
+
+def compact(previous_messages, session_key: str) -> History:
+    """Compact ``previous_messages`` (see the module docstring), continuing the session's rolling summary."""
+    pairs = turns(previous_messages)
+    before = _tokens(pairs)
+    folded = len(pairs) - settings.AGENT_HISTORY_KEEP_MESSAGES
+    if before <= settings.AGENT_HISTORY_MAX_TOKENS or folded <= 0:
+        return History(recent=pairs, tokens_before=before)
+
+    key = f'chat-history:{session_key}'
+    state = cache.get(key)
+    if state and state['count'] <= folded and state['digest'] == _digest(pairs[:state['count']]):
+        lines = _fold(state['lines'], pairs[state['count']:folded])
+    else:  # a new or different conversation
+        lines = _fold([], pairs[:folded])
+    cache.set(key, {'count': folded, 'digest': _digest(pairs[:folded]), 'lines': lines},
+              settings.AGENT_HISTORY_CACHE_TIMEOUT)
+    summary = '\n'.join(lines)
+    if len(lines) < folded:
+        summary = f'({folded - len(lines)} earlier messages omitted)\n{summary}'
+    return History(summary=summary, recent=pairs[folded:], summarized=folded, tokens_before=before)
+
+
+def persist_summary(user, context, summary: str) -> bool:
+    """Store ``summary`` as ``chat_summary`` in the ``llm_context`` of the chat's context object,
+    when there is one the user may write. Returns whether it was written."""
+    model = CONTEXT_MODELS.get(context.get('type'))
+    if model is None or not summary or not str(context.get('id', '')).isdigit():
+        return False
+    obj = model.objects.filter(id=int(context['id'])).first()
+    if obj is None or not can_write(user, obj.owner_id):
+        return False
+    llm_context = obj.llm_context or {}
+    if llm_context.get('chat_summary') == summary:
+        return False
+    obj.llm_context = {**llm_context, 'chat_summary': summary, 'timestamp': timezone.now().isoformat()}
+    obj.save(update_fields=['llm_context', 'updated'])
+    return True
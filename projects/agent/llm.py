@@ -0,0 +1,186 @@
+"""
+The language model behind the agents, chosen by ``settings.AGENT_MODEL``:
+
+- ``grok``      the Grok API (``XAI_API_KEY``), the default
+- ``test``      pydantic-ai's ``TestModel``, calling the list/search tools with generated arguments
+- ``scripted``  ``ScriptedModel``, an offline replay of the tool-call sequences in ``SCRIPTS``
+
+The offline models need no network or API key (``AGENT_MODEL=scripted python manage.py runserver``),
+which makes the non-LLM cost of a chat turn measurable (see ``manage.py bench_agent_chat``).
+``AGENT_STUB_LATENCY`` adds a fixed delay per model request to stand in for the LLM.
+
+``build_model`` wraps the model in ``MeteredModel``, which records request latency and tokens
+(``projects.metrics``).
+"""
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+from pydantic_ai.messages import (
+    ModelRequest, ModelResponse, TextPart, ToolCallPart, ToolReturnPart, UserPromptPart,
+)
+from pydantic_ai.models.function import DeltaToolCall, FunctionModel
+from pydantic_ai.models.test import TestModel
+from pydantic_ai.models.wrapper import WrapperModel
+
+from .. import metrics
+
+READ_TOOLS = ['list_tasks', 'search_tasks', 'list_projects', 'list_tags']
+
+
+def _on_first(tool, make_args):
+    """Args for a call about the first item ``tool`` returned, or None when it returned nothing."""
+    def args(returns):
+        items = returns.get(tool) or []
+        return make_args(items[0]) if items else None
+    return args
+
+
+# Scripts: the n-th model request of a run answers with step n. A step is a list of (tool, args)
+# calls made together; the last step is a callable returning the final output. Args may be
+# callables of ``returns`` (tool name -> latest return value); a call whose args are None is skipped.
+SCRIPTS = {
+    'summary': [
+        [('list_projects', {}), ('list_tasks', {})],
+        [('list_comments', _on_first('list_tasks', lambda t: {'task_id': t.id, 'owned_only': False}))],
+        lambda r: {'message': f"You have {len(r.get('list_tasks', []))} tasks "
+                              f"across {len(r.get('list_projects', []))} projects."},
+    ],
+    'search': [
+        [('search_tasks', {'query': 'soil', 'limit': 10})],
+        [('get_task', _on_first('search_tasks', lambda t: {'task_id': t.id}))],
+        lambda r: {'tasks': [{'id': t.id, 'title': t.title} for t in r.get('search_tasks', [])]},
+    ],
+    'triage': [
+        [('list_tasks', {'owned_only': True})],
+        [('update_task', _on_first('list_tasks', lambda t: {'task_id': t.id, 'status': 'IN_PROGRESS'}))],
+        [('create_comment', _on_first('list_tasks', lambda t: {'task_id': t.id, 'title': 'Triage',
+                                                               'description': 'Picked up.'}))],
+        lambda r: {'message': 'Moved your first task to IN_PROGRESS and left a note.'},
+    ],
+}
+DEFAULT_SCRIPT = 'summary'
+
+
+def _chunks(text):
+    words = text.split(' ')
+    return words[:1] + [' ' + word for word in words[1:]]
+
+
+class ScriptedModel(FunctionModel):
+    """
+    Replays ``scripts`` (``SCRIPTS``): the first script whose name occurs in the latest user prompt
+    (else ``DEFAULT_SCRIPT``, or the first script). Tool calls are real, so tools, permissions and
+    queries run as in production. ``requests`` counts the model requests, ``peak`` the most that
+    waited out ``latency`` at once and ``last_messages`` are those the latest request was sent.
+    """
+
+    def __init__(self, scripts=None, latency=None):
+        self.scripts = scripts or SCRIPTS
+        self.latency = getattr(settings, 'AGENT_STUB_LATENCY', 0) if latency is None else latency
+        self.requests = self.in_flight = self.peak = 0
+        self.last_messages = []
+        super().__init__(self.respond, stream_function=self.respond_stream, model_name='scripted')
+
+    async def _wait(self, messages):
+        """Record the request and stand in for the LLM's latency."""
+        self.requests += 1
+        self.last_messages = messages
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight -= 1
+
+    def _current_run(self, messages):
+        """The latest user prompt, the number of model responses since it and the tool returns."""
+        start = max((i for i, m in enumerate(messages)
+                     if isinstance(m, ModelRequest) and any(isinstance(p, UserPromptPart) for p in m.parts)),
+                    default=0)
+        run = messages[start:]
+        prompt = next((p.content for p in messages[start].parts if isinstance(p, UserPromptPart)), '')
+        returns = {p.tool_name: p.content for m in run for p in m.parts if isinstance(p, ToolReturnPart)}
+        return str(prompt), sum(1 for m in run if isinstance(m, ModelResponse)), returns
+
+    def _step(self, messages, info):
+        """The tool calls (name, args) to make, or None and the final output."""
+        prompt, step, returns = self._current_run(messages)
+        script = next((steps for name, steps in self.scripts.items() if name in prompt),
+                      self.scripts.get(DEFAULT_SCRIPT) or next(iter(self.scripts.values())))
+        while step < len(script) - 1:
+            calls = [(tool, args(returns) if callable(args) else args) for tool, args in script[step]]
+            calls = [(tool, args) for tool, args in calls if args is not None]
+            if calls:
+                return calls, None
+            step = len(script) - 1  # nothing to act on: answer straight away
+        output = script[-1](returns)
+        if info.output_tools:
+            tool = info.output_tools[0]
+            if tool.outer_typed_dict_key:
+                output = {tool.outer_typed_dict_key: output}
+            return [(tool.name, output)], output
+        return None, output
+
+    async def respond(self, messages, info):
+        await self._wait(messages)
+        calls, output = self._step(messages, info)
+        if calls is None:
+            return ModelResponse(parts=[TextPart(json.dumps(output))])
+        return ModelResponse(parts=[ToolCallPart(tool, args) for tool, args in calls])
+
+    async def respond_stream(self, messages, info):
+        await self._wait(messages)
+        calls, output = self._step(messages, info)
+        if calls is None:
+            for chunk in _chunks(json.dumps(output)):
+                yield chunk
+            return
+        for index, (tool, args) in enumerate(calls):
+            if output is None:
+                yield {index: DeltaToolCall(name=tool, json_args=json.dumps(args))}
+            else:
+                # the final answer arrives word by word, like tokens from an LLM
+                chunks = _chunks(json.dumps(args))
+                yield {index: DeltaToolCall(name=tool, json_args=chunks[0])}
+                for chunk in chunks[1:]:
+                    yield {index: DeltaToolCall(json_args=chunk)}
+
+
+class MeteredModel(WrapperModel):
+    """Records each request's latency and prompt / completion tokens per model name."""
+
+    def _record(self, started, usage):
+        name = self.model_name
+        metrics.LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, model=name)
+        metrics.LLM_PROMPT_TOKENS.inc(usage.input_tokens or 0, model=name)
+        metrics.LLM_COMPLETION_TOKENS.inc(usage.output_tokens or 0, model=name)
+
+    async def request(self, *args, **kwargs):
+        started = time.perf_counter()
+        response = await super().request(*args, **kwargs)
+        self._record(started, response.usage)
+        return response
+
+    @asynccontextmanager
+    async def request_stream(self, *args, **kwargs):
+        started = time.perf_counter()
+        async with super().request_stream(*args, **kwargs) as stream:
+            yield stream
+        self._record(started, stream.usage())
+
+
+def build_model(name=None):
+    name = name or getattr(settings, 'AGENT_MODEL', 'grok')
+    if name == 'scripted':
+        return MeteredModel(ScriptedModel())
+    if name == 'test':
+        return MeteredModel(TestModel(call_tools=READ_TOOLS))
+    if name == 'grok':
+        from pydantic_ai.models.openai import OpenAIChatModel
+        from pydantic_ai.providers.grok import GrokProvider
+        return MeteredModel(OpenAIChatModel('grok-code-fast-1', provider=GrokProvider(api_key=settings.XAI_API_KEY)))
+    raise ValueError(f"Unknown AGENT_MODEL {name!r}; expected 'grok', 'test' or 'scripted'")
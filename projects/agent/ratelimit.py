@@ -0,0 +1,128 @@
+"""
+Token-bucket rate limits for agent chats, shared by all worker processes.
+
+Each scope, the chat's user (``user:<id>``) and ``global``, has two buckets: chat requests and
+estimated prompt tokens (``projects.agent.context.estimate_tokens``). A bucket holds up to a
+minute's allowance and refills continuously:
+
+- ``AGENT_RATE_USER_REQUESTS`` / ``AGENT_RATE_USER_TOKENS``      per user and minute
+- ``AGENT_RATE_GLOBAL_REQUESTS`` / ``AGENT_RATE_GLOBAL_TOKENS``  for everyone together
+
+(0 turns a bucket off). ``take`` draws one request and the prompt's tokens from all buckets or
+from none: one conditional UPDATE per scope on ``RateBucket`` rows in one transaction, so the
+levels are shared through the database and no two processes can spend the same tokens.
+
+``admit`` waits for the buckets to refill when that takes at most ``AGENT_RATE_MAX_WAIT``
+seconds and fewer than ``AGENT_RATE_MAX_WAITING`` chats of this process already wait;
+otherwise it rejects at once with ``ChatLimitExceeded`` (429 + Retry-After in the views).
+"""
+import asyncio
+import math
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Least
+
+from ..models import RateBucket
+from .concurrency import ChatLimitExceeded
+
+# settings turning every bucket off, e.g. for benchmarks: override_settings(**UNLIMITED)
+UNLIMITED = dict(AGENT_RATE_USER_REQUESTS=0, AGENT_RATE_USER_TOKENS=0,
+                 AGENT_RATE_GLOBAL_REQUESTS=0, AGENT_RATE_GLOBAL_TOKENS=0)
+
+
+class Short(Exception):
+    """The buckets can't cover the chat for another ``wait`` seconds."""
+
+    def __init__(self, key, wait):
+        super().__init__(key, wait)
+        self.key, self.wait = key, wait
+
+
+def scopes(user_id):
+    """(key, requests per minute, tokens per minute) of the buckets a chat of ``user_id`` draws from."""
+    return [(f'user:{user_id}', settings.AGENT_RATE_USER_REQUESTS, settings.AGENT_RATE_USER_TOKENS),
+            ('global', settings.AGENT_RATE_GLOBAL_REQUESTS, settings.AGENT_RATE_GLOBAL_TOKENS)]
+
+
+def _level(field, per_minute, now):
+    """SQL for the bucket's level after refilling since ``updated``."""
+    return Least(Value(float(per_minute)), F(field) + (Value(now) - F('updated')) * Value(per_minute / 60))
+
+
+def _take_one(key, per_minute_requests, per_minute_tokens, tokens, now):
+    changes, conditions = {}, {}
+    for field, per_minute, cost in (('requests', per_minute_requests, 1), ('tokens', per_minute_tokens, tokens)):
+        if per_minute:
+            cost = min(cost, per_minute)  # a prompt bigger than the bucket takes all of it
+            changes[field] = _level(field, per_minute, now) - cost
+            conditions[field] = (per_minute, cost)
+    if not conditions:
+        return
+    changes['updated'] = now  # last: the levels refill from the old value
+    qs = RateBucket.objects.filter(key=key)
+    levels = qs.alias(**{f'{field}_level': _level(field, per_minute, now)
+                         for field, (per_minute, _) in conditions.items()})
+    if levels.filter(**{f'{field}_level__gte': cost for field, (_, cost) in conditions.items()}).update(**changes):
+        return
+    row = qs.values_list('requests', 'tokens', 'updated').first()
+    if row is None:  # first chat of the scope: a full bucket, then draw from it
+        RateBucket.objects.bulk_create([RateBucket(key=key, requests=per_minute_requests or 0,
+                                                   tokens=per_minute_tokens or 0, updated=now)],
+                                       ignore_conflicts=True)
+        return _take_one(key, per_minute_requests, per_minute_tokens, tokens, now)
+    levels, elapsed = dict(zip(('requests', 'tokens'), row[:2])), now - row[2]
+    wait = max((cost - min(per_minute, levels[field] + elapsed * per_minute / 60)) * 60 / per_minute
+               for field, (per_minute, cost) in conditions.items())
+    raise Short(key, max(wait, 0.001))
+
+
+def take(user_id, tokens):
+    """Draw one request and ``tokens`` from the user's and the global buckets, or raise ``Short`` (and draw nothing)."""
+    now = time.time()
+    with transaction.atomic():
+        for key, per_minute_requests, per_minute_tokens in scopes(user_id):
+            _take_one(key, per_minute_requests, per_minute_tokens, tokens, now)
+
+
+class Admission:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.waiting = 0
+
+    def _try_wait(self):
+        with self._lock:
+            if self.waiting >= settings.AGENT_RATE_MAX_WAITING:
+                return False
+            self.waiting += 1
+            return True
+
+    def _done_waiting(self):
+        with self._lock:
+            self.waiting -= 1
+
+    async def admit(self, user_id, tokens):
+        """Take the chat's share of the buckets, waiting briefly if need be; raises ``ChatLimitExceeded``."""
+        deadline = time.monotonic() + settings.AGENT_RATE_MAX_WAIT
+        waiting = False
+        try:
+            while True:
+                try:
+                    return await sync_to_async(take)(user_id, tokens)
+                except Short as short:
+                    if time.monotonic() + short.wait > deadline or not (waiting or self._try_wait()):
+                        who = ' for this user' if short.key.startswith('user:') else ''
+                        raise ChatLimitExceeded(f'Too many chats{who}, rate limited',
+                                                retry_after=math.ceil(short.wait))
+                    waiting = True
+                    await asyncio.sleep(short.wait)
+        finally:
+            if waiting:
+                self._done_waiting()
+
+
+admission = Admission()
@@ -0,0 +1,196 @@
+"""
+Server-sent events for streamed agent runs (``/api/agent/chat/stream``).
+
+``chat_events`` runs the agent in a background task and yields SSE frames as the run
+progresses, so the first bytes reach the client as soon as the model starts answering:
+
+- ``hello``       ``{"user_id"}``, sent at once
+- ``token``       ``{"delta"}``, partial assistant text (model text, or the growing ``message``
+                  of the structured output while its JSON arrives)
+- ``tool_start``  ``{"id", "tool", "args"}``
+- ``tool_end``    ``{"id", "tool", "ok", "ms"}`` (plus ``error`` when the call is retried)
+- ``done``        ``{"output", "meta"}``: ``AgentDeps.meta()`` plus the tool timings (``tools``) and ``ms``
+- ``error``       ``{"detail"}``
+
+A chat is admitted by the rate limits and ``chat_limiter`` before the stream starts
+(``ChatSlot.take``), so a rejected one gets a plain 429 with Retry-After instead of a stream.
+
+A ``: keep-alive`` comment is sent whenever nothing else was for ``AGENT_STREAM_HEARTBEAT``
+seconds. Closing the generator (the client went away) cancels the agent run.
+"""
+import asyncio
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from pydantic_ai.messages import (
+    FinalResultEvent, FunctionToolCallEvent, FunctionToolResultEvent, PartDeltaEvent, PartStartEvent,
+    RetryPromptPart, TextPart, TextPartDelta, ToolCallPart, ToolCallPartDelta,
+)
+from pydantic_core import from_json
+from rest_framework.renderers import BaseRenderer
+
+from .. import metrics
+from .concurrency import chat_limiter
+from .ratelimit import admission
+
+logger = logging.getLogger(__name__)
+
+KEEP_ALIVE = ': keep-alive\n\n'
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Lets ``Accept: text/event-stream`` (EventSource) through content negotiation; errors render as an ``error`` event."""
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        event = 'error' if response is not None and response.status_code >= 400 else 'message'
+        return sse_event(event, data).encode(self.charset)
+
+
+def partial_message(args_json):
+    """The ``message`` text of a (possibly incomplete) output tool call, if there is one yet."""
+    try:
+        args = from_json(args_json, allow_partial='trailing-strings')
+    except ValueError:
+        return None
+    if isinstance(args, dict):
+        output = args.get('response', args)  # dict outputs are wrapped under 'response'
+        if isinstance(output, dict) and isinstance(output.get('message'), str):
+            return output['message']
+    return None
+
+
+def tool_args(part):
+    try:
+        return part.args_as_dict()
+    except ValueError:  # malformed JSON from the model; the tool call will be retried
+        return part.args
+
+
+class RunEvents:
+    """Translates the agent's stream events into SSE frames for one run."""
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.tools = []
+        self._started = {}
+
+    def emit(self, event, data):
+        self.queue.put_nowait(sse_event(event, data))
+
+    async def handle(self, ctx, events):
+        # called once per model request / tool-call step; part indexes restart with each response
+        buffers, output_index, sent = {}, None, ''  # part index -> [tool_call_id, args JSON so far]
+        async for event in events:
+            if isinstance(event, PartStartEvent):
+                if isinstance(event.part, TextPart) and event.part.content:
+                    self.emit('token', {'delta': event.part.content})
+                elif isinstance(event.part, ToolCallPart):
+                    args = event.part.args
+                    buffers[event.index] = [event.part.tool_call_id,
+                                            args if isinstance(args, str) else json.dumps(args or {})]
+            elif isinstance(event, PartDeltaEvent):
+                if isinstance(event.delta, TextPartDelta):
+                    self.emit('token', {'delta': event.delta.content_delta})
+                elif isinstance(event.delta, ToolCallPartDelta) and isinstance(event.delta.args_delta, str):
+                    if event.index in buffers:
+                        buffers[event.index][1] += event.delta.args_delta
+            elif isinstance(event, FinalResultEvent):
+                output_index = next((i for i, (call_id, _) in buffers.items()
+                                     if call_id == event.tool_call_id), None)
+            elif isinstance(event, FunctionToolCallEvent):
+                self._started[event.tool_call_id] = time.perf_counter()
+                self.emit('tool_start', {'id': event.tool_call_id, 'tool': event.part.tool_name,
+                                         'args': tool_args(event.part)})
+            elif isinstance(event, FunctionToolResultEvent):
+                started = self._started.pop(event.tool_call_id, time.perf_counter())
+                timing = {'id': event.tool_call_id, 'tool': event.result.tool_name,
+                          'ok': not isinstance(event.result, RetryPromptPart),
+                          'ms': round((time.perf_counter() - started) * 1000, 1)}
+                if not timing['ok']:
+                    timing['error'] = event.result.model_response()
+                self.tools.append(timing)
+                self.emit('tool_end', timing)
+
+            if output_index in buffers:
+                message = partial_message(buffers[output_index][1])
+                if message and message.startswith(sent) and len(message) > len(sent):
+                    self.emit('token', {'delta': message[len(sent):]})
+                    sent = message
+
+
+class ChatSlot:
+    """A streamed chat admitted by the rate limits, holding a ``chat_limiter`` slot until ``release()``."""
+
+    def __init__(self, user_id):
+        self.user_id, self.released = user_id, False
+
+    @classmethod
+    async def take(cls, user_id, prompt_tokens=0):
+        """Admit a chat of ``prompt_tokens`` (``projects.agent.ratelimit``), then take a chat slot;
+        raises ``ChatLimitExceeded`` when the chat may not run now."""
+        await admission.admit(user_id, prompt_tokens)
+        await chat_limiter.acquire(user_id)
+        return cls(user_id)
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            chat_limiter.release(self.user_id)
+
+
+async def chat_events(agent, prompt, deps, message_history=None, slot=None):
+    """Async generator of SSE frames for one agent run on behalf of ``deps.user``; releases the
+    run's ``slot`` (``ChatSlot.take``) when the stream ends."""
+    user_id = getattr(deps.user, 'id', None)
+    queue = asyncio.Queue()
+    events = RunEvents(queue)
+
+    async def run():
+        started = time.perf_counter()
+        try:
+            with metrics.observe_run('chat_stream'):
+                result = await agent.run(prompt, message_history=message_history, deps=deps,
+                                         event_stream_handler=events.handle)
+            events.emit('done', {'output': result.output, 'meta': {
+                **deps.meta(),
+                'tools': events.tools,
+                'ms': round((time.perf_counter() - started) * 1000, 1),
+            }})
+        except Exception as exc:
+            logger.exception('Streamed agent run failed')
+            events.emit('error', {'detail': str(exc)})
+        finally:
+            queue.put_nowait(None)
+
+    task = None
+    heartbeat = getattr(settings, 'AGENT_STREAM_HEARTBEAT', 15)
+    try:
+        yield sse_event('hello', {'user_id': user_id})
+        task = asyncio.create_task(run())
+        while True:
+            try:
+                frame = await asyncio.wait_for(queue.get(), heartbeat)
+            except asyncio.TimeoutError:  # not the builtin TimeoutError before Python 3.11
+                yield KEEP_ALIVE
+                continue
+            if frame is None:
+                break
+            yield frame
+    finally:
+        # normal end, or the response was closed because the client disconnected
+        if task is not None:
+            task.cancel()
+            await asyncio.wait([task])
+        if slot is not None:
+            slot.release()
@@ -0,0 +1,170 @@
+"""
+Run-scoped memoization of the read tools.
+
+Within one agent run the model often asks for the same task, list or project again. Each
+run gets a ``ToolCache`` (``AgentDeps.tool_cache``); ``memoized`` serves repeated read calls
+(same tool, same payload) from it. Every entry records the rows it was read from, as
+``(model, id)`` for one row or ``(model, None)`` for a list/search over the model, and a write
+tool drops exactly the entries whose rows it may have changed:
+
+- ``update_*`` / ``delete_*`` of a row: entries for that row and lists over its model
+- ``create_*``: lists over the model only
+- ``bulk_*``: like the single-row tool, for every row of the model (``bulk_assign`` updates tasks)
+- deletes also touch the models they cascade to (project -> tasks, comments; task -> comments,
+  dependent tasks; tag -> the tag ids on tasks and projects)
+
+The same rules apply to the generic ``orm_action`` tool by its action type.
+"""
+import functools
+import inspect
+import json
+import threading
+
+from pydantic import BaseModel
+
+from .generic import (ALLOWED_MODELS, CreateAction, DeleteAction, QueryAction, ReadAction, UpdateAction,
+                      serializer_plan)
+
+NEW = 'new'  # a created row: only lists over the model can change
+CASCADES = {
+    'project': ('task', 'comment'),
+    'task': ('task', 'comment'),
+    'tag': ('task', 'project'),
+}
+SEARCH_READS = {('task', None), ('project', None), ('tag', None), ('comment', None)}
+BULK_WRITES = {
+    'bulk_create_tasks': {('task', NEW)},
+    'bulk_update_tasks': {('task', None)},
+    'bulk_assign': {('task', None)},
+    'bulk_create_comments': {('comment', NEW)},
+}
+
+
+def _model(noun):
+    return noun[:-1] if noun.endswith('s') else noun
+
+
+def read_rows(tool_name, payload):
+    """The rows a read tool call depends on, or None when the tool is not a read."""
+    if tool_name == 'search_tasks':
+        return SEARCH_READS
+    if tool_name == 'orm_action':
+        if isinstance(payload, ReadAction):
+            model = payload.model_name.lower()
+            # reads list the ids of the rows pointing at the instance too (SerializerPlan.reverse)
+            related = serializer_plan(ALLOWED_MODELS[model]).reverse_models if model in ALLOWED_MODELS else ()
+            return {(model, payload.id)} | {(name, None) for name in related}
+        if isinstance(payload, QueryAction):
+            return {(payload.model_name.lower(), None)}
+        return None
+    verb, _, noun = tool_name.partition('_')
+    model = _model(noun)
+    if verb == 'get':
+        return {(model, getattr(payload, f'{model}_id'))}
+    if verb == 'list':
+        return {(model, None)}
+    return None
+
+
+def written_rows(tool_name, payload):
+    """The rows a write tool call may change (see the module docstring)."""
+    if tool_name in BULK_WRITES:
+        return BULK_WRITES[tool_name]
+    if tool_name == 'orm_action':
+        model = payload.model_name.lower()
+        if isinstance(payload, CreateAction):
+            verb, row_id = 'create', None
+        elif isinstance(payload, (UpdateAction, DeleteAction)):
+            verb, row_id = ('update' if isinstance(payload, UpdateAction) else 'delete'), payload.id
+        else:
+            return set()
+    else:
+        verb, _, noun = tool_name.partition('_')
+        model = _model(noun)
+        row_id = getattr(payload, f'{model}_id', None)
+    if verb == 'create':
+        return {(model, NEW)}
+    if verb == 'update':
+        return {(model, row_id)}
+    if verb == 'delete':
+        return {(model, row_id)} | {(cascade, None) for cascade in CASCADES.get(model, ())}
+    return set()
+
+
+def _affects(written, read):
+    (w_model, w_id), (r_model, r_id) = written, read
+    return w_model == r_model and (r_id is None or w_id is None or w_id == r_id)
+
+
+def cache_key(tool_name, arguments):
+    args = {name: value.model_dump(mode='json') if isinstance(value, BaseModel) else value
+            for name, value in arguments.items()}
+    return f'{tool_name}:{json.dumps(args, sort_keys=True, default=str)}'
+
+
+class ToolCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> (rows, value)
+        self._generation = 0  # bumped by every write, so reads racing a write aren't stored
+        self.hits = self.misses = self.invalidated = 0
+
+    def get(self, key):
+        """(hit, value, generation) for ``key``."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                return True, entry[1], self._generation
+            self.misses += 1
+            return False, None, self._generation
+
+    def put(self, key, rows, value, generation):
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = (rows, value)
+
+    def invalidate(self, written):
+        with self._lock:
+            self._generation += 1
+            stale = [key for key, (rows, _) in self._entries.items()
+                     if any(_affects(w, r) for w in written for r in rows)]
+            for key in stale:
+                del self._entries[key]
+            self.invalidated += len(stale)
+
+    @property
+    def writes(self):
+        """Write tool calls of the run so far, failed ones included."""
+        return self._generation
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'invalidated': self.invalidated}
+
+
+def memoized(func):
+    """Serve repeated read calls of the tool from ``ctx.deps.tool_cache``; invalidate it on writes."""
+    signature = inspect.signature(func)
+    tool_name = func.__name__
+
+    @functools.wraps(func)
+    def tool(ctx, *args, **kwargs):
+        arguments = dict(signature.bind(ctx, *args, **kwargs).arguments)
+        del arguments[next(iter(signature.parameters))]  # the RunContext
+        payload = next(iter(arguments.values()), None)
+        cache = ctx.deps.tool_cache
+        rows = read_rows(tool_name, payload)
+        if rows is None:
+            try:
+                return func(ctx, *args, **kwargs)
+            finally:  # also after a failure, which may have written part of its change
+                cache.invalidate(written_rows(tool_name, payload))
+
+        key = cache_key(tool_name, arguments)
+        hit, value, generation = cache.get(key)
+        if hit:
+            return value
+        value = func(ctx, *args, **kwargs)
+        cache.put(key, rows, value, generation)
+        return value
+    return tool
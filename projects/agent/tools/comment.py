@@ -1,10 +1,12 @@
 from typing import List, Optional, Dict, Any
 from django.db import transaction
 from django.utils import timezone
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
+from ... import scoping
 from ...models import Comment, Task
-from .utils import can_write
+from ...signals import tasks_changed
+from .utils import NOT_APPLIED, can_write, existing_ids
 
 
 class CommentOut(BaseModel):
@@ -45,6 +47,24 @@ class DeleteCommentIn(BaseModel):
     comment_id: int
 
 
+class BulkCreateCommentsIn(BaseModel):
+    comments: List[CreateCommentIn]
+    all_or_nothing: bool = Field(default=False, description="Create nothing if any item fails.")
+
+
+class BulkCommentResult(BaseModel):
+    index: int
+    ok: bool
+    comment: Optional[CommentOut] = None
+    error: Optional[str] = None
+
+
+class BulkCommentsOut(BaseModel):
+    applied: int
+    failed: int
+    results: List[BulkCommentResult]
+
+
 def serialize_comment(c: Comment) -> CommentOut:
     return CommentOut(
         id=c.id,
@@ -61,9 +81,8 @@ def serialize_comment(c: Comment) -> CommentOut:
 @transaction.atomic
 def tool_create_comment(user, payload: CreateCommentIn) -> CommentOut:
     task = Task.objects.get(id=payload.task_id)
-    if not getattr(user, 'is_staff', False):
-        if task.owner_id != getattr(user, 'id', None) and not task.assignees.filter(id=user.id).exists():
-            raise PermissionError("Not allowed to comment on this task")
+    if not scoping.can_view_task(user, task):
+        raise PermissionError("Not allowed to comment on this task")
 
     llm_context = {
         "source": "agent",
@@ -91,9 +110,7 @@ def tool_get_comment(user, payload: GetCommentIn) -> CommentOut:
 
 
 def tool_list_comments(user, payload: ListCommentsIn) -> List[CommentOut]:
-    qs = Comment.objects.all().order_by('id')
-    if not getattr(user, 'is_staff', False):
-        qs = qs.filter(owner=user)
+    qs = scoping.owned(user, Comment.objects.order_by('id'))
     if payload.task_id:
         qs = qs.filter(task_id=payload.task_id)
     return [serialize_comment(c) for c in qs]
@@ -129,3 +146,44 @@ def tool_delete_comment(user, payload: DeleteCommentIn) -> Dict[str, Any]:
         raise PermissionError("Not allowed to delete this comment")
     c.delete()
     return {"deleted": True, "comment_id": payload.comment_id}
+
+
+@transaction.atomic
+def tool_bulk_create_comments(user, payload: BulkCreateCommentsIn) -> BulkCommentsOut:
+    """Create several comments with one insert; the failed items are reported per item (see task bulk tools)."""
+    items = payload.comments
+    task_ids = {i.task_id for i in items}
+    existing = existing_ids(Task.objects, task_ids)
+    visible = existing_ids(scoping.visible_tasks(user), existing)
+    errors = {}
+    for index, item in enumerate(items):
+        if item.task_id not in existing:
+            errors[index] = f"Task {item.task_id} does not exist"
+        elif item.task_id not in visible:
+            errors[index] = "Not allowed to comment on this task"
+
+    created = {}
+    if not (errors and payload.all_or_nothing):
+        timestamp = timezone.now().isoformat()
+        created = {index: Comment(
+            title=item.title,
+            description=item.description,
+            owner=user,
+            task_id=item.task_id,
+            llm_context={
+                "source": "agent",
+                "last_action": "create",
+                "actor_user_id": getattr(user, 'id', None),
+                "actor_email": getattr(user, 'email', None),
+                "summary_text": item.llm_notes or f"Comment created on task {item.task_id}",
+                "timestamp": timestamp,
+            },
+        ) for index, item in enumerate(items) if index not in errors}
+        Comment.objects.bulk_create(created.values())
+        # bulk_create skips the comment signals; comments are part of the task search documents
+        tasks_changed({c.task_id for c in created.values()}, 'default')
+
+    results = [BulkCommentResult(index=i, ok=True, comment=serialize_comment(created[i])) if i in created
+               else BulkCommentResult(index=i, ok=False, error=errors.get(i, NOT_APPLIED))
+               for i in range(len(items))]
+    return BulkCommentsOut(applied=len(created), failed=len(items) - len(created), results=results)
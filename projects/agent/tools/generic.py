@@ -1,13 +1,22 @@
+import base64
+import functools
+import json
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal
 from typing import Dict, List, Any, Optional, Type, Union
 from pydantic import BaseModel, create_model, Field
+from django.core.exceptions import ValidationError
 from django.db import models, transaction
-from django.db.models import Q
+from django.db.models import Count, Sum
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 from django.apps import apps
 
+from ... import scoping
 from ...models import Project, Task, Tag, Comment
-from .utils import can_write
+from ...pagination import KeysetPagination
+from .utils import can_write, m2m_id_map
 
 User = get_user_model()
 
@@ -41,15 +50,42 @@ class DeleteAction(ModelAction):
     """Generic delete action for any model"""
     id: int
     
+# Fields a query may return, sort or group by, per model (filters are not restricted)
+QUERY_FIELDS = {
+    'project': ['id', 'title', 'description', 'owner_id', 'deadline', 'category', 'created', 'updated'],
+    'task': ['id', 'title', 'description', 'owner_id', 'project_id', 'depends_on_id', 'priority', 'status',
+             'due_date', 'estimated_hours', 'created', 'updated'],
+    'tag': ['id', 'name', 'color'],
+    'comment': ['id', 'title', 'description', 'owner_id', 'task_id', 'created', 'updated'],
+    'user': ['id', 'email', 'first_name', 'last_name'],
+}
+# Fields a query may sum, per model
+SUM_FIELDS = {
+    'task': ['estimated_hours'],
+}
+
 class QueryAction(ModelAction):
-    """Generic query action with filters"""
+    """Generic query action with filters: rows (whole, or only some fields), or aggregates over them"""
     filters: Optional[Dict[str, Any]] = None
     limit: Optional[int] = 100
+    fields: Optional[List[str]] = Field(default=None, description="Return only these fields of each row.")
+    order_by: Optional[List[str]] = Field(default=None, description="Fields to sort by, '-' first for descending.")
+    offset: Optional[int] = Field(default=None, description="Skip this many rows.")
+    cursor: Optional[str] = Field(
+        default=None, description="Page through rows: '' for the first page, then the next_cursor of the previous "
+                                  "one. The result is then {\"rows\": [...], \"next_cursor\": str or null}.")
+    aggregate: Optional[List[str]] = Field(
+        default=None, description="Return aggregates instead of rows: 'count', 'sum:estimated_hours' (tasks); "
+                                  "one row per combination of the group_by fields.")
+    group_by: Optional[List[str]] = None
 
-def get_model_fields(model_class: Type[models.Model]) -> Dict[str, Any]:
-    """
-    Inspect model fields and return a dictionary of field names and their types.
-    """
+# Columns never serialized, per model
+HIDDEN_FIELDS = {
+    'user': {'password'},
+}
+
+
+def _field_types(model_class: Type[models.Model]) -> Dict[str, Any]:
     field_info = {}
     for field in model_class._meta.get_fields():
         if field.is_relation:
@@ -79,37 +115,240 @@ def get_model_fields(model_class: Type[models.Model]) -> Dict[str, Any]:
             
     return field_info
 
-def serialize_instance(instance: models.Model) -> Dict[str, Any]:
+
+def _isoformat(value):
+    return value.isoformat()
+
+
+def _llm_context(value):
+    return value or {}
+
+
+def _converter(field: models.Field):
+    """The function turning the field's values into JSON-friendly ones, or None when they already are."""
+    if field.name == 'llm_context':
+        return _llm_context
+    if isinstance(field, (models.DateField, models.TimeField)):  # DateTimeField included
+        return _isoformat
+    if isinstance(field, models.DecimalField):
+        return float
+    return None
+
+
+class SerializerPlan:
+    """
+    How to serialize instances of one model, worked out once from ``_meta`` (see ``serializer_plan``):
+
+    - ``columns``: (key, attname, converter) per concrete field; foreign keys as ``<name>_id``
+    - ``m2m``: (key, field name) per many-to-many field, loaded as ``<name>_ids`` with one
+      through-table query per field for a whole batch (``m2m_id_map``)
+    - ``reverse``: (key, related model, lookup) per relation of another allowed model pointing at
+      this one (a task's comments, the tasks depending on it, a tag's tasks and projects, ...),
+      loaded as ``<accessor>_ids`` with one query per relation, restricted to the rows the user
+      may see. Only reads (``serialize_instance(instance, user)``) include them.
+    """
+
+    def __init__(self, model_class: Type[models.Model], model_name: str):
+        self.model = model_class
+        hidden = HIDDEN_FIELDS.get(model_name, set())
+        allowed = {model: name for name, model in ALLOWED_MODELS.items()}
+        self.columns, self.m2m, self.reverse = [], [], []
+        for field in model_class._meta.get_fields():
+            if field.name in hidden:
+                continue
+            if field.auto_created and not field.concrete:
+                if (field.one_to_many or field.many_to_many) and field.related_model in allowed:
+                    key = f"{field.get_accessor_name().removesuffix('_set')}_ids"
+                    self.reverse.append((key, field.related_model, field.field.name))
+            elif field.many_to_many:
+                self.m2m.append((f"{field.name}_ids", field.name))
+            elif field.many_to_one:
+                self.columns.append((f"{field.name}_id", field.attname, None))
+            elif field.concrete:
+                self.columns.append((field.name, field.attname, _converter(field)))
+        # the allowed models whose rows the reverse ids come from (for the tool cache)
+        self.reverse_models = {allowed[related] for _, related, _ in self.reverse}
+        self.field_types = _field_types(model_class)
+
+    @functools.cached_property
+    def schema(self) -> Type[BaseModel]:
+        """A pydantic model of the instance data a create or update may set (from ``get_model_fields``)."""
+        return create_model(f'{self.model.__name__}Data', **self.field_types)
+
+    def load_related(self, ids: List[int], user=None) -> Dict[str, Dict[int, List[int]]]:
+        """{key: {instance id: [related ids]}} for the M2M fields, and the reverse relations given a ``user``."""
+        related = {key: m2m_id_map(self.model, name, ids) for key, name in self.m2m}
+        if user is not None:
+            for key, related_model, lookup in self.reverse:
+                rows = scoping.scope(user, related_model.objects.filter(**{f'{lookup}__in': ids}))
+                loaded = related[key] = defaultdict(list)
+                for instance_id, related_id in rows.order_by(lookup, 'id').values_list(lookup, 'id'):
+                    loaded[instance_id].append(related_id)
+        return related
+
+    def row(self, instance: models.Model, related: Dict[str, Dict[int, List[int]]]) -> Dict[str, Any]:
+        data = {}
+        values = instance.__dict__
+        for key, attname, convert in self.columns:
+            value = values.get(attname)
+            if value is not None:
+                data[key] = convert(value) if convert else value
+        for key, ids in related.items():
+            data[key] = ids.get(instance.pk, [])
+        return data
+
+    def serialize(self, instances, user=None) -> List[Dict[str, Any]]:
+        instances = list(instances)
+        if not instances:
+            return []
+        related = self.load_related([instance.pk for instance in instances], user)
+        return [self.row(instance, related) for instance in instances]
+
+
+@functools.cache
+def serializer_plan(model_class: Type[models.Model]) -> SerializerPlan:
+    """The model's ``SerializerPlan``, compiled on first use and kept for the life of the process."""
+    names = [name for name, model in ALLOWED_MODELS.items() if model is model_class]
+    return SerializerPlan(model_class, names[0] if names else model_class._meta.model_name)
+
+
+def get_model_fields(model_class: Type[models.Model]) -> Dict[str, Any]:
+    """
+    Inspect model fields and return a dictionary of field names and their types.
+    """
+    return dict(serializer_plan(model_class).field_types)
+
+
+def model_schema(model_class: Type[models.Model]) -> Type[BaseModel]:
+    """The (cached) pydantic model of ``get_model_fields(model_class)``."""
+    return serializer_plan(model_class).schema
+
+
+def serialize_instances(instances, user=None) -> List[Dict[str, Any]]:
+    """
+    Convert a batch of model instances (all of the same model) to dictionaries.
+    Many-to-many ids are loaded with one through-table query per M2M field for the whole batch,
+    and with a ``user``, the ids of the reverse relations that user may see (see ``SerializerPlan``).
+    """
+    instances = list(instances)
+    if not instances:
+        return []
+    return serializer_plan(type(instances[0])).serialize(instances, user)
+
+
+def serialize_instance(instance: models.Model, user=None) -> Dict[str, Any]:
     """
     Convert a model instance to a dictionary representation.
     Handle relationships appropriately.
     """
-    data = {}
-    for field in instance._meta.get_fields():
-        if field.is_relation:
-            if field.many_to_many:
-                try:
-                    data[f"{field.name}_ids"] = list(getattr(instance, field.name).values_list('id', flat=True))
-                except AttributeError as e:
-                    data[f"{field.name}_ids"] = [str(e)]
+    return serialize_instances([instance], user)[0]
 
-            elif field.many_to_one:
-                related_id = getattr(instance, f"{field.name}_id", None)
-                if related_id:
-                    data[f"{field.name}_id"] = related_id
+def _plain(value):
+    """A JSON-friendly form of a column value."""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _query_fields(model_name: str, names: List[str], extra: List[str] = ()) -> List[str]:
+    """``names`` (without a '-' prefix) if all are in the model's ``QUERY_FIELDS`` or ``extra``."""
+    allowed = QUERY_FIELDS[model_name] + list(extra)
+    for name in names:
+        if name.lstrip('-') not in allowed:
+            raise ValueError(f"Can't query '{name.lstrip('-')}' of {model_name}; use one of: {', '.join(allowed)}")
+    return names
+
+
+def _aggregates(model_name: str, names: List[str]) -> Dict[str, Any]:
+    """Annotations for the ``aggregate`` names: 'count' and 'sum:<field>' (as key 'sum_<field>')."""
+    annotations = {}
+    for name in names:
+        function, _, field = name.partition(':')
+        if name == 'count':
+            annotations['count'] = Count('id')
+        elif function == 'sum' and field in SUM_FIELDS.get(model_name, ()):
+            annotations[f'sum_{field}'] = Sum(field)
         else:
-            value = getattr(instance, field.name, None)
-            if field.name == 'llm_context' and not value:
-                value = {}
-            if value is not None:
-                # Handle special types like datetime and Decimal
-                if hasattr(value, 'isoformat'):  # For DateTime fields
-                    value = value.isoformat()
-                elif hasattr(value, '__float__'):  # For Decimal fields
-                    value = float(value)
-                data[field.name] = value
-    
-    return data
+            sums = [f'sum:{field}' for field in SUM_FIELDS.get(model_name, ())]
+            raise ValueError(f"Can't aggregate '{name}' of {model_name}; use one of: {', '.join(['count', *sums])}")
+    return annotations
+
+
+def _aggregate_query(model_name: str, queryset, action: 'QueryAction') -> List[Dict[str, Any]]:
+    """One row of aggregates per group (one GROUP BY query), or a single row without ``group_by``."""
+    if action.cursor is not None:
+        raise ValueError("Aggregates can't be paged with a cursor; use offset and limit")
+    annotations = _aggregates(model_name, action.aggregate)
+    if not action.group_by:
+        return [{name: _plain(value) for name, value in queryset.aggregate(**annotations).items()}]
+    group_by = _query_fields(model_name, action.group_by)
+    order_by = _query_fields(model_name, action.order_by or group_by, extra=list(annotations))
+    rows = queryset.values(*group_by).annotate(**annotations).order_by(*order_by)
+    start = action.offset or 0
+    rows = rows[start:start + action.limit] if action.limit else rows[start:]
+    return [{name: _plain(value) for name, value in row.items()} for row in rows]
+
+
+# Cursors are opaque base64 JSON like KeysetPagination's: ordering, position value, tiebreaker id
+
+def _encode_cursor(keyset: KeysetPagination, value, pk) -> str:
+    if isinstance(value, (datetime, date)):
+        value = value.isoformat()
+    elif isinstance(value, Decimal):
+        value = str(value)
+    payload = json.dumps({'o': keyset.ordering, 'v': value, 'i': pk}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def _decode_cursor(keyset: KeysetPagination, cursor: str):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if payload['o'] != keyset.ordering or not isinstance(payload['i'], int):
+            raise ValueError('cursor does not match the ordering')
+        value = payload['v']
+        if value is not None and keyset.field != 'pk':
+            value = keyset.model._meta.get_field(keyset.field).to_python(value)
+        return value, payload['i']
+    except (TypeError, ValueError, KeyError, ValidationError):
+        raise ValueError("Invalid cursor; send the next_cursor of the previous page with the same order_by")
+
+
+def _row_query(model_name: str, queryset, action: 'QueryAction'):
+    """Rows (whole instances or ``fields`` dicts), sorted and paged; a ``{rows, next_cursor}`` page with a cursor."""
+    fields = _query_fields(model_name, action.fields) if action.fields else None
+    order_by = _query_fields(model_name, action.order_by) if action.order_by else None
+    keyset = None
+    if action.cursor is not None:
+        # keyset paging on the first sort field with the primary key as the tiebreaker, as in the API's cursor pagination
+        keyset = KeysetPagination()
+        keyset.field, keyset.descending = keyset.get_ordering(queryset.order_by(*(order_by or ['id'])[:1]))
+        keyset.ordering = f"{'-' if keyset.descending else ''}{keyset.field}"
+        queryset = queryset.order_by(*keyset.order_expressions(keyset.descending))
+        if action.cursor:
+            queryset = queryset.filter(keyset.position_filter(*_decode_cursor(keyset, action.cursor),
+                                                              keyset.descending))
+    elif order_by:
+        queryset = queryset.order_by(*order_by)
+    if fields:
+        # the cursor's position columns are read along and dropped again
+        queryset = queryset.values(*dict.fromkeys([*fields, *([keyset.field, 'pk'] if keyset else [])]))
+    start = action.offset or 0
+    rows = list(queryset[start:start + action.limit] if action.limit else queryset[start:])
+    if fields:
+        data = [{name: _plain(row[name]) for name in fields} for row in rows]
+    else:
+        data = serialize_instances(rows)
+    if keyset is None:
+        return data
+    next_cursor = None
+    if rows and action.limit and len(rows) == action.limit:
+        last = rows[-1]
+        value, pk = (last[keyset.field], last['pk']) if fields else (getattr(last, keyset.field), last.pk)
+        next_cursor = _encode_cursor(keyset, value, pk)
+    return {'rows': data, 'next_cursor': next_cursor}
+
 
 @transaction.atomic
 def tool_orm_action(user: User, action: Union[CreateAction, ReadAction, UpdateAction, DeleteAction, QueryAction]) -> Dict[str, Any]:
@@ -175,7 +414,7 @@ def tool_orm_action(user: User, action: Union[CreateAction, ReadAction, UpdateAc
         
         # Permission check
         if not getattr(user, 'is_staff', False):
-            if hasattr(instance, 'owner'):
+            if hasattr(instance, 'owner_id'):  # not 'owner', which would load the user
                 owner_id = getattr(instance, 'owner_id')
                 if owner_id != user.id:
                     # For tasks, also check if user is an assignee
@@ -184,7 +423,7 @@ def tool_orm_action(user: User, action: Union[CreateAction, ReadAction, UpdateAc
                     elif model_name != 'task':
                         raise PermissionError(f"Not allowed to view this {model_name}")
         
-        return serialize_instance(instance)
+        return serialize_instance(instance, user)
     
     # Handle UPDATE
     elif isinstance(action, UpdateAction):
@@ -250,16 +489,10 @@ def tool_orm_action(user: User, action: Union[CreateAction, ReadAction, UpdateAc
             queryset = queryset.filter(**action.filters)
             
         # Apply permission filters
-        if not getattr(user, 'is_staff', False) and hasattr(model_class, 'owner'):
-            queryset = queryset.filter(
-                Q(owner=user) | 
-                (Q(assignees=user) if hasattr(model_class, 'assignees') else Q())
-            ).distinct()
-            
-        # Apply limit
-        if action.limit:
-            queryset = queryset[:action.limit]
-            
-        return [serialize_instance(instance) for instance in queryset]
+        queryset = scoping.scope(user, queryset)
+
+        if action.aggregate:
+            return _aggregate_query(model_name, queryset, action)
+        return _row_query(model_name, queryset, action)
     
     return {"error": "Invalid action type"}
\ No newline at end of file
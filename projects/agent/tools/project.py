@@ -3,8 +3,9 @@ from django.db import transaction
 from django.utils import timezone
 from pydantic import BaseModel, Field
 
+from ... import scoping
 from ...models import Project
-from .utils import can_write
+from .utils import can_write, m2m_id_map
 
 
 class ProjectOut(BaseModel):
@@ -53,7 +54,7 @@ class DeleteProjectIn(BaseModel):
     project_id: int
 
 
-def serialize_project(p: Project) -> ProjectOut:
+def _project_out(p: Project, tag_ids: List[int]) -> ProjectOut:
     return ProjectOut(
         id=p.id,
         title=p.title,
@@ -64,10 +65,21 @@ def serialize_project(p: Project) -> ProjectOut:
         llm_context=p.llm_context or {},
         deadline=p.deadline.isoformat() if p.deadline else None,
         category=p.category or "",
-        tag_ids=list(p.tags.values_list('id', flat=True)),
+        tag_ids=tag_ids,
     )
 
 
+def serialize_projects(projects) -> List[ProjectOut]:
+    """Serialize a batch of projects with a single query for all their tag ids."""
+    projects = list(projects)
+    tags = m2m_id_map(Project, 'tags', [p.id for p in projects])
+    return [_project_out(p, tags.get(p.id, [])) for p in projects]
+
+
+def serialize_project(p: Project) -> ProjectOut:
+    return serialize_projects([p])[0]
+
+
 @transaction.atomic
 def tool_create_project(user, payload: CreateProjectIn) -> ProjectOut:
     owner_id = payload.owner_id
@@ -104,12 +116,10 @@ def tool_get_project(user, payload: GetProjectIn) -> ProjectOut:
 
 
 def tool_list_projects(user, payload: ListProjectsIn) -> List[ProjectOut]:
-    qs = Project.objects.all().order_by('id')
-    if not getattr(user, 'is_staff', False):
-        qs = qs.filter(owner=user)
+    qs = scoping.owned(user, Project.objects.all().order_by('id'))
     if payload.category:
         qs = qs.filter(category=payload.category)
-    return [serialize_project(p) for p in qs]
+    return serialize_projects(qs)
 
 
 @transaction.atomic
@@ -1,10 +1,16 @@
+from itertools import chain
 from typing import List, Optional, Dict, Any
+from django.contrib.auth import get_user_model
 from django.db import transaction
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from pydantic import BaseModel, Field
 
-from ...models import Task, Project
-from .utils import can_write
+from ... import readmodel, scoping, search
+from ...models import Task, Project, Tag, TaskRow
+from ... import versions
+from ...signals import tasks_changed
+from .utils import NOT_APPLIED, can_write, existing_ids, m2m_id_map, missing_ids_error
 
 
 class TaskOut(BaseModel):
@@ -65,24 +71,80 @@ class DeleteTaskIn(BaseModel):
     task_id: int
 
 
-def serialize_task(task: Task) -> TaskOut:
+class SearchTasksIn(BaseModel):
+    query: str = Field(description="Free-text search over task title/description, tags, project title and comments.")
+    limit: int = 20
+
+
+class BulkCreateTasksIn(BaseModel):
+    tasks: List[CreateTaskIn]
+    all_or_nothing: bool = Field(default=False, description="Create nothing if any item fails.")
+
+
+class BulkUpdateTasksIn(BaseModel):
+    updates: List[UpdateTaskIn]
+    all_or_nothing: bool = Field(default=False, description="Update nothing if any item fails.")
+
+
+class BulkAssignIn(BaseModel):
+    task_ids: List[int]
+    assignee_ids: List[int]
+    replace: bool = Field(default=False, description="Replace the current assignees instead of adding to them.")
+    all_or_nothing: bool = Field(default=False, description="Assign nothing if any task fails.")
+
+
+class BulkTaskResult(BaseModel):
+    index: int
+    ok: bool
+    task: Optional[TaskOut] = None
+    error: Optional[str] = None
+
+
+class BulkTasksOut(BaseModel):
+    applied: int
+    failed: int
+    results: List[BulkTaskResult]
+
+
+def _task_out(task: Task, assignee_ids: List[int], tag_ids: List[int]) -> TaskOut:
     return TaskOut(
         id=task.id,
         title=task.title,
         description=task.description,
         owner_id=task.owner_id,
         project_id=task.project_id,
-        assignee_ids=list(task.assignees.values_list('id', flat=True)),
+        assignee_ids=assignee_ids,
         depends_on_id=task.depends_on_id,
         priority=task.priority,
         status=task.status,
         due_date=task.due_date.isoformat() if task.due_date else None,
         estimated_hours=float(task.estimated_hours) if task.estimated_hours is not None else None,
-        tag_ids=list(task.tags.values_list('id', flat=True)),
+        tag_ids=tag_ids,
         llm_context=task.llm_context or {},
     )
 
 
+def serialize_tasks(tasks) -> List[TaskOut]:
+    """Serialize a batch of tasks with one query per M2M relation, regardless of batch size."""
+    tasks = list(tasks)
+    ids = [t.id for t in tasks]
+    assignees, tags = {}, {}
+    if readmodel.is_enabled():
+        # one single-table read instead of one query per through table
+        for task_id, assignee_ids, tag_ids in TaskRow.objects.filter(task_id__in=ids).values_list(
+                'task_id', 'assignee_ids', 'tag_ids'):
+            assignees[task_id], tags[task_id] = assignee_ids, tag_ids
+    missing = [i for i in ids if i not in assignees]
+    if missing:
+        assignees.update(m2m_id_map(Task, 'assignees', missing))
+        tags.update(m2m_id_map(Task, 'tags', missing))
+    return [_task_out(t, assignees.get(t.id, []), tags.get(t.id, [])) for t in tasks]
+
+
+def serialize_task(task: Task) -> TaskOut:
+    return serialize_tasks([task])[0]
+
+
 @transaction.atomic
 def tool_create_task(user, payload: CreateTaskIn) -> TaskOut:
     project = Project.objects.get(id=payload.project_id)
@@ -128,26 +190,28 @@ def tool_create_task(user, payload: CreateTaskIn) -> TaskOut:
 
 def tool_get_task(user, payload: GetTaskIn) -> TaskOut:
     task = Task.objects.get(id=payload.task_id)
-    if not getattr(user, 'is_staff', False):
-        if task.owner_id != getattr(user, 'id', None) and not task.assignees.filter(id=user.id).exists():
-            raise PermissionError("Not allowed to view this task")
+    if not scoping.can_view_task(user, task):
+        raise PermissionError("Not allowed to view this task")
     return serialize_task(task)
 
 
 def tool_list_tasks(user, payload: ListTasksIn) -> List[TaskOut]:
-    from django.db.models import Q
-    qs = Task.objects.all()
-    if not getattr(user, 'is_staff', False):
-        filt = Q(owner=user)
-        if payload.include_assigned:
-            filt |= Q(assignees=user)
-        qs = qs.filter(filt).distinct()
+    qs = scoping.visible_tasks(user, include_assigned=payload.include_assigned)
     if payload.project_id:
         qs = qs.filter(project_id=payload.project_id)
     if payload.owned_only:
         qs = qs.filter(owner=user)
     qs = qs.order_by('id')
-    return [serialize_task(t) for t in qs]
+    return serialize_tasks(qs)
+
+
+def tool_search_tasks(user, payload: SearchTasksIn) -> List[TaskOut]:
+    qs = search.filter_tasks(scoping.visible_tasks(user), payload.query)
+    if 'search_rank' in qs.query.annotations:
+        qs = qs.order_by('search_rank', 'id')
+    else:
+        qs = qs.order_by('id')
+    return serialize_tasks(qs[:payload.limit])
 
 
 @transaction.atomic
@@ -156,41 +220,45 @@ def tool_update_task(user, payload: UpdateTaskIn) -> TaskOut:
     if not can_write(user, task.owner_id):
         raise PermissionError("Not allowed to update this task")
 
-    if payload.title is not None:
-        task.title = payload.title
-    if payload.description is not None:
-        task.description = payload.description
-    if payload.priority is not None:
-        task.priority = payload.priority
-    if payload.status is not None:
-        task.status = payload.status
-    if payload.depends_on_id is not None:
-        task.depends_on_id = payload.depends_on_id
-    if payload.due_date is not None:
-        from django.utils.dateparse import parse_datetime
-        task.due_date = parse_datetime(payload.due_date) if payload.due_date else None
-    if payload.estimated_hours is not None:
-        task.estimated_hours = payload.estimated_hours
+    _apply_update(task, payload)
 
     if payload.assignee_ids is not None:
         task.assignees.set(payload.assignee_ids)
     if payload.tag_ids is not None:
         task.tags.set(payload.tag_ids)
 
+    _note_update(user, task, payload.llm_notes)
+
+    task.save()
+    return serialize_task(task)
+
+
+def _apply_update(task: Task, payload: UpdateTaskIn) -> List[str]:
+    """Set the scalar fields given in ``payload`` on ``task``; returns the names of the fields set."""
+    changed = []
+    for name in ('title', 'description', 'priority', 'status', 'depends_on_id', 'estimated_hours'):
+        value = getattr(payload, name)
+        if value is not None:
+            setattr(task, name, value)
+            changed.append(name)
+    if payload.due_date is not None:
+        task.due_date = parse_datetime(payload.due_date) if payload.due_date else None
+        changed.append('due_date')
+    return changed
+
+
+def _note_update(user, task: Task, llm_notes: Optional[str]) -> None:
     lc = task.llm_context or {}
     lc.update({
         "source": "agent",
         "last_action": "update",
         "actor_user_id": getattr(user, 'id', None),
         "actor_email": getattr(user, 'email', None),
-        "summary_text": payload.llm_notes or lc.get("summary_text"),
+        "summary_text": llm_notes or lc.get("summary_text"),
         "timestamp": timezone.now().isoformat(),
     })
     task.llm_context = lc
 
-    task.save()
-    return serialize_task(task)
-
 
 @transaction.atomic
 def tool_delete_task(user, payload: DeleteTaskIn) -> Dict[str, Any]:
@@ -199,3 +267,158 @@ def tool_delete_task(user, payload: DeleteTaskIn) -> Dict[str, Any]:
         raise PermissionError("Not allowed to delete this task")
     task.delete()
     return {"deleted": True, "task_id": payload.task_id}
+
+
+# Bulk tools: one transaction and a fixed number of queries per call, whatever the number of items.
+# Items are validated up front; the ones that fail are reported in the per-item results and the
+# rest are written with bulk_create / bulk_update and bulk through-table inserts (which bypass
+# signals, so the search index and read model are refreshed once for the whole batch).
+
+def _references(items) -> tuple:
+    """The existing user, tag and task ids among those the items refer to (a query each)."""
+    return (
+        existing_ids(get_user_model().objects, chain.from_iterable(i.assignee_ids or [] for i in items)),
+        existing_ids(Tag.objects, chain.from_iterable(i.tag_ids or [] for i in items)),
+        existing_ids(Task.objects, (i.depends_on_id for i in items if i.depends_on_id)),
+    )
+
+
+def _reference_error(item, references) -> Optional[str]:
+    users, tags, tasks = references
+    return (missing_ids_error('assignee', item.assignee_ids or [], users)
+            or missing_ids_error('tag', item.tag_ids or [], tags)
+            or missing_ids_error('depends_on task', [item.depends_on_id] if item.depends_on_id else [], tasks))
+
+
+def _set_relations(assignees: Dict[int, List[int]], tags: Dict[int, List[int]], replace: bool = False) -> None:
+    """Add (or with ``replace``, set) task id -> assignee / tag ids through the through tables."""
+    for through, column, related in ((Task.assignees.through, 'customuser_id', assignees),
+                                     (Task.tags.through, 'tag_id', tags)):
+        if replace and related:
+            if through is Task.assignees.through:
+                versions.bump_tasks(related)  # the assignees about to be replaced no longer see the tasks
+            through.objects.filter(task_id__in=list(related)).delete()
+        through.objects.bulk_create([through(task_id=task_id, **{column: related_id})
+                                     for task_id, ids in related.items() for related_id in ids],
+                                    ignore_conflicts=True)
+
+
+def _bulk_result(size: int, errors: Dict[int, str], tasks: Dict[int, Task]) -> BulkTasksOut:
+    """Per-item results from the failed (index -> error) and written (index -> task) items."""
+    outs = dict(zip(tasks, serialize_tasks(tasks.values())))
+    results = [BulkTaskResult(index=i, ok=True, task=outs[i]) if i in outs
+               else BulkTaskResult(index=i, ok=False, error=errors.get(i, NOT_APPLIED))
+               for i in range(size)]
+    return BulkTasksOut(applied=len(outs), failed=size - len(outs), results=results)
+
+
+@transaction.atomic
+def tool_bulk_create_tasks(user, payload: BulkCreateTasksIn) -> BulkTasksOut:
+    items = payload.tasks
+    projects = Project.objects.in_bulk({i.project_id for i in items})
+    references = _references(items)
+    errors = {}
+    for index, item in enumerate(items):
+        project = projects.get(item.project_id)
+        if project is None:
+            errors[index] = f"Project {item.project_id} does not exist"
+        elif not can_write(user, project.owner_id):
+            errors[index] = "Not allowed to create tasks in this project"
+        elif error := _reference_error(item, references):
+            errors[index] = error
+    if errors and payload.all_or_nothing:
+        return _bulk_result(len(items), errors, {})
+
+    timestamp = timezone.now().isoformat()
+    new = {}
+    for index, item in enumerate(items):
+        if index in errors:
+            continue
+        project = projects[item.project_id]
+        new[index] = Task(
+            title=item.title,
+            description=item.description,
+            owner_id=project.owner_id,
+            project=project,
+            priority=item.priority,
+            status=item.status,
+            depends_on_id=item.depends_on_id,
+            due_date=parse_datetime(item.due_date) if item.due_date else None,
+            estimated_hours=item.estimated_hours,
+            llm_context={
+                **(project.llm_context or {}),
+                "source": "agent",
+                "last_action": "create",
+                "actor_user_id": getattr(user, 'id', None),
+                "actor_email": getattr(user, 'email', None),
+                "summary_text": item.llm_notes or f"Task '{item.title}' created via agent",
+                "timestamp": timestamp,
+            },
+        )
+    Task.objects.bulk_create(new.values())
+    _set_relations({new[i].id: items[i].assignee_ids for i in new if items[i].assignee_ids},
+                   {new[i].id: items[i].tag_ids for i in new if items[i].tag_ids})
+    tasks_changed([t.id for t in new.values()], 'default')
+    return _bulk_result(len(items), errors, new)
+
+
+@transaction.atomic
+def tool_bulk_update_tasks(user, payload: BulkUpdateTasksIn) -> BulkTasksOut:
+    items = payload.updates
+    tasks = Task.objects.select_for_update().in_bulk({i.task_id for i in items})
+    references = _references(items)
+    errors, seen = {}, set()
+    for index, item in enumerate(items):
+        task = tasks.get(item.task_id)
+        if task is None:
+            errors[index] = f"Task {item.task_id} does not exist"
+        elif item.task_id in seen:
+            errors[index] = f"Task {item.task_id} is updated by an earlier item"
+        elif not can_write(user, task.owner_id):
+            errors[index] = "Not allowed to update this task"
+        elif error := _reference_error(item, references):
+            errors[index] = error
+        seen.add(item.task_id)
+    if errors and payload.all_or_nothing:
+        return _bulk_result(len(items), errors, {})
+
+    updated, fields = {}, {'llm_context', 'updated'}
+    now = timezone.now()
+    for index, item in enumerate(items):
+        if index in errors:
+            continue
+        task = updated[index] = tasks[item.task_id]
+        fields.update(_apply_update(task, item))
+        _note_update(user, task, item.llm_notes)
+        task.updated = now  # bulk_update doesn't apply auto_now
+    Task.objects.bulk_update(updated.values(), sorted(fields))
+    _set_relations({items[i].task_id: items[i].assignee_ids for i in updated if items[i].assignee_ids is not None},
+                   {items[i].task_id: items[i].tag_ids for i in updated if items[i].tag_ids is not None},
+                   replace=True)
+    tasks_changed([t.id for t in updated.values()], 'default')
+    return _bulk_result(len(items), errors, updated)
+
+
+@transaction.atomic
+def tool_bulk_assign(user, payload: BulkAssignIn) -> BulkTasksOut:
+    error = missing_ids_error('assignee', payload.assignee_ids,
+                              existing_ids(get_user_model().objects, payload.assignee_ids))
+    if error:
+        raise ValueError(error)
+    tasks = Task.objects.select_for_update().in_bulk(set(payload.task_ids))
+    errors, assigned = {}, {}
+    for index, task_id in enumerate(payload.task_ids):
+        task = tasks.get(task_id)
+        if task is None:
+            errors[index] = f"Task {task_id} does not exist"
+        elif not can_write(user, task.owner_id):
+            errors[index] = "Not allowed to update this task"
+        else:
+            assigned[index] = task
+    if errors and payload.all_or_nothing:
+        return _bulk_result(len(payload.task_ids), errors, {})
+
+    _set_relations({t.id: payload.assignee_ids for t in assigned.values()}, {}, replace=payload.replace)
+    # assignees are not part of the search document
+    tasks_changed({t.id for t in assigned.values()}, 'default', searchable=False)
+    return _bulk_result(len(payload.task_ids), errors, assigned)
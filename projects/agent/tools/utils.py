@@ -1,14 +1,46 @@
-from typing import Any
-from django.db.models import Q
-
-from ...models import Task
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List
 
 
 def can_write(user: Any, obj_owner_id: int) -> bool:
     return bool(getattr(user, 'is_staff', False) or getattr(user, 'id', None) == obj_owner_id)
 
 
-def visible_tasks_qs(user: Any):
-    if getattr(user, 'is_staff', False):
-        return Task.objects.all()
-    return Task.objects.filter(Q(owner=user) | Q(assignees=user)).distinct()
+def m2m_id_map(model, field_name: str, ids: Iterable[int]) -> Dict[int, List[int]]:
+    """
+    Load the related ids of a many-to-many field for a batch of instances in one query
+    on the through table: {instance id: [related ids]}.
+    """
+    ids = list(ids)
+    if not ids:
+        return {}
+    field = model._meta.get_field(field_name)
+    if field.auto_created:
+        # reverse side (e.g. user.assigned_tasks): same through table, columns swapped
+        m2m = field.remote_field
+        source_name, target_name = m2m.m2m_reverse_field_name(), m2m.m2m_field_name()
+    else:
+        m2m = field
+        source_name, target_name = m2m.m2m_field_name(), m2m.m2m_reverse_field_name()
+    through = m2m.remote_field.through
+    source = through._meta.get_field(source_name).attname
+    target = through._meta.get_field(target_name).attname
+    related = defaultdict(list)
+    rows = through.objects.filter(**{f'{source}__in': ids}).order_by(source, target).values_list(source, target)
+    for obj_id, related_id in rows:
+        related[obj_id].append(related_id)
+    return related
+
+
+def existing_ids(qs, ids: Iterable[int]) -> set:
+    """The subset of ``ids`` present in ``qs``, in one query."""
+    ids = set(ids)
+    return set(qs.filter(pk__in=ids).values_list('pk', flat=True)) if ids else set()
+
+
+def missing_ids_error(label: str, ids: Iterable[int], existing: set):
+    missing = sorted(set(ids) - existing)
+    return f"Unknown {label} ids: {missing}" if missing else None
+
+
+NOT_APPLIED = "Not applied: another item failed and all_or_nothing is set"
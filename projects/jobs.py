@@ -0,0 +1,202 @@
+"""
+A job queue in the database, for agent runs too long for one HTTP request (no broker needed).
+
+``POST /api/agent/chat`` with ``options.async`` queues a ``Job`` (``enqueue_chat``) and answers
+202 with its id at once; ``manage.py worker`` runs queued jobs on a thread pool, and clients
+follow them at ``/api/jobs/<id>`` (status, progress events, result) or
+``/api/jobs/<id>/events`` (server-sent events).
+
+- Leasing: ``claim`` hands a job to one worker with a lease of ``JOB_LEASE_SECONDS``, taken
+  with a conditional UPDATE so two workers can't both get it. While the job runs, the worker
+  renews the lease every ``JOB_HEARTBEAT_SECONDS`` and saves the progress events.
+- Retry on crash: a running job whose lease ran out lost its worker; it is claimed again, up
+  to ``max_attempts`` (``JOB_MAX_ATTEMPTS``) tries in all, then failed. A run that raises
+  fails at once: agent runs write, so they are not repeated blindly.
+- Per-user caps: at most ``JOB_MAX_RUNNING_PER_USER`` of a user's jobs run at a time (further
+  ones wait in the queue; the cap is a condition of the claiming UPDATE, so racing workers
+  can't both start one) and at most ``JOB_MAX_PENDING_PER_USER`` are queued or running
+  (``enqueue_chat`` raises ``JobLimitExceeded`` past that).
+
+Progress events are those of the chat stream (``projects.agent.streaming``) except ``token``:
+``tool_start`` / ``tool_end``, plus ``retry`` when a job starts over after a crash.
+``job_events`` replays them as SSE, adding ``status`` on every status change and ending with
+``done`` (``{"output", "meta"}``, as in the chat stream) or ``error`` (``{"detail"}``).
+"""
+import asyncio
+import dataclasses
+import logging
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import close_old_connections, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from . import metrics
+from .agent.streaming import KEEP_ALIVE, RunEvents, sse_event
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+FINISHED = ('DONE', 'FAILED')
+
+
+class JobLimitExceeded(Exception):
+    pass
+
+
+def enqueue_chat(user, prompt, history) -> Job:
+    """Queue an agent chat run of ``prompt`` after the compacted ``history`` (``projects.agent.history``)."""
+    pending = Job.objects.filter(user=user).exclude(status__in=FINISHED).count()
+    if pending >= settings.JOB_MAX_PENDING_PER_USER:
+        raise JobLimitExceeded(f'At most {settings.JOB_MAX_PENDING_PER_USER} queued or running jobs per user')
+    return Job.objects.create(user=user, kind='chat', max_attempts=settings.JOB_MAX_ATTEMPTS,
+                              payload={'prompt': prompt, 'history': dataclasses.asdict(history)})
+
+
+def running_users(now):
+    """The ids of the users with ``JOB_MAX_RUNNING_PER_USER`` jobs on a live lease, as a subquery."""
+    return (Job.objects.filter(status='RUNNING', lease_expires__gt=now).values('user_id')
+            .annotate(running=Count('id')).filter(running__gte=settings.JOB_MAX_RUNNING_PER_USER)
+            .values('user_id'))
+
+
+def lock_user(user_id):
+    """Serialize the claims of one user's jobs until the transaction ends. Where the database has
+    no row locks (SQLite) this is a no-op; writes are serialized there anyway."""
+    list(get_user_model().objects.select_for_update().filter(id=user_id).values_list('id'))
+
+
+def claim(worker: str):
+    """Lease the oldest job this worker may run: queued, or running on a lost lease. None if there is none."""
+    now = timezone.now()
+    lost = Job.objects.filter(status='RUNNING', lease_expires__lte=now)
+    lost.filter(attempts__gte=F('max_attempts')).update(
+        status='FAILED', error='The job was abandoned by its worker too many times.', lease_owner='',
+        lease_expires=None, finished=now)
+    candidates = (Job.objects.filter(Q(status='QUEUED') | Q(status='RUNNING', lease_expires__lte=now))
+                  .exclude(user_id__in=running_users(now)).order_by('created', 'id')
+                  .values_list('id', 'user_id', 'status', 'lease_expires')[:10])
+    for job_id, user_id, status, lease_expires in candidates:
+        # the per-user cap is checked again in the UPDATE itself: the candidates may be stale by now
+        with transaction.atomic():
+            lock_user(user_id)
+            taken = (Job.objects.filter(id=job_id, status=status, lease_expires=lease_expires)
+                     .exclude(user_id__in=running_users(now))
+                     .update(status='RUNNING', lease_owner=worker, attempts=F('attempts') + 1, started=now,
+                             lease_expires=now + timedelta(seconds=settings.JOB_LEASE_SECONDS)))
+        if taken:  # else another worker was quicker
+            return Job.objects.get(id=job_id)
+    return None
+
+
+def renew(job: Job, worker: str) -> bool:
+    """Extend the lease and save the progress events; False when the lease was lost to another worker."""
+    return bool(Job.objects.filter(id=job.id, status='RUNNING', lease_owner=worker).update(
+        lease_expires=timezone.now() + timedelta(seconds=settings.JOB_LEASE_SECONDS), events=job.events))
+
+
+def finish(job: Job, worker: str, result=None, error='') -> bool:
+    return bool(Job.objects.filter(id=job.id, status='RUNNING', lease_owner=worker).update(
+        status='FAILED' if error else 'DONE', result=result, error=error, events=job.events,
+        lease_owner='', lease_expires=None, finished=timezone.now()))
+
+
+class JobEvents(RunEvents):
+    """The chat stream's run events, collected in ``job.events`` instead of sent."""
+
+    def __init__(self, job):
+        super().__init__(queue=None)
+        self.job = job
+
+    def emit(self, event, data):
+        if event != 'token':  # too many to store; the result has the full answer
+            self.job.events.append({'event': event, 'data': data})
+
+
+async def run_chat(job, events):
+    from .agent.agent import SYSTEM_PROMPT, AgentDeps, agent_factory
+    from .agent.history import History
+
+    user = await sync_to_async(get_user_model().objects.get)(id=job.user_id)
+    history = History(**job.payload.get('history', {}))
+    deps = AgentDeps(user=user, history=history)
+    with metrics.observe_run('job'):
+        result = await agent_factory().run(job.payload['prompt'], message_history=history.messages(SYSTEM_PROMPT),
+                                           deps=deps, event_stream_handler=events.handle)
+    output = result.output if isinstance(result.output, dict) else {'message': result.output}
+    return {**output, 'meta': deps.meta()}
+
+
+HANDLERS = {'chat': run_chat}
+
+
+async def _run(job, worker):
+    events = JobEvents(job)
+    if job.attempts > 1:
+        events.emit('retry', {'attempt': job.attempts})
+    task = asyncio.create_task(HANDLERS[job.kind](job, events))
+    while True:
+        done, _ = await asyncio.wait([task], timeout=settings.JOB_HEARTBEAT_SECONDS)
+        if done:
+            break
+        if not await sync_to_async(renew)(job, worker):
+            logger.warning('Lost the lease of job %s; cancelling it', job.id)
+            task.cancel()
+            await asyncio.wait([task])
+            return False
+    try:
+        result = task.result()
+    except Exception as exc:
+        logger.exception('Job %s failed', job.id)
+        return await sync_to_async(finish)(job, worker, error=str(exc) or type(exc).__name__)
+    return await sync_to_async(finish)(job, worker, result=result)
+
+
+def run(job: Job, worker: str) -> bool:
+    """Run a claimed job to the end (in the calling thread); returns whether its result was saved."""
+    try:
+        return asyncio.run(_run(job, worker))
+    finally:
+        close_old_connections()
+
+
+def run_next(worker: str) -> bool:
+    """Claim and run one job; False when there was none to run."""
+    job = claim(worker)
+    if job is None:
+        return False
+    run(job, worker)
+    return True
+
+
+async def job_events(job_id, after=0):
+    """Async generator of SSE frames following a job (polled every ``JOB_POLL_INTERVAL``), from event ``after`` on."""
+    poll, heartbeat = settings.JOB_POLL_INTERVAL, getattr(settings, 'AGENT_STREAM_HEARTBEAT', 15)
+    fetch = sync_to_async(lambda: Job.objects.only('status', 'attempts', 'events', 'result', 'error').get(id=job_id))
+    sent, status, quiet = after, None, 0.0
+    while True:
+        job = await fetch()
+        frames = []
+        if job.status != status:
+            status = job.status
+            frames.append(sse_event('status', {'status': status, 'attempts': job.attempts}))
+        frames += [sse_event(item['event'], item['data']) for item in job.events[sent:]]
+        sent = max(sent, len(job.events))
+        if status == 'DONE':
+            output = dict(job.result or {})
+            meta = output.pop('meta', {})
+            frames.append(sse_event('done', {'output': output, 'meta': meta}))
+        elif status == 'FAILED':
+            frames.append(sse_event('error', {'detail': job.error}))
+        for frame in frames:
+            yield frame
+        if status in FINISHED:
+            return
+        quiet = 0.0 if frames else quiet + poll
+        if quiet >= heartbeat:
+            yield KEEP_ALIVE
+            quiet = 0.0
+        await asyncio.sleep(poll)
@@ -0,0 +1,23 @@
+"""Timing helpers of the ``bench_*`` commands (the leading underscore keeps this module out of the command list)."""
+import statistics
+import time
+
+
+def time_ms(func, n):
+    """The wall-clock milliseconds of each of ``n`` calls of ``func``."""
+    timings = []
+    for _ in range(n):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def report(stdout, label, timings, rows=None):
+    """Write the median and p95 of ``timings``, plus the throughput when each call handled ``rows`` rows."""
+    median = statistics.median(timings)
+    p95 = sorted(timings)[max(int(len(timings) * 0.95) - 1, 0)]
+    line = f"{label:<40} median {median:9.3f} ms   p95 {p95:9.3f} ms"
+    if rows:
+        line += f"   {rows / median * 1000:12,.0f} rows/s"
+    stdout.write(line)
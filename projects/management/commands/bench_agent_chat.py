@@ -0,0 +1,186 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.asgi import get_asgi_application
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import Client, override_settings
+from django.utils.crypto import get_random_string
+from pydantic_ai import Agent
+
+from projects import readmodel, search
+from projects.agent.agent import AgentDeps, agent_factory, warm_up
+from projects.agent.llm import SCRIPTS, ScriptedModel
+from projects.agent.ratelimit import UNLIMITED
+from projects.models import Comment, Project, Tag, Task
+
+WORDS = ['soil', 'sample', 'field', 'report', 'sensor', 'yield', 'irrigation', 'budget', 'review', 'survey']
+PROMPTS = {
+    'summary': 'Give me a summary of my work',
+    'search': 'search for tasks about soil',
+    'triage': 'triage my next task',
+}
+
+
+class QueryLog(logging.Handler):
+    """Collects the query counts logged by projects.querybudget (the request and every tool call)."""
+
+    def __init__(self):
+        super().__init__(logging.INFO)
+        self.queries = 0
+
+    def emit(self, record):
+        self.queries += getattr(record, 'query_stats', {}).get('queries', 0)
+
+
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:  # not Linux: peak RSS instead (bytes on macOS)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 20
+
+
+class Command(BaseCommand):
+    help = ("Offline load benchmark of an agent chat turn: drives POST /api/agent/chat (through the ASGI app) "
+            "and the bare agent run with the scripted stub model (projects.agent.llm), so the numbers are the "
+            "backend's own cost per turn - p50/p95/p99 latency, queries per turn and process RSS - without the LLM.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--turns', type=int, default=100, help='Measured turns per script and path.')
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--tasks', type=int, default=200, help='Tasks per user.')
+        parser.add_argument('--scripts', default=','.join(SCRIPTS), help='Comma-separated scripts to run.')
+        parser.add_argument('--latency', type=float, default=0.0, help='Stub seconds per model request.')
+        parser.add_argument('--no-instrumentation', action='store_true',
+                            help='Turn off logfire instrumentation of the agent runs, to see its share of a turn.')
+        parser.add_argument('--json', action='store_true', help='Print the results as one JSON line.')
+
+    def handle(self, *args, **options):
+        path = str(Path(tempfile.mkdtemp()) / 'bench_agent_chat.sqlite3')
+        connections['default'].close()
+        connections['default'].settings_dict['NAME'] = path
+        call_command('migrate', verbosity=0)
+        self.stdout.write(f"Using scratch database {path}")
+        users = self.seed(options['users'], options['tasks'])
+        # as AtlasAI/asgi.py does; before the handler below, as setting up the app reconfigures logging
+        self.app = get_asgi_application()
+        warm_up()
+        if options['no_instrumentation']:
+            Agent.instrument_all(False)
+
+        query_log = QueryLog()
+        queries_logger = logging.getLogger('projects.queries')
+        saved = queries_logger.level, queries_logger.propagate, queries_logger.handlers
+        queries_logger.setLevel(logging.INFO)
+        queries_logger.propagate = False
+        queries_logger.handlers = [query_log]
+        results = []
+        rss_start = rss_mb()
+        try:
+            model = ScriptedModel(latency=options['latency'])
+            with agent_factory().override(model=model), override_settings(ALLOWED_HOSTS=['testserver'], **UNLIMITED):
+                for script in options['scripts'].split(','):
+                    prompt = PROMPTS.get(script, script)
+                    for label, runner in (('http', self.http_turns), ('agent', self.agent_turns)):
+                        runner(users, prompt, options['warmup'], query_log)  # warm-up
+                        timings, queries = runner(users, prompt, options['turns'], query_log)
+                        results.append(self.summarize(script, label, timings, queries))
+        finally:
+            queries_logger.level, queries_logger.propagate, queries_logger.handlers = saved
+
+        if options['json']:
+            self.stdout.write(json.dumps({'rss_start_mb': round(rss_start, 1), 'results': results}))
+            return
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"\n{'script':<10}{'path':<7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries/turn':>14}{'RSS MB':>9}"))
+        for r in results:
+            self.stdout.write(f"{r['script']:<10}{r['path']:<7}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}"
+                              f"{r['p99_ms']:>9.2f}{r['queries_per_turn']:>14.1f}{r['rss_mb']:>9.1f}")
+        self.stdout.write(f"RSS at start {rss_start:.1f} MB")
+
+    def seed(self, n_users, tasks_per_user):
+        rng = random.Random(7)
+        User = get_user_model()
+        users = User.objects.bulk_create([User(email=f'chat{i}@example.com') for i in range(n_users)])
+        tags = Tag.objects.bulk_create([Tag(name=word) for word in WORDS])
+        projects = Project.objects.bulk_create([Project(title=f'{rng.choice(WORDS)} project {i}', description='seeded',
+                                                        owner=user) for user in users for i in range(5)])
+        by_owner = {}
+        for project in projects:
+            by_owner.setdefault(project.owner_id, []).append(project)
+        tasks = Task.objects.bulk_create([
+            Task(title=f'{rng.choice(WORDS)} {rng.choice(WORDS)} {i}', description=f'{rng.choice(WORDS)} notes',
+                 owner=user, project=rng.choice(by_owner[user.id]), llm_context={})
+            for user in users for i in range(tasks_per_user)])
+        Task.assignees.through.objects.bulk_create([
+            Task.assignees.through(task_id=t.id, customuser_id=rng.choice(users).id) for t in tasks if rng.random() < 0.3])
+        Task.tags.through.objects.bulk_create([
+            Task.tags.through(task_id=t.id, tag_id=rng.choice(tags).id) for t in tasks if rng.random() < 0.5])
+        Comment.objects.bulk_create([Comment(title='note', description=rng.choice(WORDS), owner_id=t.owner_id, task=t)
+                                     for t in tasks if rng.random() < 0.3])
+        readmodel.rebuild()
+        search.rebuild()
+        self.stdout.write(f"Seeded {len(users)} users, {len(tasks)} tasks")
+        return users
+
+    def http_turns(self, users, prompt, turns, query_log):
+        return asyncio.run(self._http_turns(users, prompt, turns, query_log))
+
+    async def _http_turns(self, users, prompt, turns, query_log):
+        transport = httpx.ASGITransport(app=self.app)
+        csrf_token = get_random_string(32)
+        clients = []
+        for user in users:
+            client = Client()
+            await sync_to_async(client.force_login)(user)
+            clients.append(httpx.AsyncClient(
+                transport=transport, base_url='http://testserver', headers={'X-CSRFToken': csrf_token},
+                cookies={settings.SESSION_COOKIE_NAME: client.cookies[settings.SESSION_COOKIE_NAME].value,
+                         settings.CSRF_COOKIE_NAME: csrf_token}))
+        timings, queries = [], []
+        for turn in range(turns):
+            before = query_log.queries
+            started = time.perf_counter()
+            resp = await clients[turn % len(clients)].post('/api/agent/chat', json={'message': prompt})
+            timings.append((time.perf_counter() - started) * 1000)
+            resp.raise_for_status()
+            queries.append(query_log.queries - before)
+        for client in clients:
+            await client.aclose()
+        return timings, queries
+
+    def agent_turns(self, users, prompt, turns, query_log):
+        timings, queries = [], []
+        for turn in range(turns):
+            before = query_log.queries
+            started = time.perf_counter()
+            agent_factory().run_sync(prompt, deps=AgentDeps(user=users[turn % len(users)]))
+            timings.append((time.perf_counter() - started) * 1000)
+            queries.append(query_log.queries - before)
+        return timings, queries
+
+    def summarize(self, script, path, timings, queries):
+        timings = sorted(timings)
+
+        def pct(p):
+            return timings[min(len(timings) - 1, int(len(timings) * p))]
+        return {
+            'script': script, 'path': path, 'turns': len(timings),
+            'p50_ms': round(statistics.median(timings), 2), 'p95_ms': round(pct(0.95), 2), 'p99_ms': round(pct(0.99), 2),
+            'queries_per_turn': round(statistics.mean(queries), 1), 'rss_mb': round(rss_mb(), 1),
+        }
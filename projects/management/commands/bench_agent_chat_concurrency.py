@@ -0,0 +1,114 @@
+import asyncio
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.asgi import get_asgi_application
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import Client, override_settings
+from django.utils.crypto import get_random_string
+
+from projects.agent.agent import AgentDeps, agent_factory
+from projects.agent.llm import ScriptedModel
+from projects.agent.ratelimit import UNLIMITED
+from projects.models import Project, Task
+
+
+# the stub model's script: list the user's tasks, then answer with their titles
+LIST_TASKS = {'tasks': [[('list_tasks', {})], lambda returns: {'tasks': [t.title for t in returns['list_tasks']]}]}
+
+
+class Command(BaseCommand):
+    help = ("Drive N simultaneous chats through the async /api/agent/chat view (in-process ASGI app) "
+            "against an offline stub model with fixed latency, and compare with blocking run_sync calls "
+            "on a WSGI-sized thread pool.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chats', type=int, default=200)
+        parser.add_argument('--latency', type=float, default=0.5, help='Stub model seconds per LLM call.')
+        parser.add_argument('--wsgi-threads', type=int, default=8)
+        parser.add_argument('--max-concurrency', type=int, default=200,
+                            help='AGENT_CHAT_MAX_CONCURRENCY for the run.')
+
+    def handle(self, *args, **options):
+        path = str(Path(tempfile.mkdtemp()) / 'bench_chat.sqlite3')
+        connections['default'].close()
+        connections['default'].settings_dict['NAME'] = path
+        call_command('migrate', verbosity=0)
+        self.stdout.write(f"Using scratch database {path}")
+        users = self.seed(options['chats'])
+
+        with override_settings(AGENT_CHAT_MAX_CONCURRENCY=options['max_concurrency'],
+                               AGENT_CHAT_MAX_WAITING=options['chats'], ALLOWED_HOSTS=['testserver'], **UNLIMITED):
+            stub = ScriptedModel(LIST_TASKS, latency=options['latency'])
+            elapsed, latencies, statuses = asyncio.run(self.run_async(users, stub))
+        self.report(f"async view, {options['chats']} chats in flight", elapsed, latencies, statuses, stub)
+
+        stub = ScriptedModel(LIST_TASKS, latency=options['latency'])
+        elapsed, latencies = self.run_sync(users, stub, options['wsgi_threads'])
+        self.report(f"run_sync on {options['wsgi_threads']} WSGI threads", elapsed, latencies, {200: len(users)}, stub)
+
+    def seed(self, n):
+        User = get_user_model()
+        users = User.objects.bulk_create([User(email=f'chat{i}@example.com') for i in range(n)])
+        projects = Project.objects.bulk_create(
+            [Project(title=f'P{i}', description='d', owner=user) for i, user in enumerate(users)])
+        Task.objects.bulk_create([Task(title=f'T{i}', description='d', owner=p.owner, project=p)
+                                  for i, p in enumerate(projects)])
+        return users
+
+    async def run_async(self, users, stub):
+        # the real ASGI entry point (as under uvicorn), driven in-process through httpx
+        transport = httpx.ASGITransport(app=get_asgi_application())
+        csrf_token = get_random_string(32)
+        cookies = []
+        for user in users:
+            client = Client()
+            await sync_to_async(client.force_login)(user)
+            cookies.append({settings.SESSION_COOKIE_NAME: client.cookies[settings.SESSION_COOKIE_NAME].value,
+                            settings.CSRF_COOKIE_NAME: csrf_token})
+
+        async def chat(cookie):
+            async with httpx.AsyncClient(transport=transport, base_url='http://testserver',
+                                         cookies=cookie, headers={'X-CSRFToken': csrf_token},
+                                         timeout=None) as client:
+                started = time.perf_counter()
+                resp = await client.post('/api/agent/chat', json={'message': 'what are my tasks?'})
+                return resp.status_code, time.perf_counter() - started
+
+        with agent_factory().override(model=stub):
+            started = time.perf_counter()
+            results = await asyncio.gather(*(chat(c) for c in cookies))
+            elapsed = time.perf_counter() - started
+        statuses = {}
+        for code, _ in results:
+            statuses[code] = statuses.get(code, 0) + 1
+        return elapsed, [latency for _, latency in results], statuses
+
+    def run_sync(self, users, model, threads):
+        def chat(user):
+            started = time.perf_counter()
+            agent_factory().run_sync('what are my tasks?', model=model, deps=AgentDeps(user=user))
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            latencies = list(pool.map(chat, users))
+        return time.perf_counter() - started, latencies
+
+    def report(self, label, elapsed, latencies, statuses, stub):
+        latencies = sorted(latencies)
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\n=== {label} ==="))
+        self.stdout.write(f"wall {elapsed:.2f} s   throughput {len(latencies) / elapsed:.1f} chats/s   "
+                          f"statuses {statuses}")
+        self.stdout.write(f"latency p50 {statistics.median(latencies):.2f} s   "
+                          f"p95 {latencies[int(len(latencies) * 0.95) - 1]:.2f} s   "
+                          f"peak concurrent LLM calls {stub.peak}")
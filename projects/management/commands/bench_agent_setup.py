@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from pydantic_ai.models.test import TestModel
+
+from projects.agent.agent import AgentDeps, agent_factory, build_agent, configure_observability
+from projects.management.commands._timing import report, time_ms
+
+
+class Command(BaseCommand):
+    help = ("Time the per-request agent setup of /api/agent/chat: configuring logfire and building the "
+            "agent with its tools on every request (before) versus reusing the process-wide agent (after).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+
+    def handle(self, *args, **options):
+        n = options['iterations']
+        agent_factory()  # warm the shared agent, as at worker start
+
+        def per_request_build():
+            configure_observability.__wrapped__()
+            return build_agent()
+
+        before = time_ms(per_request_build, n)
+        after = time_ms(agent_factory, n)
+        report(self.stdout, 'before: configure + build per request', before)
+        report(self.stdout, 'after: shared agent', after)
+
+        # an offline run (no LLM, no tools) puts the setup cost next to the agent's own overhead
+        model = TestModel(call_tools=[])
+        run = time_ms(lambda: agent_factory().run_sync('hello', model=model, deps=AgentDeps()), n)
+        report(self.stdout, 'offline run_sync on the shared agent', run)
@@ -0,0 +1,159 @@
+import random
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import RequestFactory
+from django.utils import timezone
+from rest_framework.request import Request
+
+from projects.models import Project, Task, Tag
+from projects.views import TaskViewSet
+
+BENCH_ALIAS = 'bench'
+
+# Indexes created with RunSQL in 0003_task_indexes (not part of Task._meta.indexes)
+THROUGH_TABLE_INDEXES = {
+    'task_assignees_user_task_idx': 'CREATE INDEX task_assignees_user_task_idx '
+                                    'ON projects_task_assignees (customuser_id, task_id)',
+    'task_tags_tag_task_idx': 'CREATE INDEX task_tags_tag_task_idx ON projects_task_tags (tag_id, task_id)',
+}
+
+
+class Command(BaseCommand):
+    help = ("Seed a scratch SQLite database with tasks and print EXPLAIN QUERY PLAN for the "
+            "TaskViewSet hot paths with the task indexes dropped (before) and restored (after).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--db', help='Scratch SQLite file to use (reused if already seeded). '
+                                         'Defaults to a temporary file.')
+        parser.add_argument('--tasks', type=int, default=1_000_000)
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--projects', type=int, default=2_000)
+        parser.add_argument('--batch-size', type=int, default=5_000)
+
+    def handle(self, *args, **options):
+        path = options['db'] or str(Path(tempfile.mkdtemp()) / 'bench_tasks.sqlite3')
+        connections.settings[BENCH_ALIAS] = {**connections.settings['default'], 'NAME': path}
+        call_command('migrate', database=BENCH_ALIAS, verbosity=0)
+        self.stdout.write(f"Using scratch database {path}")
+
+        self.seed(options)
+        viewer = get_user_model().objects.using(BENCH_ALIAS).filter(is_staff=False).order_by('id').first()
+        staff = get_user_model().objects.using(BENCH_ALIAS).filter(is_staff=True).order_by('id').first()
+        scenarios = self.scenarios(viewer, staff)
+
+        self.drop_indexes()
+        self.report('BEFORE (no task indexes)', scenarios)
+        self.create_indexes()
+        self.report('AFTER', scenarios)
+
+    def seed(self, options):
+        User = get_user_model()
+        db = BENCH_ALIAS
+        existing = Task.all_objects.using(db).count()
+        if existing >= options['tasks']:
+            self.stdout.write(f"Reusing {existing} seeded tasks")
+            return
+
+        started = time.perf_counter()
+        rng = random.Random(42)
+        batch_size = options['batch_size']
+        if not User.objects.using(db).exists():
+            users = [User(email=f'bench{i}@example.com', is_staff=(i == 0)) for i in range(options['users'])]
+            User.objects.using(db).bulk_create(users, batch_size=batch_size)
+        user_ids = list(User.objects.using(db).values_list('id', flat=True))
+
+        if not Tag.objects.using(db).exists():
+            Tag.objects.using(db).bulk_create([Tag(name=f'tag{i}') for i in range(50)])
+        tag_ids = list(Tag.objects.using(db).values_list('id', flat=True))
+
+        if not Project.all_objects.using(db).exists():
+            projects = [Project(title=f'Project {i}', description='seeded', owner_id=rng.choice(user_ids))
+                        for i in range(options['projects'])]
+            Project.objects.using(db).bulk_create(projects, batch_size=batch_size)
+        project_owners = dict(Project.all_objects.using(db).values_list('id', 'owner_id'))
+        project_ids = list(project_owners)
+
+        statuses = [c[0] for c in Task.STATUS_CHOICES]
+        priorities = [c[0] for c in Task.PRIORITY_CHOICES]
+        now = timezone.now()
+        Assignee = Task.assignees.through
+        TaskTag = Task.tags.through
+        remaining = options['tasks'] - existing
+        while remaining > 0:
+            n = min(batch_size, remaining)
+            tasks = []
+            for _ in range(n):
+                project_id = rng.choice(project_ids)
+                tasks.append(Task(
+                    title=f'Task {rng.randrange(10 ** 6)}', description='seeded', llm_context={},
+                    owner_id=project_owners[project_id], project_id=project_id,
+                    status=rng.choice(statuses), priority=rng.choice(priorities),
+                    due_date=now + timedelta(days=rng.randrange(-90, 180)) if rng.random() < 0.8 else None,
+                    deleted=rng.random() < 0.05,
+                ))
+            Task.objects.using(db).bulk_create(tasks)
+            Assignee.objects.using(db).bulk_create(
+                [Assignee(task_id=t.id, customuser_id=uid) for t in tasks
+                 for uid in rng.sample(user_ids, rng.randrange(0, 3))])
+            TaskTag.objects.using(db).bulk_create(
+                [TaskTag(task_id=t.id, tag_id=tid) for t in tasks for tid in rng.sample(tag_ids, rng.randrange(0, 3))])
+            remaining -= n
+        self.stdout.write(f"Seeded {options['tasks'] - existing} tasks in {time.perf_counter() - started:.1f}s")
+
+    def scenarios(self, viewer, staff):
+        project_id = Project.objects.using(BENCH_ALIAS).order_by('id').values_list('id', flat=True).first()
+        return [
+            ('staff, default ordering', staff, {}),
+            ('staff, status + due_date', staff, {'status': 'TODO', 'ordering': 'due_date'}),
+            ('staff, priority + -updated', staff, {'priority': 'HIGH', 'ordering': '-updated'}),
+            ('staff, project + status', staff, {'project': project_id, 'status': 'IN_PROGRESS'}),
+            ('staff, tag', staff, {'tag': 'tag1'}),
+            ('member, visibility + due_date', viewer, {'ordering': 'due_date'}),
+            ('member, mine + -updated', viewer, {'mine': 'true', 'ordering': '-updated'}),
+            ('member, assigned', viewer, {'assigned': viewer.id}),
+        ]
+
+    def task_queryset(self, user, params):
+        request = Request(RequestFactory().get('/api/tasks/', params))
+        request.user = user
+        view = TaskViewSet(request=request, action='list', format_kwarg=None, kwargs={})
+        return view.get_queryset().using(BENCH_ALIAS)
+
+    def report(self, label, scenarios):
+        with connections[BENCH_ALIAS].cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\n=== {label} ==="))
+        for name, user, params in scenarios:
+            qs = self.task_queryset(user, params)
+            started = time.perf_counter()
+            list(qs.values_list('id', flat=True)[:25])
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.stdout.write(self.style.SQL_KEYWORD(f"\n-- {name} {params} ({elapsed_ms:.1f} ms for first page)"))
+            self.stdout.write(qs[:25].explain())
+
+    def drop_indexes(self):
+        connection = connections[BENCH_ALIAS]
+        existing = connection.introspection.get_constraints(connection.cursor(), Task._meta.db_table)
+        with connection.schema_editor() as editor:
+            for index in Task._meta.indexes:
+                if index.name in existing:
+                    editor.remove_index(Task, index)
+        with connection.cursor() as cursor:
+            for name in THROUGH_TABLE_INDEXES:
+                cursor.execute(f'DROP INDEX IF EXISTS {name}')
+
+    def create_indexes(self):
+        connection = connections[BENCH_ALIAS]
+        with connection.schema_editor() as editor:
+            for index in Task._meta.indexes:
+                editor.add_index(Task, index)
+        with connection.cursor() as cursor:
+            for sql in THROUGH_TABLE_INDEXES.values():
+                cursor.execute(sql)
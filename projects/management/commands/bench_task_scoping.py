@@ -0,0 +1,120 @@
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Exists, OuterRef, Q
+
+from projects import scoping
+from projects.models import Task
+
+from .bench_task_indexes import BENCH_ALIAS, Command as IndexBenchCommand
+
+HEAVY_EMAIL = 'bench-heavy@example.com'
+
+
+def join_distinct(user, qs):
+    """The scoping this module replaced: join over assignees, then DISTINCT."""
+    return qs.filter(Q(owner=user) | Q(assignees=user)).distinct()
+
+
+def union_ids(user, qs):
+    owned = Task.all_objects.filter(owner_id=user.id).values('id')
+    assigned = Task.assignees.through.objects.filter(customuser_id=user.id).values('task_id')
+    return qs.filter(pk__in=owned.union(assigned, all=True))
+
+
+def correlated_exists(user, qs):
+    assigned = Task.assignees.through.objects.filter(task_id=OuterRef('pk'), customuser_id=user.id)
+    return qs.filter(Q(owner_id=user.id) | Exists(assigned))
+
+
+STRATEGIES = [
+    ('join + DISTINCT', join_distinct),
+    ('owner OR EXISTS', correlated_exists),
+    ('IN (owned UNION ALL assigned)', union_ids),
+    ('owner OR IN (projects.scoping)', scoping.visible_tasks),
+]
+
+
+class Command(BaseCommand):
+    help = ("Seed a scratch SQLite database with a user holding many assignments and time the task "
+            "visibility strategies (join + DISTINCT, EXISTS, UNION of id sets, projects.scoping) "
+            "for that user and for a lightly assigned one.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--db', help='Scratch SQLite file to use (reused if already seeded). '
+                                         'Defaults to a temporary file.')
+        parser.add_argument('--tasks', type=int, default=200_000)
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--projects', type=int, default=2_000)
+        parser.add_argument('--assignments', type=int, default=50_000,
+                            help='Tasks assigned to the benchmarked user.')
+        parser.add_argument('--batch-size', type=int, default=5_000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        path = options['db'] or str(Path(tempfile.mkdtemp()) / 'bench_scoping.sqlite3')
+        connections.settings[BENCH_ALIAS] = {**connections.settings['default'], 'NAME': path}
+        call_command('migrate', database=BENCH_ALIAS, verbosity=0)
+        self.stdout.write(f"Using scratch database {path}")
+
+        seeder = IndexBenchCommand(stdout=self.stdout, stderr=self.stderr)
+        seeder.seed(options)
+        user = self.seed_heavy_user(options)
+        with connections[BENCH_ALIAS].cursor() as cursor:
+            cursor.execute('ANALYZE')
+        User = get_user_model()
+        light = User.objects.using(BENCH_ALIAS).filter(is_staff=False).exclude(email=HEAVY_EMAIL).order_by('id').first()
+        for who in (user, light):
+            assigned = Task.assignees.through.objects.using(BENCH_ALIAS).filter(customuser_id=who.id).count()
+            self.stdout.write(self.style.MIGRATE_HEADING(f"\n##### {who.email}: {assigned} assignments #####"))
+            self.report(who, options)
+
+    def report(self, user, options):
+        base = Task.objects.using(BENCH_ALIAS)
+        scenarios = [
+            ('first page by due_date', lambda qs: list(qs.order_by('due_date', 'id')[:25].values_list('id', flat=True))),
+            ('first page, status=TODO by -updated',
+             lambda qs: list(qs.filter(status='TODO').order_by('-updated', 'id')[:25].values_list('id', flat=True))),
+            ('count', lambda qs: qs.count()),
+            ('all ids', lambda qs: len(qs.values_list('id', flat=True))),
+        ]
+        for name, run in scenarios:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"\n=== {name} ==="))
+            results = {}
+            for label, strategy in STRATEGIES:
+                qs = strategy(user, base)
+                timings = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    results[label] = run(qs)
+                    timings.append((time.perf_counter() - started) * 1000)
+                self.stdout.write(f"{label:<32} median {statistics.median(timings):8.1f} ms   "
+                                  f"min {min(timings):8.1f} ms")
+            if len({repr(r) for r in results.values()}) != 1:
+                self.stdout.write(self.style.ERROR(f"strategies disagree: {results}"))
+        self.stdout.write(self.style.MIGRATE_HEADING("\n=== plan (projects.scoping, first page) ==="))
+        self.stdout.write(scoping.visible_tasks(user, base).order_by('due_date', 'id')[:25].explain())
+
+    def seed_heavy_user(self, options):
+        User = get_user_model()
+        user, _ = User.objects.using(BENCH_ALIAS).get_or_create(email=HEAVY_EMAIL)
+        Assignee = Task.assignees.through
+        have = Assignee.objects.using(BENCH_ALIAS).filter(customuser_id=user.id).count()
+        if have >= options['assignments']:
+            self.stdout.write(f"Reusing {have} assignments of {HEAVY_EMAIL}")
+            return user
+        ids = list(Task.all_objects.using(BENCH_ALIAS).exclude(assignees=user).values_list('id', flat=True))
+        picked = random.Random(7).sample(ids, min(len(ids), options['assignments'] - have))
+        Assignee.objects.using(BENCH_ALIAS).bulk_create(
+            [Assignee(task_id=i, customuser_id=user.id) for i in picked], batch_size=options['batch_size'])
+        # a few owned tasks that are also assigned, the case that forced DISTINCT
+        Task.all_objects.using(BENCH_ALIAS).filter(id__in=picked[:500]).update(owner=user)
+        self.stdout.write(f"Assigned {len(picked)} tasks to {HEAVY_EMAIL}")
+        return user
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from projects import readmodel
+
+
+class Command(BaseCommand):
+    help = "Rebuild the denormalized TaskRow read model from the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if not readmodel.is_enabled():
+            self.stderr.write("TASK_ROW_READ_MODEL is off: rows will not be kept up to date until it is enabled.")
+        count = readmodel.rebuild(using=options['database'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} task rows"))
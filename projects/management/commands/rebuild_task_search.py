@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from projects import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the task full-text search index (SQLite FTS5) from the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        if not search.is_available(options['database']):
+            self.stderr.write("Full-text search table is not available on this database; nothing to do.")
+            return
+        count = search.rebuild(using=options['database'])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} tasks"))
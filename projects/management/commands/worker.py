@@ -0,0 +1,58 @@
+import os
+import signal
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from projects import jobs
+
+
+class Command(BaseCommand):
+    help = ("Run queued background jobs (projects.jobs) on a thread pool until stopped. "
+            "Run several for more throughput; jobs are leased, so workers never run the same one.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=settings.JOB_WORKER_THREADS,
+                            help='Jobs run at the same time by this worker.')
+        parser.add_argument('--poll', type=float, default=settings.JOB_POLL_INTERVAL,
+                            help='Seconds to wait before looking again when there is nothing to run.')
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty.')
+
+    def handle(self, *args, **options):
+        name = f'{socket.gethostname()}:{os.getpid()}'
+        stop = threading.Event()
+        handlers = {signum: signal.signal(signum, lambda *_: stop.set()) for signum in (signal.SIGINT, signal.SIGTERM)}
+        slots = threading.Semaphore(options['threads'])
+        ran = 0
+
+        def run(job, worker):
+            try:
+                jobs.run(job, worker)
+            finally:
+                slots.release()
+
+        self.stdout.write(f"Worker {name}: {options['threads']} threads")
+        with ThreadPoolExecutor(options['threads'], thread_name_prefix='job') as pool:
+            while not stop.is_set():
+                if not slots.acquire(timeout=options['poll']):
+                    continue
+                worker = f'{name}:{ran}'  # a lease owner per run
+                job = jobs.claim(worker)
+                close_old_connections()
+                if job is None:
+                    slots.release()
+                    if options['once']:
+                        break
+                    stop.wait(options['poll'])
+                    continue
+                ran += 1
+                self.stdout.write(f'Running {job}')
+                pool.submit(run, job, worker)
+        # leaving the pool waits for the jobs in progress
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+        self.stdout.write(self.style.SUCCESS(f'Worker {name} stopped after {ran} jobs'))
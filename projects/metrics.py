@@ -0,0 +1,233 @@
+"""
+In-process metrics, exposed in the Prometheus text format at ``/api/metrics`` (staff only).
+
+Counters and histograms are plain dicts behind a lock, recorded by:
+
+- ``QueryBudgetMiddleware``: request latency per view (``http_request_seconds``)
+- the agent tool wrapper (``projects.agent.concurrency``): calls and errors, latency and DB
+  queries per tool (``agent_tool_*``)
+- the chat views: agent runs and their duration (``agent_run*``)
+- ``MeteredModel`` (``projects.agent.llm``): LLM request latency and prompt / completion tokens
+
+With several worker processes (gunicorn), set ``METRICS_DIR`` to a directory the workers share:
+each process then writes a snapshot of its metrics there (at most every
+``METRICS_FLUSH_INTERVAL`` seconds, and at exit), and ``/api/metrics`` adds up the snapshots of
+all processes, like ``prometheus_client``'s multiprocess mode. Snapshots of exited processes
+keep counting; clear the directory when deploying.
+"""
+import atexit
+import bisect
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from rest_framework.renderers import BaseRenderer
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, registry, name, help_text, labelnames=()):
+        self.registry, self.name, self.help, self.labelnames = registry, name, help_text, tuple(labelnames)
+        self.values = {}  # label values tuple -> value
+        registry.metrics[name] = self
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        self.registry.changed()
+
+    @staticmethod
+    def merge(a, b):
+        return a + b
+
+    def samples(self, key, value):
+        yield self.name, key, value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(registry, name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            counts, total = self.values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[bisect.bisect_left(self.buckets, value)] += 1  # per bucket; cumulated when rendered
+            self.values[key] = (counts, total + value)
+        self.registry.changed()
+
+    @staticmethod
+    def merge(a, b):
+        return [x + y for x, y in zip(a[0], b[0])], a[1] + b[1]
+
+    def samples(self, key, value):
+        counts, total = value
+        cumulative = 0
+        for bound, count in zip((*self.buckets, math.inf), counts):
+            cumulative += count
+            yield f'{self.name}_bucket', (*key, _number(bound)), cumulative
+        yield f'{self.name}_sum', key, total
+        yield f'{self.name}_count', key, cumulative
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self._dirty = False
+        self._flushed = 0.0
+        self._file = None
+
+    def counter(self, name, help_text, labelnames=()):
+        return Counter(self, name, help_text, labelnames)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return Histogram(self, name, help_text, labelnames, buckets)
+
+    # multi-process snapshots
+
+    @property
+    def directory(self):
+        return getattr(settings, 'METRICS_DIR', None)
+
+    def changed(self):
+        self._dirty = True
+        if self.directory and time.monotonic() - self._flushed >= getattr(settings, 'METRICS_FLUSH_INTERVAL', 1):
+            self.flush()
+
+    def snapshot(self) -> str:
+        """This process's metrics as JSON: {name: [[label values, value], ...]}."""
+        with self.lock:
+            return json.dumps({name: [[list(key), value] for key, value in metric.values.items()]
+                               for name, metric in self.metrics.items()})
+
+    def flush(self):
+        """Write this process's snapshot to ``METRICS_DIR`` (atomically; one file per process)."""
+        directory = self.directory
+        if not directory or not self._dirty:
+            return
+        self._dirty, self._flushed = False, time.monotonic()
+        if self._file is None:
+            # pids get reused across restarts; the suffix keeps an old process's file from being overwritten
+            self._file = f'{os.getpid()}-{uuid.uuid4().hex[:8]}.json'
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile('w', dir=directory, suffix='.tmp', delete=False) as f:
+            f.write(self.snapshot())
+        os.replace(f.name, Path(directory) / self._file)
+
+    def collect(self):
+        """name -> {label values: value}, added up over all processes when ``METRICS_DIR`` is set."""
+        if self.directory:
+            self._dirty = True
+            self.flush()
+            snapshots = []
+            for path in sorted(Path(self.directory).glob('*.json')):
+                try:
+                    snapshots.append(json.loads(path.read_text()))
+                except (OSError, ValueError):  # being replaced
+                    continue
+        else:
+            snapshots = [json.loads(self.snapshot())]
+        merged = {name: {} for name in self.metrics}
+        for snapshot in snapshots:
+            for name, entries in snapshot.items():
+                metric = self.metrics.get(name)
+                if metric is None:
+                    continue
+                for key, value in entries:
+                    key = tuple(key)
+                    previous = merged[name].get(key)
+                    merged[name][key] = value if previous is None else metric.merge(previous, value)
+        return merged
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for name, values in self.collect().items():
+            metric = self.metrics[name]
+            lines += [f'# HELP {name} {metric.help}', f'# TYPE {name} {metric.kind}']
+            labelnames = metric.labelnames + (('le',) if metric.kind == 'histogram' else ())
+            for key in sorted(values):
+                for sample, sample_key, value in metric.samples(key, values[key]):
+                    labels = ','.join(f'{label}="{_escape(v)}"' for label, v in zip(labelnames, sample_key))
+                    lines.append(f'{sample}{{{labels}}} {_number(value)}' if labels else f'{sample} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+atexit.register(registry.flush)
+
+HTTP_REQUEST_SECONDS = registry.histogram(
+    'http_request_seconds', 'Request latency per view.', ('view', 'method', 'status'))
+AGENT_RUNS = registry.counter(
+    'agent_runs_total', 'Agent runs by outcome (ok, error, rejected by the chat limiter, cached answer).',
+    ('agent', 'outcome'))
+AGENT_RUN_SECONDS = registry.histogram(
+    'agent_run_seconds', 'Duration of agent runs, tools and model requests included.', ('agent',), LLM_BUCKETS)
+LLM_REQUEST_SECONDS = registry.histogram(
+    'llm_request_seconds', 'Latency of model requests (until the whole response streamed in).', ('model',),
+    LLM_BUCKETS)
+LLM_PROMPT_TOKENS = registry.counter('llm_prompt_tokens_total', 'Prompt (input) tokens sent.', ('model',))
+LLM_COMPLETION_TOKENS = registry.counter(
+    'llm_completion_tokens_total', 'Completion (output) tokens received.', ('model',))
+TOOL_CALLS = registry.counter('agent_tool_calls_total', 'Agent tool calls by outcome (ok, error).', ('tool', 'outcome'))
+TOOL_SECONDS = registry.histogram('agent_tool_seconds', 'Agent tool call latency.', ('tool',))
+TOOL_QUERIES = registry.histogram('agent_tool_queries', 'DB queries per agent tool call.', ('tool',), QUERY_BUCKETS)
+
+
+class observe_run:
+    """Context manager recording an agent run: ``with observe_run('chat'): await agent.run(...)``."""
+
+    def __init__(self, agent):
+        self.agent = agent
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        AGENT_RUNS.inc(agent=self.agent, outcome='ok' if exc_type is None else 'error')
+        AGENT_RUN_SECONDS.observe(time.perf_counter() - self.started, agent=self.agent)
+        return False
+
+
+class PrometheusRenderer(BaseRenderer):
+    """``registry.render()`` output as is; other data (errors) as JSON."""
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data if isinstance(data, str) else json.dumps(data)
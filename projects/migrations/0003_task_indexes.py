@@ -0,0 +1,49 @@
+# Generated by Django 5.2.6 on 2026-10-17 03:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0002_comment_deleted_project_deleted_task_deleted'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('deleted', False)), fields=['status', 'due_date', 'id'], name='task_live_status_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('deleted', False)), fields=['priority', 'due_date', 'id'], name='task_live_priority_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('deleted', False)), fields=['project', 'status', 'id'], name='task_live_project_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('deleted', False)), fields=['owner', 'updated', 'id'], name='task_live_owner_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('deleted', False)), fields=['due_date', 'id'], name='task_live_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('deleted', False)), fields=['updated', 'id'], name='task_live_updated_idx'),
+        ),
+        # The auto-created through tables only index (task_id, <other>_id); the permission filter
+        # (assignees=user) and the tag filter look tasks up from the other side.
+        migrations.RunSQL(
+            sql='CREATE INDEX task_assignees_user_task_idx ON projects_task_assignees (customuser_id, task_id)',
+            reverse_sql='DROP INDEX task_assignees_user_task_idx',
+        ),
+        migrations.RunSQL(
+            sql='CREATE INDEX task_tags_tag_task_idx ON projects_task_tags (tag_id, task_id)',
+            reverse_sql='DROP INDEX task_tags_tag_task_idx',
+        ),
+    ]
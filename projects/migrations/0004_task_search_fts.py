@@ -0,0 +1,44 @@
+from django.db import migrations
+
+
+CREATE_SQL = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS projects_task_fts
+    USING fts5(title, description, tags, project, comments, tokenize = 'porter unicode61 remove_diacritics 2')
+"""
+
+BACKFILL_SQL = """
+    INSERT INTO projects_task_fts (rowid, title, description, tags, project, comments)
+    SELECT t.id, t.title, t.description,
+           COALESCE((SELECT group_concat(g.name, ' ') FROM projects_task_tags tt
+                     JOIN projects_tag g ON g.id = tt.tag_id WHERE tt.task_id = t.id), ''),
+           COALESCE(p.title, ''),
+           COALESCE((SELECT group_concat(c.title || ' ' || c.description, ' ') FROM projects_comment c
+                     WHERE c.task_id = t.id AND c.deleted = 0), '')
+    FROM projects_task t LEFT JOIN projects_project p ON p.id = t.project_id
+    WHERE t.deleted = 0
+"""
+
+
+def create_fts_table(apps, schema_editor):
+    # FTS5 is SQLite-only; other backends keep using the icontains fallback in projects.search
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREATE_SQL)
+    schema_editor.execute(BACKFILL_SQL)
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS projects_task_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0003_task_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.6 on 2026-10-17 03:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0004_task_search_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskRow',
+            fields=[
+                ('task', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='row', serialize=False, to='projects.task')),
+                ('title', models.CharField(max_length=255)),
+                ('status', models.CharField(max_length=11)),
+                ('priority', models.CharField(max_length=6)),
+                ('due_date', models.DateTimeField(blank=True, null=True)),
+                ('estimated_hours', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('created', models.DateTimeField()),
+                ('updated', models.DateTimeField()),
+                ('project_id', models.BigIntegerField()),
+                ('project_title', models.CharField(max_length=255)),
+                ('owner_id', models.BigIntegerField()),
+                ('owner_email', models.EmailField(max_length=254)),
+                ('assignee_ids', models.JSONField(default=list)),
+                ('assignee_emails', models.JSONField(default=list)),
+                ('tag_ids', models.JSONField(default=list)),
+                ('tag_names', models.JSONField(default=list)),
+                ('comment_count', models.PositiveIntegerField(default=0)),
+                ('last_comment_at', models.DateTimeField(blank=True, null=True)),
+                ('sort_key', models.CharField(db_index=True, max_length=64)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner_id', 'sort_key'], name='taskrow_owner_sort_idx'), models.Index(fields=['project_id', 'sort_key'], name='taskrow_project_sort_idx'), models.Index(fields=['status', 'sort_key'], name='taskrow_status_sort_idx')],
+            },
+        ),
+    ]
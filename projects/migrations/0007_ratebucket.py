@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0006_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateBucket',
+            fields=[
+                ('key', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('requests', models.FloatField()),
+                ('tokens', models.FloatField()),
+                ('updated', models.FloatField(help_text='time.time() of the last refill')),
+            ],
+        ),
+    ]
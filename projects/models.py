@@ -1,16 +1,30 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.contrib.auth import get_user_model
 
 
-class SoftDeleteManager(models.Manager):
+class SoftDeleteQuerySet(models.QuerySet):
+
+    def with_related(self):
+        """
+        Apply the model's eager-loading profile: ``select_related_list`` joins and
+        ``prefetch_related_list`` batch lookups (many-to-many relations).
+        """
+        qs = self
+        select_related_list = getattr(self.model, 'select_related_list', [])
+        if select_related_list:
+            qs = qs.select_related(*select_related_list)
+        prefetch_related_list = getattr(self.model, 'prefetch_related_list', [])
+        if prefetch_related_list:
+            qs = qs.prefetch_related(*prefetch_related_list)
+        return qs
+
 
-    select_related_list = []
+class SoftDeleteManager(models.Manager.from_queryset(SoftDeleteQuerySet)):
+    """Live rows only. No joins by default: callers that render relations opt in with ``with_related()``."""
 
     def get_queryset(self):
-        qs = super().get_queryset().filter(deleted=False)
-        if self.select_related_list:
-            qs = qs.select_related(*self.select_related_list)
-        return qs
+        return super().get_queryset().filter(deleted=False)
 
     def delete(self, *args, **kwargs):
         self.update(deleted=True)
@@ -30,7 +44,9 @@ class TimeStampedNameDescriptonOwnerModel(models.Model):
     deleted = models.BooleanField(default=False)
     objects = SoftDeleteManager()
     all_objects = models.Manager()
+    # Eager-loading profile applied by with_related(): joins and prefetches
     select_related_list = ['owner']
+    prefetch_related_list = []
 
     def __str__(self):
         return self.title
@@ -51,6 +67,7 @@ class Project(TimeStampedNameDescriptonOwnerModel):
                                     help_text='Enter a deadline date (YYYY-MM-DD)')
     category = models.CharField(max_length=100, blank=True)
     tags = models.ManyToManyField('Tag', blank=True)
+    prefetch_related_list = ['tags']
 
 
 class Task(TimeStampedNameDescriptonOwnerModel):
@@ -78,7 +95,27 @@ class Task(TimeStampedNameDescriptonOwnerModel):
     due_date = models.DateTimeField(blank=True, null=True)
     estimated_hours = models.DecimalField(max_digits=5, decimal_places=2, blank=True, null=True)
     tags = models.ManyToManyField('Tag', blank=True)
-    select_related_list = ['project', 'project__owner']
+    select_related_list = ['owner', 'project', 'project__owner']
+    prefetch_related_list = ['assignees', 'tags', 'project__tags']
+
+    class Meta:
+        # Partial indexes over live rows, matching TaskViewSet's filter + ordering combinations.
+        # The trailing id makes each index usable for the id tiebreaker as well.
+        indexes = [
+            models.Index(fields=['status', 'due_date', 'id'], name='task_live_status_due_idx',
+                         condition=models.Q(deleted=False)),
+            models.Index(fields=['priority', 'due_date', 'id'], name='task_live_priority_due_idx',
+                         condition=models.Q(deleted=False)),
+            models.Index(fields=['project', 'status', 'id'], name='task_live_project_status_idx',
+                         condition=models.Q(deleted=False)),
+            models.Index(fields=['owner', 'updated', 'id'], name='task_live_owner_updated_idx',
+                         condition=models.Q(deleted=False)),
+            models.Index(fields=['due_date', 'id'], name='task_live_due_idx',
+                         condition=models.Q(deleted=False)),
+            models.Index(fields=['updated', 'id'], name='task_live_updated_idx',
+                         condition=models.Q(deleted=False)),
+        ]
+
 
 class Tag(models.Model):
     """
@@ -96,4 +133,107 @@ class Comment(TimeStampedNameDescriptonOwnerModel):
     Comment model. Comments can be attached to tasks.
     """
     task = models.ForeignKey(Task, on_delete=models.CASCADE)
-    select_related_list = ['task', 'task__project', 'task__project__owner']
+    select_related_list = ['owner', 'task', 'task__project', 'task__project__owner']
+
+
+class TaskRow(models.Model):
+    """
+    Denormalized read model: one row per live task with everything a task table shows.
+    Maintained incrementally by projects.signals when settings.TASK_ROW_READ_MODEL is on;
+    rebuild it with ``manage.py rebuild_task_rows``.
+    """
+    task = models.OneToOneField(Task, on_delete=models.CASCADE, primary_key=True, related_name='row')
+    title = models.CharField(max_length=255)
+    status = models.CharField(max_length=11)
+    priority = models.CharField(max_length=6)
+    due_date = models.DateTimeField(blank=True, null=True)
+    estimated_hours = models.DecimalField(max_digits=5, decimal_places=2, blank=True, null=True)
+    created = models.DateTimeField()
+    updated = models.DateTimeField()
+    project_id = models.BigIntegerField()
+    project_title = models.CharField(max_length=255)
+    owner_id = models.BigIntegerField()
+    owner_email = models.EmailField()
+    assignee_ids = models.JSONField(default=list)
+    assignee_emails = models.JSONField(default=list)
+    tag_ids = models.JSONField(default=list)
+    tag_names = models.JSONField(default=list)
+    comment_count = models.PositiveIntegerField(default=0)
+    last_comment_at = models.DateTimeField(blank=True, null=True)
+    # priority (most urgent first), then due date (missing last), then id
+    sort_key = models.CharField(max_length=64, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['owner_id', 'sort_key'], name='taskrow_owner_sort_idx'),
+            models.Index(fields=['project_id', 'sort_key'], name='taskrow_project_sort_idx'),
+            models.Index(fields=['status', 'sort_key'], name='taskrow_status_sort_idx'),
+        ]
+
+    def __str__(self):
+        return self.title
+
+
+class Job(models.Model):
+    """
+    A background agent run, queued by ``POST /api/agent/chat`` in async mode and run by
+    ``manage.py worker`` (see projects.jobs). A running job is leased to one worker until
+    ``lease_expires``; the worker renews the lease while it works, so a job whose lease ran out
+    lost its worker and is picked up again, up to ``max_attempts`` times.
+    """
+    STATUS_CHOICES = [
+        ('QUEUED', 'Queued'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    ]
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, related_name='jobs')
+    kind = models.CharField(max_length=20, default='chat')
+    payload = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default='QUEUED')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    lease_owner = models.CharField(max_length=100, blank=True)
+    lease_expires = models.DateTimeField(blank=True, null=True)
+    # progress: [{"event", "data"}, ...] in the shape of the chat stream's events
+    events = models.JSONField(default=list, encoder=DjangoJSONEncoder)
+    result = models.JSONField(blank=True, null=True, encoder=DjangoJSONEncoder)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(blank=True, null=True)
+    finished = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created', 'id'], name='job_status_created_idx'),
+            models.Index(fields=['user', 'status'], name='job_user_status_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} job {self.id} ({self.status})'
+
+
+class RateBucket(models.Model):
+    """
+    Token bucket levels of projects.agent.ratelimit, one row per scope ("user:<id>", "global").
+    Kept in the database so every worker process draws from the same buckets.
+    """
+    key = models.CharField(max_length=100, primary_key=True)
+    requests = models.FloatField()
+    tokens = models.FloatField()
+    updated = models.FloatField(help_text='time.time() of the last refill')
+
+    def __str__(self):
+        return self.key
+
+
+class DataVersion(models.Model):
+    """
+    Counters bumped by every write to the data they cover (projects.versions): "user:<id>" for
+    what that user can see, "shared" for data everyone sees (tags) and "all" for any write.
+    """
+    key = models.CharField(max_length=100, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.key}@{self.version}'
@@ -0,0 +1,183 @@
+"""
+Pagination for the task and comment lists.
+
+Page-number pagination stays the default. Clients opt into keyset (cursor) pagination
+per request with ``?paginate=cursor`` (or by sending a ``cursor``). Keyset pages follow
+whatever ordering the view applied, with the primary key as a stable tiebreaker, never run
+``COUNT(*)`` and never ``OFFSET``, so deep pages cost the same as the first one and
+rows inserted meanwhile do not shift the position.
+"""
+import base64
+import json
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 200
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.field, self.descending = self.get_ordering(queryset)
+        self.ordering = f"{'-' if self.descending else ''}{self.field}"
+
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor['r'])
+        # traversing "backwards" is the same query with every direction flipped
+        descending = self.descending != reverse
+        qs = queryset.order_by(*self.order_expressions(descending))
+        if cursor:
+            qs = qs.filter(self.position_filter(cursor['v'], cursor['i'], descending))
+
+        rows = list(qs[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_ordering(self, queryset):
+        """The (field, descending) the view ordered by; anything else falls back to the primary key."""
+        self.model = queryset.model
+        order_by = queryset.query.order_by
+        raw = order_by[0] if order_by and isinstance(order_by[0], str) else 'pk'
+        descending = raw.startswith('-')
+        field = raw.lstrip('-')
+        pk = self.model._meta.pk
+        self.annotated = self.nullable = False
+        if field in ('pk', pk.name, pk.attname):  # e.g. TaskRow's key is task_id, and it has no id
+            return 'pk', descending
+        self.annotated = field in queryset.query.annotations
+        if self.annotated:
+            self.nullable = True
+            return field, descending
+        try:
+            self.nullable = self.model._meta.get_field(field).null
+        except FieldDoesNotExist:
+            self.nullable = False
+            return 'pk', False
+        return field, descending
+
+    def order_expressions(self, descending):
+        if self.field == 'pk':
+            return ['-pk' if descending else 'pk']
+        # NULLs sort after every value ascending and before them descending, on every backend
+        if descending:
+            return [F(self.field).desc(nulls_first=True), '-pk']
+        return [F(self.field).asc(nulls_last=True), 'pk']
+
+    def position_filter(self, value, pk, descending):
+        f = self.field
+        if f == 'pk':
+            return Q(pk__lt=pk) if descending else Q(pk__gt=pk)
+        if descending:
+            if value is None:
+                return Q(**{f'{f}__isnull': True, 'pk__lt': pk}) | Q(**{f'{f}__isnull': False})
+            return Q(**{f'{f}__lt': value}) | Q(**{f: value, 'pk__lt': pk})
+        if value is None:
+            return Q(**{f'{f}__isnull': True, 'pk__gt': pk})
+        after = Q(**{f'{f}__gt': value}) | Q(**{f: value, 'pk__gt': pk})
+        return after | Q(**{f'{f}__isnull': True}) if self.nullable else after
+
+    # Cursors are opaque base64 JSON: ordering, position value, tiebreaker id, direction
+
+    def encode_cursor(self, obj, reverse):
+        value = getattr(obj, self.field)
+        if isinstance(value, (datetime, date)):
+            value = value.isoformat()
+        elif isinstance(value, Decimal):
+            value = str(value)
+        payload = json.dumps({'o': self.ordering, 'v': value, 'i': obj.pk, 'r': int(reverse)}, separators=(',', ':'))
+        encoded = base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)))
+            if payload['o'] != self.ordering or not isinstance(payload['i'], int):
+                raise ValueError('cursor does not match the requested ordering')
+            value = payload['v']
+            if value is not None and not self.annotated and self.field != 'pk':
+                value = self.model._meta.get_field(self.field).to_python(value)
+            return {'v': value, 'i': payload['i'], 'r': bool(payload.get('r'))}
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+
+class PageNumberOrKeysetPagination(BasePagination):
+    """Page-number pagination unless the request opts into keyset pagination."""
+    mode_query_param = 'paginate'
+
+    def __init__(self):
+        self.paginator = PageNumberPagination()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if (request.query_params.get(self.mode_query_param) == 'cursor'
+                or KeysetPagination.cursor_query_param in request.query_params):
+            self.paginator = KeysetPagination()
+        return self.paginator.paginate_queryset(queryset, request, view=view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.paginator.get_paginated_response_schema(schema)
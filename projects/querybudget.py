@@ -0,0 +1,179 @@
+"""
+Query instrumentation for HTTP requests and agent tool calls.
+
+``track_queries`` records every SQL statement run on the current thread's connections
+(count, total time, and a fingerprint per statement shape so repeated shapes - the
+N+1 pattern - stand out). ``QueryBudgetMiddleware`` wraps each request in it, adds
+``X-Query-Count`` and ``Server-Timing`` headers, and logs one structured line to the
+``projects.queries`` logger. Views may declare ``query_budget`` (an int, or a dict keyed
+by viewset action); with ``settings.QUERY_BUDGET_STRICT`` on, exceeding it raises
+``QueryBudgetExceeded`` so the offending test fails.
+"""
+import functools
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from . import metrics
+
+logger = logging.getLogger('projects.queries')
+
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACES = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def fingerprint(sql: str) -> str:
+    """Statement shape: literals and IN-list lengths stripped, whitespace collapsed."""
+    sql = _IN_LIST.sub('IN (...)', sql)
+    sql = _LITERALS.sub('?', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+class QueryStats:
+    def __init__(self, label: str):
+        self.label = label
+        self.count = 0
+        self.db_ms = 0.0
+        self.fingerprints = Counter()
+        self.started = time.perf_counter()
+        self.elapsed_ms = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_ms += (time.perf_counter() - started) * 1000
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def repeated(self, threshold=None):
+        """Statement shapes run at least ``threshold`` times (settings.QUERY_REPEAT_THRESHOLD)."""
+        if threshold is None:
+            threshold = getattr(settings, 'QUERY_REPEAT_THRESHOLD', 5)
+        return {sql: n for sql, n in self.fingerprints.most_common() if n >= threshold}
+
+    def as_dict(self):
+        return {
+            'label': self.label,
+            'queries': self.count,
+            'db_ms': round(self.db_ms, 2),
+            'elapsed_ms': round(self.elapsed_ms, 2),
+            'repeated': self.repeated(),
+        }
+
+    def log(self, **extra):
+        payload = {**self.as_dict(), **extra}
+        level = logging.WARNING if payload['repeated'] or payload.get('over_budget') else logging.INFO
+        logger.log(level, json.dumps(payload, default=str), extra={'query_stats': payload})
+
+
+@contextmanager
+def track_queries(label: str, log: bool = False):
+    """Record the queries run inside the block on this thread; yields the QueryStats."""
+    stats = QueryStats(label)
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(stats))
+        try:
+            yield stats
+        finally:
+            stats.elapsed_ms = (time.perf_counter() - stats.started) * 1000
+            if log:
+                stats.log()
+
+
+def tracked(label: str):
+    """Decorator form of ``track_queries`` that logs each call."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with track_queries(label, log=True):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def budget_for(view_func, method: str):
+    """The ``query_budget`` a view declares for this request, or None."""
+    view_class = getattr(view_func, 'cls', None)
+    budget = getattr(view_class, 'query_budget', None)
+    if isinstance(budget, dict):
+        actions = getattr(view_func, 'actions', None) or {}
+        budget = budget.get(actions.get(method.lower(), method.lower()))
+    return budget
+
+
+class QueryBudgetMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with track_queries(f'{request.method} {request.path}') as stats:
+            request._query_stats = stats
+            response = self.get_response(request)
+        return self.finish(request, stats, response)
+
+    async def __acall__(self, request):
+        # the ORM work of an async request runs in its thread-sensitive sync_to_async thread,
+        # so the wrappers go on that thread's connections (agent tools are tracked per call)
+        tracker = track_queries(f'{request.method} {request.path}')
+        request._query_stats = stats = await sync_to_async(tracker.__enter__)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(tracker.__exit__)(None, None, None)
+        return self.finish(request, stats, response)
+
+    def finish(self, request, stats, response):
+        view_queries = stats.count - getattr(request, '_queries_before_view', 0)
+        budget = getattr(request, '_query_budget', None)
+        over_budget = budget is not None and view_queries > budget
+
+        view = getattr(request, '_query_view', None) or self.route(request)
+        metrics.HTTP_REQUEST_SECONDS.observe(stats.elapsed_ms / 1000, view=view, method=request.method,
+                                             status=response.status_code)
+
+        response['X-Query-Count'] = str(stats.count)
+        response['Server-Timing'] = (f'db;dur={stats.db_ms:.2f};desc="{stats.count} queries", '
+                                     f'total;dur={stats.elapsed_ms:.2f}')
+        stats.log(status=response.status_code, view=getattr(request, '_query_view', None),
+                  view_queries=view_queries, budget=budget, over_budget=over_budget)
+        if over_budget and getattr(settings, 'QUERY_BUDGET_STRICT', False):
+            raise QueryBudgetExceeded(
+                f'{request.method} {request.path} ran {view_queries} queries, budget is {budget}:\n'
+                + '\n'.join(f'{n}x {sql}' for sql, n in stats.fingerprints.most_common(5)))
+        return response
+
+    @staticmethod
+    def route(request):
+        match = getattr(request, 'resolver_match', None)
+        return match.view_name if match else 'unmatched'
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+        request._query_view = f'{view_class.__module__}.{view_class.__name__}' if view_class else None
+        request._query_budget = budget_for(view_func, request.method)
+        # budgets cover the view itself (authentication included), not earlier middleware
+        stats = getattr(request, '_query_stats', None)
+        request._queries_before_view = stats.count if stats else 0
+        return None
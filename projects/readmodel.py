@@ -0,0 +1,103 @@
+"""
+Incremental maintenance of the denormalized TaskRow read model.
+
+``refresh_task_rows`` recomputes the rows of a batch of tasks with a fixed number of
+queries and upserts them; tasks that are deleted (soft or hard) lose their row. It is
+called from ``projects.signals`` on every write that affects what a row shows, when
+``settings.TASK_ROW_READ_MODEL`` is enabled.
+"""
+from collections import defaultdict
+from typing import Iterable
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+from .models import Task, Comment, TaskRow
+
+PRIORITY_RANK = {'URGENT': 0, 'HIGH': 1, 'MEDIUM': 2, 'LOW': 3}
+
+ROW_FIELDS = [
+    'title', 'status', 'priority', 'due_date', 'estimated_hours', 'created', 'updated',
+    'project_id', 'project_title', 'owner_id', 'owner_email', 'assignee_ids', 'assignee_emails',
+    'tag_ids', 'tag_names', 'comment_count', 'last_comment_at', 'sort_key',
+]
+
+
+def is_enabled() -> bool:
+    return getattr(settings, 'TASK_ROW_READ_MODEL', False)
+
+
+def sort_key(task) -> str:
+    due = task.due_date.strftime('%Y%m%d%H%M%S') if task.due_date else '99999999999999'
+    return f"{PRIORITY_RANK.get(task.priority, 9)}{due}{task.id:012d}"
+
+
+def build_rows(task_ids, using='default'):
+    """TaskRow instances (unsaved) for the live tasks among ``task_ids``."""
+    tasks = list(Task.objects.using(using).filter(id__in=task_ids)
+                 .select_related('owner', 'project'))
+    ids = [t.id for t in tasks]
+
+    assignees = defaultdict(list)
+    rows = (Task.assignees.through.objects.using(using).filter(task_id__in=ids)
+            .order_by('task_id', 'customuser_id').values_list('task_id', 'customuser_id', 'customuser__email'))
+    for task_id, user_id, email in rows:
+        assignees[task_id].append((user_id, email))
+
+    tags = defaultdict(list)
+    rows = (Task.tags.through.objects.using(using).filter(task_id__in=ids)
+            .order_by('task_id', 'tag__name').values_list('task_id', 'tag_id', 'tag__name'))
+    for task_id, tag_id, name in rows:
+        tags[task_id].append((tag_id, name))
+
+    comments = {
+        row['task_id']: row for row in
+        Comment.objects.using(using).filter(task_id__in=ids).order_by()
+        .values('task_id').annotate(count=Count('id'), last=Max('created'))
+    }
+
+    result = []
+    for t in tasks:
+        stats = comments.get(t.id, {})
+        result.append(TaskRow(
+            task_id=t.id, title=t.title, status=t.status, priority=t.priority, due_date=t.due_date,
+            estimated_hours=t.estimated_hours, created=t.created, updated=t.updated,
+            project_id=t.project_id, project_title=t.project.title,
+            owner_id=t.owner_id, owner_email=t.owner.email,
+            assignee_ids=[a[0] for a in assignees[t.id]], assignee_emails=[a[1] for a in assignees[t.id]],
+            tag_ids=[g[0] for g in tags[t.id]], tag_names=[g[1] for g in tags[t.id]],
+            comment_count=stats.get('count', 0), last_comment_at=stats.get('last'),
+            sort_key=sort_key(t),
+        ))
+    return result
+
+
+def refresh_task_rows(task_ids: Iterable[int], using: str = 'default', force: bool = False) -> None:
+    """Recompute (or drop) the read-model rows of the given tasks."""
+    if not (force or is_enabled()):
+        return
+    ids = sorted({int(i) for i in task_ids if i is not None})
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        rows = build_rows(chunk, using=using)
+        live = {r.task_id for r in rows}
+        TaskRow.objects.using(using).filter(task_id__in=set(chunk) - live).delete()
+        TaskRow.objects.using(using).bulk_create(rows, update_conflicts=True, unique_fields=['task'],
+                                                 update_fields=ROW_FIELDS)
+
+
+def user_task_ids(user_id, using='default'):
+    """Tasks whose rows show this user (as owner or assignee)."""
+    owned = Task.objects.using(using).filter(owner_id=user_id).values_list('id', flat=True)
+    assigned = Task.assignees.through.objects.using(using).filter(customuser_id=user_id)
+    return set(owned) | set(assigned.values_list('task_id', flat=True))
+
+
+def rebuild(using: str = 'default', batch_size: int = 2000) -> int:
+    """Rebuild the whole read model. Returns the number of rows."""
+    TaskRow.objects.using(using).all().delete()
+    ids = list(Task.objects.using(using).order_by('id').values_list('id', flat=True))
+    for start in range(0, len(ids), batch_size):
+        TaskRow.objects.using(using).bulk_create(build_rows(ids[start:start + batch_size], using=using))
+    return TaskRow.objects.using(using).count()
+
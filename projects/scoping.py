@@ -0,0 +1,69 @@
+"""
+Row-level visibility for the projects API and the agent tools.
+
+Staff see everything. Other users see the tasks they own or are assigned to, and only
+their own projects and comments in listings. Tasks are scoped with
+``owner_id = :user OR id IN (SELECT task_id FROM assignees WHERE customuser_id = :user)``:
+both halves are index lookups, and unlike a join over ``assignees`` the result never
+repeats a row, so no ``DISTINCT`` is needed. ``bench_task_scoping`` compares it with the
+join, a correlated ``EXISTS`` and an ``IN (... UNION ALL ...)`` id set.
+"""
+from typing import Any, Optional
+
+from django.db.models import Q, QuerySet
+
+from .models import Task
+
+
+def is_unrestricted(user: Any) -> bool:
+    return bool(getattr(user, 'is_staff', False))
+
+
+def assigned_task_ids(user: Any) -> QuerySet:
+    """Subquery of the ids of the tasks ``user`` is assigned to (served by the (user, task) index)."""
+    return Task.assignees.through.objects.filter(customuser_id=user.id).values('task_id')
+
+
+def task_visibility(user: Any, column: str = 'pk', include_assigned: bool = True) -> Q:
+    """Filter for tasks ``user`` owns or (optionally) is assigned to; ``column`` holds the task id."""
+    condition = Q(owner_id=user.id)
+    if include_assigned:
+        condition |= Q(**{f'{column}__in': assigned_task_ids(user)})
+    return condition
+
+
+def visible_tasks(user: Any, qs: Optional[QuerySet] = None, include_assigned: bool = True) -> QuerySet:
+    """Tasks ``user`` may see, as a duplicate-free restriction of ``qs`` (default: all live tasks)."""
+    qs = Task.objects.all() if qs is None else qs
+    if is_unrestricted(user):
+        return qs
+    return qs.filter(task_visibility(user, include_assigned=include_assigned))
+
+
+def visible_task_rows(user: Any, qs: QuerySet) -> QuerySet:
+    """``visible_tasks`` for the TaskRow read model."""
+    if is_unrestricted(user):
+        return qs
+    return qs.filter(task_visibility(user, column='task_id'))
+
+
+def can_view_task(user: Any, task: Task) -> bool:
+    if is_unrestricted(user) or task.owner_id == getattr(user, 'id', None):
+        return True
+    return Task.assignees.through.objects.filter(task_id=task.id, customuser_id=user.id).exists()
+
+
+def owned(user: Any, qs: QuerySet) -> QuerySet:
+    """Restrict an owner-scoped listing (projects, comments) to ``user``'s rows."""
+    if is_unrestricted(user):
+        return qs
+    return qs.filter(owner_id=user.id)
+
+
+def scope(user: Any, qs: QuerySet) -> QuerySet:
+    """Apply the visibility rule of ``qs.model``: tasks by ownership/assignment, else by owner."""
+    if qs.model is Task:
+        return visible_tasks(user, qs)
+    if any(f.name == 'owner' for f in qs.model._meta.get_fields()):
+        return owned(user, qs)
+    return qs
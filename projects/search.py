@@ -0,0 +1,141 @@
+"""
+Full-text search over tasks, backed by an SQLite FTS5 virtual table.
+
+Each live task has one row in ``projects_task_fts`` (rowid = task id) holding its own
+title/description plus the text it should be found by: its tag names, its project's
+title and the titles/descriptions of its live comments. ``projects.signals`` keeps the
+table in sync with Task, Project, Tag and Comment writes, soft deletes included.
+
+On databases without FTS5 the search falls back to the original ``icontains`` filters.
+"""
+import re
+from typing import Iterable, List, Optional
+
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'projects_task_fts'
+
+# Column weights for bm25(): title, description, tags, project, comments
+BM25_WEIGHTS = (10.0, 1.0, 5.0, 3.0, 1.0)
+
+_DOCUMENTS_SQL = f"""
+    INSERT INTO {FTS_TABLE} (rowid, title, description, tags, project, comments)
+    SELECT t.id, t.title, t.description,
+           COALESCE((SELECT group_concat(g.name, ' ') FROM projects_task_tags tt
+                     JOIN projects_tag g ON g.id = tt.tag_id WHERE tt.task_id = t.id), ''),
+           COALESCE(p.title, ''),
+           COALESCE((SELECT group_concat(c.title || ' ' || c.description, ' ') FROM projects_comment c
+                     WHERE c.task_id = t.id AND c.deleted = 0), '')
+    FROM projects_task t LEFT JOIN projects_project p ON p.id = t.project_id
+    WHERE t.deleted = 0
+"""
+
+_available = set()
+
+
+def is_available(using: str = 'default') -> bool:
+    """True when the FTS5 table exists on the given database."""
+    if using in _available:
+        return True
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        if FTS_TABLE not in connection.introspection.table_names(cursor):
+            return False
+    _available.add(using)
+    return True
+
+
+def build_match_expression(q: str) -> Optional[str]:
+    """
+    Turn free user input into a safe FTS5 query: every word becomes a quoted prefix
+    term and all terms must match. Returns None when the input has no searchable words.
+    """
+    words = re.findall(r'\w+', q or '')
+    if not words:
+        return None
+    return ' '.join(f'"{w}"*' for w in words)
+
+
+def _chunks(ids: List[int], size: int = 500):
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+def index_tasks(task_ids: Iterable[int], using: str = 'default') -> None:
+    """(Re)build the search rows of the given tasks; deleted tasks simply drop out."""
+    ids = sorted({int(i) for i in task_ids if i is not None})
+    if not ids or not is_available(using):
+        return
+    with connections[using].cursor() as cursor:
+        for chunk in _chunks(ids):
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', chunk)
+            cursor.execute(f'{_DOCUMENTS_SQL} AND t.id IN ({placeholders})', chunk)
+
+
+def remove_tasks(task_ids: Iterable[int], using: str = 'default') -> None:
+    ids = sorted({int(i) for i in task_ids if i is not None})
+    if not ids or not is_available(using):
+        return
+    with connections[using].cursor() as cursor:
+        for chunk in _chunks(ids):
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', chunk)
+
+
+def rebuild(using: str = 'default') -> int:
+    """Rebuild the whole index from the database. Returns the number of indexed tasks."""
+    if not is_available(using):
+        return 0
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(_DOCUMENTS_SQL)
+        cursor.execute(f'SELECT count(*) FROM {FTS_TABLE}')
+        return cursor.fetchone()[0]
+
+
+def search_task_ids(q: str, limit: Optional[int] = None, using: str = 'default') -> List[int]:
+    """Task ids matching ``q``, best match first. Permission scoping is up to the caller."""
+    match = build_match_expression(q)
+    if not match or not is_available(using):
+        return []
+    sql = f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY bm25({FTS_TABLE}, %s, %s, %s, %s, %s)'
+    params = [match, *BM25_WEIGHTS]
+    if limit:
+        sql += ' LIMIT %s'
+        params.append(limit)
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def filter_tasks(qs, q: str):
+    """
+    Restrict a Task queryset to rows matching ``q`` and annotate ``search_rank``
+    (lower is better) so callers can order by relevance.
+    """
+    if not is_available(qs.db):
+        from .models import Comment, Task
+        # live comments only, on title and body like the FTS document
+        comments = Comment.objects.filter(Q(title__icontains=q) | Q(description__icontains=q)).values('task_id')
+        matches = Task.objects.filter(
+            Q(title__icontains=q) | Q(description__icontains=q) | Q(tags__name__icontains=q) |
+            Q(project__title__icontains=q) | Q(id__in=comments)
+        )
+        return qs.filter(id__in=matches.values('id'))
+
+    match = build_match_expression(q)
+    if not match:
+        return qs.none()
+    table = qs.model._meta.db_table
+    return qs.filter(
+        id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match])
+    ).annotate(search_rank=RawSQL(
+        f'SELECT bm25({FTS_TABLE}, %s, %s, %s, %s, %s) FROM {FTS_TABLE} '
+        f'WHERE {FTS_TABLE} MATCH %s AND rowid = "{table}"."id"',
+        [*BM25_WEIGHTS, match],
+    ))
@@ -1,22 +1,93 @@
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 
-from .models import Project, Task, Tag, Comment
+from .models import Project, Task, Tag, Comment, TaskRow, Job
 
 
-class TagSerializer(serializers.ModelSerializer):
+def _split_param(value):
+    return [v.strip() for v in (value or '').split(',') if v.strip()]
+
+
+class SparseFieldsetMixin:
+    """
+    ``?fields=a,b`` limits the output to the listed fields and ``?expand=x,x.y`` nests the
+    relations listed in ``Meta.expandable``, which otherwise render as plain ids. Both are
+    read from the request on safe methods, or passed as ``fields=``/``expand=`` kwargs.
+    ``x.y`` implies ``x``; the nested serializer receives the ``x.``-prefixed part.
+    """
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is not None and request.method in SAFE_METHODS:
+            if fields is None:
+                fields = _split_param(request.query_params.get('fields'))
+            if expand is None:
+                expand = _split_param(request.query_params.get('expand'))
+        expand = list(expand or [])
+
+        for name, serializer_class in getattr(self.Meta, 'expandable', {}).items():
+            nested = [e[len(name) + 1:] for e in expand if e.startswith(f'{name}.')]
+            if (name not in expand and not nested) or name not in self.fields:
+                continue
+            many = self.Meta.model._meta.get_field(name).many_to_many
+            self.fields[name] = serializer_class(read_only=True, many=many, expand=nested)
+
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+def _collect_related(serializer, prefix, in_prefetch, select_related, prefetch_related):
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*' or '.' in field.source:
+            continue
+        path = f'{prefix}{field.source}'
+        if isinstance(field, serializers.ManyRelatedField):
+            prefetch_related.append(path)
+        elif isinstance(field, serializers.ListSerializer):
+            prefetch_related.append(path)
+            _collect_related(field.child, f'{path}__', True, select_related, prefetch_related)
+        elif isinstance(field, serializers.BaseSerializer):
+            (prefetch_related if in_prefetch else select_related).append(path)
+            _collect_related(field, f'{path}__', in_prefetch, select_related, prefetch_related)
+
+
+def optimize_queryset(qs, serializer):
+    """
+    Shape a queryset to what ``serializer`` renders: joins only for expanded foreign keys,
+    prefetches for many-to-many fields, and deferred columns for fields left out by ``?fields=``.
+    """
+    select_related, prefetch_related = [], []
+    _collect_related(serializer, '', False, select_related, prefetch_related)
+    qs = qs.select_related(None).prefetch_related(None)
+    if select_related:
+        qs = qs.select_related(*select_related)
+    if prefetch_related:
+        qs = qs.prefetch_related(*prefetch_related)
+
+    rendered = {f.source for f in serializer.fields.values() if not f.write_only}
+    deferred = [f.name for f in qs.model._meta.concrete_fields
+                if not f.is_relation and not f.primary_key and f.name not in rendered]
+    if deferred:
+        qs = qs.defer(*deferred)
+    return qs
+
+
+class TagSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Tag
         fields = ['id', 'name', 'color']
 
-class OwnerSerializer(serializers.ModelSerializer):
+class OwnerSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = get_user_model()
         fields = ['id', 'email', 'first_name', 'last_name']
 
 
-class ProjectSerializer(serializers.ModelSerializer):
-    owner = OwnerSerializer(read_only=True)
+class ProjectSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    owner = serializers.PrimaryKeyRelatedField(read_only=True)
     owner_id = serializers.PrimaryKeyRelatedField(
         source='owner',
         queryset=get_user_model().objects.all(),
@@ -28,16 +99,17 @@ class ProjectSerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'description', 'owner', 'owner_id',
                   'created', 'updated', 'llm_context', 'deadline', 'category', 'tags']
         read_only_fields = ('created', 'updated')
+        expandable = {'owner': OwnerSerializer, 'tags': TagSerializer}
 
 
-class TaskSerializer(serializers.ModelSerializer):
-    owner = OwnerSerializer(read_only=True)
+class TaskSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    owner = serializers.PrimaryKeyRelatedField(read_only=True)
     owner_id = serializers.PrimaryKeyRelatedField(
         source='owner',
         queryset=get_user_model().objects.all(),
         write_only=True
     )
-    project = ProjectSerializer(read_only=True)
+    project = serializers.PrimaryKeyRelatedField(read_only=True)
     project_id = serializers.PrimaryKeyRelatedField(
         source='project',
         queryset=Project.objects.all(),
@@ -55,9 +127,11 @@ class TaskSerializer(serializers.ModelSerializer):
             'estimated_hours', 'tags'
         ]
         read_only_fields = ('created', 'updated')
+        expandable = {'owner': OwnerSerializer, 'project': ProjectSerializer,
+                      'assignees': OwnerSerializer, 'tags': TagSerializer}
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     owner = serializers.PrimaryKeyRelatedField(queryset=get_user_model().objects.all())
     task = serializers.PrimaryKeyRelatedField(queryset=Task.objects.all())
 
@@ -65,3 +139,66 @@ class CommentSerializer(serializers.ModelSerializer):
         model = Comment
         fields = ['id', 'title', 'description', 'owner', 'created', 'updated', 'llm_context', 'task']
         read_only_fields = ('created', 'updated')
+        expandable = {'owner': OwnerSerializer, 'task': TaskSerializer}
+
+
+class CommentPreviewSerializer(serializers.ModelSerializer):
+    owner_email = serializers.EmailField(source='owner.email', read_only=True)
+
+    class Meta:
+        model = Comment
+        fields = ['id', 'title', 'description', 'owner_id', 'owner_email', 'created']
+
+
+class TaskRowSerializer(serializers.ModelSerializer):
+    """Read-only, flat task row for tables (see TaskViewSet.rows)."""
+    project_title = serializers.CharField(source='project.title', read_only=True)
+    owner_email = serializers.EmailField(source='owner.email', read_only=True)
+    assignees = serializers.SerializerMethodField()
+    assignee_ids = serializers.SerializerMethodField()
+    tags = serializers.SerializerMethodField()
+    comment_count = serializers.IntegerField(read_only=True)
+    last_comment_at = serializers.DateTimeField(read_only=True)
+    latest_comments = CommentPreviewSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Task
+        fields = [
+            'id', 'title', 'status', 'priority', 'due_date', 'estimated_hours', 'created', 'updated',
+            'project_id', 'project_title', 'owner_id', 'owner_email', 'assignees', 'assignee_ids', 'tags',
+            'comment_count', 'last_comment_at', 'latest_comments',
+        ]
+        read_only_fields = fields
+
+    def get_assignees(self, obj):
+        return [u.email for u in obj.assignees.all()]
+
+    def get_assignee_ids(self, obj):
+        return [u.id for u in obj.assignees.all()]
+
+    def get_tags(self, obj):
+        return [t.name for t in obj.tags.all()]
+
+
+class TaskRowReadModelSerializer(serializers.ModelSerializer):
+    """Same payload as TaskRowSerializer, rendered from the denormalized TaskRow table."""
+    id = serializers.IntegerField(source='task_id', read_only=True)
+    assignees = serializers.ListField(source='assignee_emails', read_only=True)
+    tags = serializers.ListField(source='tag_names', read_only=True)
+    latest_comments = serializers.SerializerMethodField()
+
+    class Meta:
+        model = TaskRow
+        fields = TaskRowSerializer.Meta.fields
+        read_only_fields = fields
+
+    def get_latest_comments(self, obj):
+        comments = self.context.get('latest_comments', {}).get(obj.task_id, [])
+        return CommentPreviewSerializer(comments, many=True).data
+
+
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = ['id', 'kind', 'status', 'attempts', 'events', 'result', 'error', 'created', 'started', 'finished']
+        read_only_fields = fields
@@ -0,0 +1,165 @@
+"""
+Signal handlers keeping derived data in sync with writes: the task search index
+(``projects.search``), the TaskRow read model (``projects.readmodel``) and the data versions
+(``projects.versions``).
+
+Soft deletes are plain saves with ``deleted=True`` and are handled by the post_save
+handlers. Queryset ``update()`` calls bypass signals; use ``rebuild_task_search`` /
+``rebuild_task_rows`` after bulk updates.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete, pre_save, pre_delete, m2m_changed
+from django.dispatch import receiver
+
+from . import readmodel, search, versions
+from .models import Project, Task, Tag, Comment
+
+
+def tasks_changed(task_ids, using, searchable=True):
+    """Refresh every derived representation of the given tasks."""
+    task_ids = list(task_ids)
+    if searchable:
+        search.index_tasks(task_ids, using=using)
+    readmodel.refresh_task_rows(task_ids, using=using)
+    versions.bump_tasks(task_ids, using=using)
+
+
+def bump_previous_owner(instance, using):
+    """Bump the user a saved row was taken from: the current owner's bump doesn't reach them."""
+    previous = getattr(instance, '_previous_owner_id', None)
+    if previous is not None and previous != instance.owner_id:
+        versions.bump_users([previous], using=using)
+
+
+@receiver(pre_save, sender=Task)
+@receiver(pre_save, sender=Comment)
+def owner_tracking(sender, instance, using, **kwargs):
+    instance._previous_owner_id = instance._previous_task_id = None
+    if instance.pk:
+        columns = ('owner_id', 'task_id') if sender is Comment else ('owner_id',)
+        previous = sender.all_objects.using(using).filter(pk=instance.pk).values_list(*columns).first()
+        if previous:
+            instance._previous_owner_id = previous[0]
+            instance._previous_task_id = previous[1] if sender is Comment else None
+
+
+@receiver(post_save, sender=Task)
+def task_saved(sender, instance, using, **kwargs):
+    tasks_changed([instance.id], using)
+    bump_previous_owner(instance, using)
+
+
+@receiver(post_delete, sender=Task)
+def task_deleted(sender, instance, using, **kwargs):
+    search.remove_tasks([instance.id], using=using)
+    versions.bump_users([instance.owner_id], using=using)
+
+
+@receiver(m2m_changed, sender=Task.tags.through)
+@receiver(m2m_changed, sender=Task.assignees.through)
+def task_m2m_changed(sender, instance, action, reverse, pk_set, using, **kwargs):
+    # assignees are not part of the search document
+    searchable = sender is Task.tags.through
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            tasks_changed([instance.id], using, searchable)
+    elif action == 'pre_clear':
+        # tag.task_set.clear() / user.assigned_tasks.clear(): remember the tasks before the rows disappear
+        column = 'tag_id' if searchable else 'customuser_id'
+        instance._changed_task_ids = list(sender.objects.using(using).filter(**{column: instance.id})
+                                          .values_list('task_id', flat=True))
+    elif action == 'post_clear':
+        tasks_changed(getattr(instance, '_changed_task_ids', []), using, searchable)
+    elif action in ('post_add', 'post_remove'):
+        tasks_changed(pk_set or [], using, searchable)
+
+
+@receiver(m2m_changed, sender=Task.assignees.through)
+def task_unassigned(sender, instance, action, reverse, pk_set, using, **kwargs):
+    # tasks_changed bumps the task's current assignees; users taken off it need a bump too
+    if reverse:
+        if action in ('post_remove', 'post_clear'):
+            versions.bump_users([instance.id], using=using)
+    elif action == 'pre_clear':
+        instance._unassigned_ids = list(sender.objects.using(using).filter(task_id=instance.id)
+                                        .values_list('customuser_id', flat=True))
+    elif action == 'post_clear':
+        versions.bump_users(getattr(instance, '_unassigned_ids', []), using=using)
+    elif action == 'post_remove':
+        versions.bump_users(pk_set or [], using=using)
+
+
+@receiver(pre_save, sender=Project)
+def project_title_tracking(sender, instance, using, **kwargs):
+    instance._title_changed, instance._previous_owner_id = True, None
+    if instance.pk:
+        previous = Project.all_objects.using(using).filter(pk=instance.pk).values_list('title', 'owner_id').first()
+        if previous:
+            instance._title_changed = previous[0] != instance.title
+            instance._previous_owner_id = previous[1]
+        else:
+            instance._title_changed = True
+
+
+@receiver(post_save, sender=Project)
+def project_saved(sender, instance, created, using, **kwargs):
+    if created or not getattr(instance, '_title_changed', True):
+        return
+    tasks_changed(Task.all_objects.using(using).filter(project_id=instance.id).values_list('id', flat=True), using)
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def project_changed(sender, instance, using, **kwargs):
+    versions.bump_users([instance.owner_id], using=using)
+    bump_previous_owner(instance, using)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(sender, instance, using, **kwargs):
+    versions.bump(['shared'], using=using)
+
+
+@receiver(post_save, sender=Tag)
+def tag_saved(sender, instance, created, using, **kwargs):
+    if created:
+        return
+    tasks_changed(Task.tags.through.objects.using(using).filter(tag_id=instance.id)
+                  .values_list('task_id', flat=True), using)
+
+
+@receiver(pre_delete, sender=Tag)
+def tag_deleting(sender, instance, using, **kwargs):
+    instance._changed_task_ids = list(Task.tags.through.objects.using(using).filter(tag_id=instance.id)
+                                      .values_list('task_id', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def tag_deleted(sender, instance, using, **kwargs):
+    tasks_changed(getattr(instance, '_changed_task_ids', []), using)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_changed(sender, instance, using, **kwargs):
+    previous_task_id = getattr(instance, '_previous_task_id', None)
+    moved = previous_task_id is not None and previous_task_id != instance.task_id
+    tasks_changed([instance.task_id, previous_task_id] if moved else [instance.task_id], using)
+    versions.bump_users([instance.owner_id], using=using)
+    bump_previous_owner(instance, using)
+
+
+@receiver(pre_save, sender=get_user_model())
+def user_email_tracking(sender, instance, using, **kwargs):
+    instance._email_changed = False
+    if instance.pk and readmodel.is_enabled():
+        previous = sender.objects.using(using).filter(pk=instance.pk).values_list('email', flat=True).first()
+        instance._email_changed = previous != instance.email
+
+
+@receiver(post_save, sender=get_user_model())
+def user_saved(sender, instance, using, **kwargs):
+    # emails only appear in the read model
+    if getattr(instance, '_email_changed', False):
+        readmodel.refresh_task_rows(readmodel.user_task_ids(instance.id, using=using), using=using)
@@ -1,4 +1,8 @@
+import asyncio
+import json
+
 from django.contrib.auth import get_user_model
+from django.test import AsyncClient, TransactionTestCase, override_settings
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 
@@ -56,3 +60,188 @@ class AgentChatApiTests(APITestCase):
         # basic SSE structure
         self.assertIn('event: hello', text)
         self.assertIn('event: done', text)
+
+
+# ScriptedModel script: call list_tasks once, then answer with the titles it saw
+LIST_THEN_ANSWER = {'tasks': [[('list_tasks', {})], lambda returns: {'tasks': [t.title for t in returns['list_tasks']]}]}
+# ScriptedModel script: answer at once, without calling a tool
+ANSWER = {'answer': [lambda returns: {'message': 'ok'}]}
+
+
+class AgentTestCase(TransactionTestCase):
+    """
+    A user owning project 'P' with task 'T', and an API client logged in as them. Transactional:
+    tools run on the agent tool pool's threads, which need committed data.
+    """
+
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(email='u@example.com', password='pass')
+        self.project = Project.objects.create(title='P', description='d', owner=self.user)
+        self.task = Task.objects.create(title='T', description='d', owner=self.user, project=self.project)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+
+class AsyncAgentChatTests(AgentTestCase):
+    def chat(self):
+        from projects.agent.agent import agent_factory
+        from projects.agent.llm import ScriptedModel
+        with agent_factory().override(model=ScriptedModel(LIST_THEN_ANSWER)):
+            return self.client.post('/api/agent/chat', {'message': 'what are my tasks?'}, format='json')
+
+    def test_chat_awaits_the_agent_with_the_request_user(self):
+        resp = self.chat()
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.data['tasks'], ['T'])
+        tool_time = resp.data['meta'].pop('tool_time')
+        self.assertEqual(tool_time['calls'], 1)
+        self.assertEqual(tool_time['saved_ms'], 0)
+        self.assertEqual(resp.data['meta'], {'changed': False, 'last_action': None, 'actions': [],
+                                             'user_id': self.user.id,
+                                             'tool_cache': {'hits': 0, 'misses': 1, 'invalidated': 0},
+                                             'history': {'messages': 0, 'summarized': 0, 'tokens': 0,
+                                                         'tokens_saved': 0},
+                                             'answer_cache': {'hit': False, 'stored': True}})
+
+    @override_settings(AGENT_HISTORY_MAX_TOKENS=100, AGENT_HISTORY_KEEP_MESSAGES=2)
+    def test_long_history_is_compacted(self):
+        from pydantic_ai.messages import SystemPromptPart, UserPromptPart
+        from projects.agent.agent import SYSTEM_PROMPT, agent_factory
+        from projects.agent.llm import ScriptedModel
+
+        model = ScriptedModel(ANSWER)
+        previous = [{'role': 'user' if i % 2 == 0 else 'assistant', 'content': f'message {i} ' + 'word ' * 40}
+                    for i in range(10)]
+        with agent_factory().override(model=model):
+            resp = self.client.post('/api/agent/chat', {'message': 'and now?', 'previous_messages': previous},
+                                    format='json')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        history = resp.data['meta']['history']
+        self.assertEqual((history['messages'], history['summarized']), (10, 8))
+        self.assertGreater(history['tokens_saved'], 150)
+        # system prompt + summary, the last two messages verbatim, then the new prompt
+        parts = [part for message in model.last_messages for part in message.parts]
+        self.assertIsInstance(parts[0], SystemPromptPart)
+        self.assertEqual(parts[0].content, SYSTEM_PROMPT)
+        self.assertTrue(parts[1].content.startswith('Summary of the earlier conversation:\nuser: message 0'))
+        self.assertEqual([p.content for p in parts[2:4]], [previous[8]['content'], previous[9]['content']])
+        self.assertIsInstance(parts[4], UserPromptPart)
+        self.assertIn('and now?', parts[4].content)
+        self.assertEqual(len(parts), 5)
+
+    def test_anonymous_chat_is_rejected(self):
+        resp = APIClient().post('/api/agent/chat', {'message': 'hi'}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(AGENT_CHAT_MAX_CONCURRENCY_PER_USER=1, AGENT_CHAT_QUEUE_TIMEOUT=0)
+    def test_concurrency_limits(self):
+        from projects.agent.concurrency import chat_limiter
+        chat_limiter.per_user[self.user.id] += 1  # a chat of this user already in flight
+        try:
+            resp = self.chat()
+        finally:
+            del chat_limiter.per_user[self.user.id]
+        self.assertEqual(resp.status_code, 429)
+        self.assertEqual(resp['Retry-After'], '1')
+
+        with override_settings(AGENT_CHAT_MAX_CONCURRENCY=0):
+            resp = self.chat()
+        self.assertEqual(resp.status_code, 429)
+        self.assertEqual(resp['Retry-After'], '5')
+        self.assertEqual((chat_limiter.in_flight, dict(chat_limiter.per_user)), (0, {}))
+
+        # the wait queue is bounded: past AGENT_CHAT_MAX_WAITING, chats are turned away without waiting
+        with override_settings(AGENT_CHAT_MAX_CONCURRENCY=0, AGENT_CHAT_MAX_WAITING=0, AGENT_CHAT_QUEUE_TIMEOUT=30):
+            resp = self.chat()
+        self.assertEqual((resp.status_code, resp.data['detail']), (429, 'Too many chats waiting'))
+        self.assertEqual(chat_limiter.waiting, 0)
+
+
+def scripted_stream(*steps):
+    """Streaming stub model: the n-th model request streams ``steps[n]``, a list of (tool, args JSON chunk)."""
+    from pydantic_ai.models.function import DeltaToolCall, FunctionModel
+
+    async def stream(messages, info):
+        step = steps[sum(1 for m in messages if m.kind == 'response')]
+        for tool, chunk in step:
+            yield {0: DeltaToolCall(name=tool or None, json_args=chunk)}
+    return FunctionModel(stream_function=stream)
+
+
+def parse_sse(text):
+    events = []
+    for frame in text.split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in frame.splitlines() if not line.startswith(':'))
+        if 'event' in lines:
+            events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+class AgentChatStreamTests(AgentTestCase):
+    async def stream(self, model, message='what are my tasks?'):
+        from projects.agent.agent import agent_factory
+        from projects.agent.concurrency import chat_limiter
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        with agent_factory().override(model=model):
+            resp = await client.post('/api/agent/chat/stream', {'message': message},
+                                     content_type='application/json')
+            self.assertEqual(resp['Content-Type'], 'text/event-stream')
+            self.assertEqual(chat_limiter.per_user[self.user.id], 1)  # taken before the response
+            chunks = [chunk async for chunk in resp.streaming_content]
+        self.assertEqual(chat_limiter.in_flight, 0)
+        return parse_sse(b''.join(chunks).decode())
+
+    async def test_stream_sends_tokens_tool_timings_and_meta(self):
+        events = await self.stream(scripted_stream(
+            [('list_tasks', '{}')],
+            [('final_result', '{"response": {"message": "You have'), ('', ' one task: T"}}')],
+        ))
+        names = [name for name, _ in events]
+        self.assertEqual(names, ['hello', 'tool_start', 'tool_end', 'token', 'token', 'done'])
+        self.assertEqual(events[1][1]['tool'], 'list_tasks')
+        self.assertTrue(events[2][1]['ok'])
+        self.assertGreaterEqual(events[2][1]['ms'], 0)
+        self.assertEqual(''.join(data['delta'] for name, data in events if name == 'token'), 'You have one task: T')
+        done = events[-1][1]
+        self.assertEqual(done['output'], {'message': 'You have one task: T'})
+        self.assertEqual((done['meta']['changed'], done['meta']['last_action']), (False, None))
+        self.assertEqual([t['tool'] for t in done['meta']['tools']], ['list_tasks'])
+
+    async def test_stream_meta_reports_writes(self):
+        create = json.dumps({'title': 'New', 'description': 'd', 'project_id': self.project.id})
+        events = await self.stream(scripted_stream(
+            [('create_task', create)],
+            [('final_result', '{"response": {"message": "Created"}}')],
+        ), message='add a task')
+        meta = events[-1][1]['meta']
+        self.assertEqual((meta['changed'], meta['last_action'], meta['actions']), (True, 'create', ['create']))
+        self.assertTrue(await Task.objects.filter(title='New').aexists())
+
+    @override_settings(AGENT_STREAM_HEARTBEAT=0.01)
+    async def test_heartbeat_and_disconnect_cancel_the_run(self):
+        from pydantic_ai.models.function import FunctionModel
+        from projects.agent.agent import AgentDeps, agent_factory
+        from projects.agent.concurrency import chat_limiter
+        from projects.agent.streaming import KEEP_ALIVE, chat_events
+        started, cancelled = asyncio.Event(), asyncio.Event()
+
+        async def slow(messages, info):
+            started.set()
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+            yield 'never'
+
+        with agent_factory().override(model=FunctionModel(stream_function=slow)):
+            stream = chat_events(agent_factory(), 'hi', AgentDeps(user=self.user))
+            self.assertIn('event: hello', await anext(stream))
+            self.assertEqual(await anext(stream), KEEP_ALIVE)
+            while not started.is_set():  # past admission, waiting on the model
+                self.assertEqual(await anext(stream), KEEP_ALIVE)
+            await stream.aclose()  # what the ASGI handler does when the client disconnects
+        self.assertTrue(cancelled.is_set())
+        self.assertEqual(chat_limiter.in_flight, 0)
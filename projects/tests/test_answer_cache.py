@@ -0,0 +1,122 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+from projects import versions
+from projects.agent.answers import normalize
+from projects.models import Comment, Project, Tag, Task
+from projects.tests.test_agent_chat_api import LIST_THEN_ANSWER, AgentTestCase
+
+
+class AnswerCacheTests(AgentTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.other = get_user_model().objects.create_user(email='o@example.com', password='pass')
+        self.model_calls = 0
+
+    def chat(self, message='what are my tasks?', model=None, context=None, **options):
+        from projects.agent.agent import agent_factory
+        from projects.agent.llm import ScriptedModel
+
+        model = model or ScriptedModel(LIST_THEN_ANSWER)
+        with agent_factory().override(model=model):
+            resp = self.client.post('/api/agent/chat', {'message': message, 'context': context or {},
+                                                        'options': options}, format='json')
+        self.model_calls += model.requests
+        self.assertEqual(resp.status_code, 200)
+        return resp.data
+
+    def test_repeated_read_only_questions_are_answered_from_the_cache(self):
+        first = self.chat()
+        self.assertEqual((first['tasks'], first['meta']['answer_cache']), (['T'], {'hit': False, 'stored': True}))
+        self.assertEqual(self.model_calls, 2)
+
+        again = self.chat('  What are my   TASKS ')
+        self.assertEqual((again['tasks'], again['meta']['answer_cache']), (['T'], {'hit': True, 'stored': False}))
+        self.assertEqual(self.model_calls, 2)
+
+        # another context object makes another question
+        in_project = self.chat(context={'type': 'project', 'id': self.project.id})
+        self.assertEqual(in_project['meta']['answer_cache'], {'hit': False, 'stored': True})
+
+        bypassed = self.chat(no_cache=True)
+        self.assertEqual(bypassed['meta']['answer_cache'], {'hit': False, 'stored': False})
+        self.assertEqual(normalize(' Hello,  World?! '), 'hello, world')
+
+    def test_writes_to_the_users_data_invalidate_its_answers(self):
+        self.chat()
+        # a task of someone else's: unrelated, the answer stays
+        elsewhere = Project.objects.create(title='Q', description='d', owner=self.other)
+        shared = Task.objects.create(title='S', description='d', owner=self.other, project=elsewhere)
+        self.assertTrue(self.chat()['meta']['answer_cache']['hit'])
+
+        # assigning the user makes it theirs
+        shared.assignees.add(self.user)
+        answer = self.chat()
+        self.assertEqual((sorted(answer['tasks']), answer['meta']['answer_cache']['hit']), (['S', 'T'], False))
+
+        # another user's edit of it
+        shared.title = 'S2'
+        shared.save()
+        self.assertEqual(sorted(self.chat()['tasks']), ['S2', 'T'])
+
+        # and taking the user off it again
+        shared.assignees.remove(self.user)
+        answer = self.chat()
+        self.assertEqual((answer['tasks'], answer['meta']['answer_cache']['hit']), (['T'], False))
+
+    def test_runs_that_write_are_not_cached(self):
+        from projects.agent.llm import ScriptedModel
+        create_then_answer = {'tag': [[('create_tag', {'name': 'urgent'})], lambda returns: {'message': 'ok'}]}
+
+        for _ in range(2):
+            Tag.objects.filter(name='urgent').delete()  # tag names are unique
+            answer = self.chat('tag it urgent', model=ScriptedModel(create_then_answer))
+            self.assertEqual(answer['meta']['answer_cache'], {'hit': False, 'stored': False})
+        self.assertEqual(answer['meta']['actions'], ['create'])
+        self.assertEqual(self.model_calls, 4)
+
+    def test_versions_follow_every_write_the_user_can_see(self):
+        def bumped(user, write):
+            before = versions.current(user)
+            write()
+            return versions.current(user) != before
+
+        task = Task.objects.get(title='T')
+        task.assignees.add(self.other)
+        self.assertTrue(bumped(self.other, lambda: task.assignees.clear()))
+        task.assignees.add(self.other)
+        self.assertTrue(bumped(self.other, lambda: self.other.assigned_tasks.clear()))
+        self.assertTrue(bumped(self.other, lambda: Tag.objects.create(name='x')))
+        self.assertFalse(bumped(self.other, lambda: Project.objects.create(title='R', description='d',
+                                                                             owner=self.user)))
+        staff = get_user_model().objects.create_user(email='s@example.com', password='pass', is_staff=True)
+        self.assertTrue(bumped(staff, lambda: Project.objects.create(title='R', description='d', owner=self.user)))
+
+        # bulk_assign with replace deletes the old assignments without m2m signals
+        from projects.agent.tools.task import BulkAssignIn, tool_bulk_assign
+        task.assignees.add(self.other)
+        self.assertTrue(bumped(self.other, lambda: tool_bulk_assign(
+            self.user, BulkAssignIn(task_ids=[task.id], assignee_ids=[self.user.id], replace=True))))
+        self.assertFalse(task.assignees.filter(id=self.other.id).exists())
+
+    def test_reassigning_a_task_invalidates_the_previous_owners_answers(self):
+        self.assertEqual(self.chat()['tasks'], ['T'])
+        self.assertTrue(self.chat()['meta']['answer_cache']['hit'])
+
+        task = Task.objects.get(title='T')
+        resp = self.client.patch(f'/api/tasks/{task.id}/', {'owner_id': self.other.id}, format='json')
+        self.assertEqual((resp.status_code, Task.objects.get(id=task.id).owner_id), (200, self.other.id))
+        answer = self.chat()
+        self.assertEqual((answer['tasks'], answer['meta']['answer_cache']['hit']), ([], False))
+
+        # the same for projects and comments handed to someone else
+        before = versions.current(self.user)
+        self.project.owner = self.other
+        self.project.save()
+        self.assertNotEqual(versions.current(self.user), before)
+        comment = Comment.objects.create(title='c', description='d', owner=self.user, task=task)
+        before = versions.current(self.user)
+        comment.owner = self.other
+        comment.save()
+        self.assertNotEqual(versions.current(self.user), before)
@@ -0,0 +1,69 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from projects.agent.context import dumps, estimate_tokens, fit, snapshot
+from projects.models import Comment, Project, Task, Tag
+
+
+class ChatContextSnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.owner = User.objects.create_user(email='owner@example.com', password='pass')
+        self.other = User.objects.create_user(email='other@example.com', password='pass')
+        self.project = Project.objects.create(title='Soil', description='d', owner=self.owner,
+                                              llm_context={'summary_text': 'soil project'})
+        self.task = Task.objects.create(title='Sample', description='take samples', owner=self.owner,
+                                        project=self.project, llm_context={'last_action': 'create'})
+        self.task.assignees.add(self.other)
+        self.task.tags.add(Tag.objects.create(name='lab'))
+        for i in range(5):
+            Comment.objects.create(title=f'c{i}', description=f'note {i}', owner=self.owner, task=self.task)
+
+    def test_task_snapshot_is_compact_and_cached_by_version(self):
+        context = {'type': 'task', 'id': self.task.id}
+        # version + task + assignees + tags + comments
+        with self.assertNumQueries(5):
+            snap = snapshot(self.owner, context)
+        self.assertEqual(snap['project'], {'id': self.project.id, 'title': 'Soil'})
+        self.assertEqual((snap['assignees'], snap['tags']), (['other@example.com'], ['lab']))
+        self.assertEqual([c['title'] for c in snap['comments']], ['c4', 'c3', 'c2'])
+        self.assertLess(len(dumps(snap)), 2048)
+        # an unchanged selection only checks the version
+        with self.assertNumQueries(1):
+            self.assertEqual(dumps(snapshot(self.owner, context)), dumps(snap))
+        # assignees see it from the same cache entry; a new comment is a new version
+        with self.assertNumQueries(1):
+            snapshot(self.other, context)
+        Comment.objects.create(title='c5', description='latest', owner=self.owner, task=self.task)
+        self.assertEqual(snapshot(self.owner, context)['comments'][0]['title'], 'c5')
+
+    def test_objects_the_user_cannot_see_are_missing(self):
+        stranger = get_user_model().objects.create_user(email='s@example.com', password='pass')
+        comment = Comment.objects.filter(task=self.task).first()
+        for ctx_type, ctx_id in (('task', self.task.id), ('comment', comment.id), ('task', 12345)):
+            self.assertEqual(snapshot(stranger, {'type': ctx_type, 'id': ctx_id}),
+                             {'type': ctx_type, 'id': ctx_id, 'missing': True})
+        self.assertEqual(snapshot(self.owner, {'type': 'task', 'id': 'x'}), {'type': 'none'})
+        self.assertEqual(snapshot(self.owner, {}), {'type': 'none'})
+        self.assertEqual(snapshot(self.owner, {'type': 'comment', 'id': comment.id})['task']['id'], self.task.id)
+
+    def test_project_snapshot_lists_the_latest_tasks_the_user_can_see(self):
+        for i in range(4):
+            Task.objects.create(title=f'T{i}', description='d', owner=self.owner, project=self.project)
+        context = {'type': 'project', 'id': self.project.id}
+        self.assertEqual([t['title'] for t in snapshot(self.owner, context)['tasks']], ['T3', 'T2', 'T1'])
+        self.assertEqual([t['title'] for t in snapshot(self.other, context)['tasks']], ['Sample'])
+        self.assertEqual(snapshot(self.owner, context)['llm_context'], {'summary_text': 'soil project'})
+
+    @override_settings(AGENT_CONTEXT_MAX_TOKENS=120)
+    def test_large_snapshots_are_trimmed_to_the_token_budget(self):
+        self.task.llm_context = {f'key{i}': 'x' * 200 for i in range(20)} | {'summary_text': 'short'}
+        self.task.description = 'word ' * 500
+        self.task.save()
+        snap = snapshot(self.owner, {'type': 'task', 'id': self.task.id})
+        self.assertLessEqual(estimate_tokens(snap), 120)
+        self.assertTrue(snap['truncated'])
+        self.assertEqual(snap['title'], 'Sample')
+        self.assertEqual(fit({'type': 'none'}, 10), {'type': 'none'})
@@ -0,0 +1,59 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from projects.agent.history import compact, persist_summary
+from projects.models import Project, Task
+
+
+def conversation(n, offset=0):
+    return [{'role': 'user' if i % 2 == 0 else 'assistant', 'content': f'message {i} ' + 'word ' * 30}
+            for i in range(offset, offset + n)]
+
+
+@override_settings(AGENT_HISTORY_MAX_TOKENS=100, AGENT_HISTORY_KEEP_MESSAGES=4, AGENT_HISTORY_SUMMARY_TOKENS=200)
+class ChatHistoryCompactionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_short_histories_are_passed_on_as_is(self):
+        history = compact([{'role': 'user', 'content': 'hi'}, {'role': 'assistant', 'content': 'hello'},
+                           {'role': 'assistant', 'type': 'tool', 'content': 'list_tasks done'}, {'bogus': 1}], 's')
+        self.assertEqual(history.recent, [('user', 'hi'), ('assistant', 'hello')])
+        self.assertEqual((history.summary, history.meta()['tokens_saved']), ('', 0))
+        self.assertEqual(compact([], 's').messages('system'), [])
+
+    def test_older_messages_fold_into_a_rolling_summary(self):
+        history = compact(conversation(10), 's')
+        self.assertEqual((history.summarized, len(history.recent)), (6, 4))
+        self.assertEqual(history.summary.splitlines()[0][:15], 'user: message 0')
+        self.assertEqual(history.meta()['tokens_saved'], history.tokens_before - history.tokens)
+        self.assertGreater(history.meta()['tokens_saved'], 0)
+
+        # the next turn folds only the new messages; the summary keeps within its budget
+        history = compact(conversation(20), 's')
+        lines = history.summary.splitlines()
+        self.assertEqual(history.summarized, 16)
+        self.assertTrue(lines[0].startswith('(') and lines[0].endswith('earlier messages omitted)'))
+        self.assertTrue(lines[-1].startswith('assistant: message 15'))
+        self.assertEqual([content[:10] for _, content in history.recent],
+                         ['message 16', 'message 17', 'message 18', 'message 19'])
+
+        # another conversation in the same session starts over
+        history = compact(conversation(10, offset=100), 's')
+        self.assertTrue(history.summary.startswith('user: message 100'))
+
+    def test_summary_can_be_kept_in_the_context_objects_llm_context(self):
+        User = get_user_model()
+        owner = User.objects.create_user(email='owner@example.com', password='pass')
+        other = User.objects.create_user(email='other@example.com', password='pass')
+        project = Project.objects.create(title='P', description='d', owner=owner)
+        task = Task.objects.create(title='T', description='d', owner=owner, project=project,
+                                   llm_context={'source': 'agent'})
+        context = {'type': 'task', 'id': task.id}
+        self.assertFalse(persist_summary(other, context, 'user: hi'))
+        self.assertTrue(persist_summary(owner, context, 'user: hi'))
+        self.assertFalse(persist_summary(owner, context, 'user: hi'))  # unchanged
+        self.assertFalse(persist_summary(owner, {'type': 'task', 'id': 'x'}, 'user: hi'))
+        task.refresh_from_db()
+        self.assertEqual((task.llm_context['source'], task.llm_context['chat_summary']), ('agent', 'user: hi'))
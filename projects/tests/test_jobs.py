@@ -0,0 +1,145 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import AsyncClient, override_settings
+from django.utils import timezone
+
+from projects import jobs
+from projects.agent.agent import agent_factory
+from projects.agent.history import History
+from projects.agent.llm import ScriptedModel
+from projects.models import Job
+from projects.tests.test_agent_chat_api import LIST_THEN_ANSWER, AgentTestCase, parse_sse
+
+
+@async_to_sync
+async def follow(user, url):
+    client = AsyncClient()
+    await client.aforce_login(user)
+    resp = await client.get(url)
+    assert resp['Content-Type'] == 'text/event-stream'
+    return parse_sse(b''.join([chunk async for chunk in resp.streaming_content]).decode())
+
+
+class JobQueueTests(AgentTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = get_user_model().objects.create_user(email='o@example.com', password='pass')
+
+    def stub_model(self, model=None):
+        return agent_factory().override(model=model or ScriptedModel(LIST_THEN_ANSWER))
+
+    def test_async_chat_returns_a_job_to_poll_and_follow(self):
+        resp = self.client.post('/api/agent/chat', {'message': 'what are my tasks?', 'options': {'async': True}},
+                                format='json')
+        self.assertEqual(resp.status_code, 202)
+        job_id = resp.data['job_id']
+        self.assertEqual((resp.data['status'], resp.data['url'], resp.data['events_url']),
+                         ('QUEUED', f'/api/jobs/{job_id}', f'/api/jobs/{job_id}/events'))
+        self.assertEqual(self.client.get(f'/api/jobs/{job_id}').data['status'], 'QUEUED')
+
+        with self.stub_model():
+            self.assertTrue(jobs.run_next('w1'))
+        self.assertFalse(jobs.run_next('w1'))
+
+        job = self.client.get(f'/api/jobs/{job_id}').data
+        self.assertEqual((job['status'], job['attempts'], job['error']), ('DONE', 1, ''))
+        self.assertEqual(job['result']['tasks'], ['T'])
+        self.assertEqual(job['result']['meta']['user_id'], self.user.id)
+        self.assertEqual([e['event'] for e in job['events']], ['tool_start', 'tool_end'])
+
+        frames = follow(self.user, f'/api/jobs/{job_id}/events')
+        self.assertEqual([event for event, _ in frames], ['status', 'tool_start', 'tool_end', 'done'])
+        self.assertEqual(frames[-1][1]['output'], {'tasks': ['T']})
+        self.assertEqual([event for event, _ in follow(self.user, f'/api/jobs/{job_id}/events?after=2')],
+                         ['status', 'done'])
+
+        self.client.force_authenticate(user=self.other)
+        self.assertEqual(self.client.get(f'/api/jobs/{job_id}').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/jobs/{job_id}/events').status_code, 404)
+
+    def test_a_failing_run_fails_the_job(self):
+        from pydantic_ai.models.function import FunctionModel
+
+        async def broken(messages, info):
+            raise RuntimeError('model down')
+            yield
+
+        job = jobs.enqueue_chat(self.user, 'hi', History())
+        with self.stub_model(FunctionModel(stream_function=broken)):
+            jobs.run_next('w1')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error, job.attempts), ('FAILED', 'model down', 1))
+        frames = follow(self.user, f'/api/jobs/{job.id}/events')
+        self.assertEqual(frames[-1], ('error', {'detail': 'model down'}))
+
+    def test_leases_go_to_one_worker_and_expired_ones_are_retried(self):
+        job = jobs.enqueue_chat(self.user, 'hi', History())
+        self.assertEqual(jobs.claim('w1').id, job.id)
+        self.assertIsNone(jobs.claim('w2'))
+
+        # w1 crashed: once its lease runs out, w2 takes over and w1 can't write any more
+        Job.objects.filter(id=job.id).update(lease_expires=timezone.now() - timedelta(seconds=1))
+        retried = jobs.claim('w2')
+        self.assertEqual((retried.id, retried.attempts, retried.lease_owner), (job.id, 2, 'w2'))
+        self.assertFalse(jobs.renew(job, 'w1'))
+        self.assertFalse(jobs.finish(job, 'w1', result={}))
+        self.assertTrue(jobs.renew(retried, 'w2'))
+
+        # out of attempts: failed instead of claimed again
+        Job.objects.filter(id=job.id).update(attempts=3, lease_expires=timezone.now() - timedelta(seconds=1))
+        self.assertIsNone(jobs.claim('w3'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.lease_owner), ('FAILED', ''))
+        self.assertIn('abandoned', job.error)
+
+    @override_settings(JOB_MAX_RUNNING_PER_USER=1, JOB_MAX_PENDING_PER_USER=3)
+    def test_per_user_caps(self):
+        first, second = (jobs.enqueue_chat(self.user, f'job {i}', History()) for i in range(2))
+        others = jobs.enqueue_chat(self.other, 'job', History())
+        self.assertEqual(jobs.claim('w1').id, first.id)
+        self.assertEqual(jobs.claim('w2').id, others.id)  # the user's second job waits
+        self.assertIsNone(jobs.claim('w3'))
+        jobs.finish(first, 'w1', result={})
+        self.assertEqual(jobs.claim('w3').id, second.id)
+
+        jobs.enqueue_chat(self.user, 'job 3', History())
+        jobs.enqueue_chat(self.user, 'job 4', History())
+        resp = self.client.post('/api/agent/chat', {'message': 'more', 'options': {'async': True}}, format='json')
+        self.assertEqual((resp.status_code, resp['Retry-After']), (429, '30'))
+
+    @override_settings(JOB_MAX_RUNNING_PER_USER=1)
+    def test_racing_claims_respect_the_running_cap(self):
+        first, second = (jobs.enqueue_chat(self.user, f'job {i}', History()) for i in range(2))
+        lock_user, raced = jobs.lock_user, []
+
+        def w2_claims_first(user_id):
+            # w1 has listed both jobs as candidates; w2 claims one before w1's UPDATE
+            if not raced:
+                raced.append(None)
+                raced[0] = jobs.claim('w2')
+            lock_user(user_id)
+
+        with mock.patch.object(jobs, 'lock_user', w2_claims_first):
+            self.assertIsNone(jobs.claim('w1'))
+        self.assertEqual(raced[0].id, first.id)
+        self.assertEqual(list(Job.objects.filter(status='RUNNING').values_list('id', flat=True)), [first.id])
+        self.assertEqual(Job.objects.get(id=second.id).status, 'QUEUED')
+
+    def test_worker_command_runs_the_queue(self):
+        for i in range(3):
+            jobs.enqueue_chat(self.user, f'job {i}', History())
+        out = StringIO()
+        # override() is per context; the worker's pool threads see the agent's own model
+        agent = agent_factory()
+        model, agent.model = agent.model, ScriptedModel(LIST_THEN_ANSWER)
+        try:
+            call_command('worker', '--once', '--threads', '2', '--poll', '0.05', stdout=out)
+        finally:
+            agent.model = model
+        self.assertEqual(list(Job.objects.values_list('status', flat=True)), ['DONE'] * 3)
+        self.assertIn('stopped after 3 jobs', out.getvalue())
@@ -0,0 +1,98 @@
+import json
+import tempfile
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from projects import metrics
+from projects.tests.test_agent_chat_api import LIST_THEN_ANSWER, AgentTestCase
+
+
+def value(metric, **labels):
+    return metrics.registry.collect()[metric.name].get(metric._key(labels))
+
+
+class MetricsRegistryTests(TestCase):
+    def setUp(self):
+        self.registry = metrics.Registry()
+        self.requests = self.registry.counter('requests_total', 'Requests.', ('path',))
+        self.latency = self.registry.histogram('latency_seconds', 'Latency.', ('path',), buckets=(0.1, 1))
+
+    def test_render_uses_the_prometheus_text_format(self):
+        self.requests.inc(path='/a')
+        self.requests.inc(2, path='/a "quoted"')
+        for seconds in (0.05, 0.1, 0.5, 3):
+            self.latency.observe(seconds, path='/a')
+        self.assertEqual(self.registry.render().splitlines(), [
+            '# HELP requests_total Requests.',
+            '# TYPE requests_total counter',
+            'requests_total{path="/a"} 1',
+            'requests_total{path="/a \\"quoted\\""} 2',
+            '# HELP latency_seconds Latency.',
+            '# TYPE latency_seconds histogram',
+            'latency_seconds_bucket{path="/a",le="0.1"} 2',
+            'latency_seconds_bucket{path="/a",le="1"} 3',
+            'latency_seconds_bucket{path="/a",le="+Inf"} 4',
+            'latency_seconds_sum{path="/a"} 3.65',
+            'latency_seconds_count{path="/a"} 4',
+        ])
+
+    def test_snapshots_of_all_processes_are_added_up(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            self.requests.inc(path='/a')
+            self.latency.observe(0.5, path='/a')
+            # another worker process's snapshot
+            Path(directory, '999-other.json').write_text(json.dumps({
+                'requests_total': [[['/a'], 2], [['/b'], 1]],
+                'latency_seconds': [[['/a'], [[1, 0, 0], 0.05]]],
+                'gone_metric': [[[], 1]],
+            }))
+            Path(directory, '998-partial.json').write_text('{"requests')  # half written
+            collected = self.registry.collect()
+            self.assertEqual(len(list(Path(directory).glob('*.json'))), 3)
+        self.assertEqual(collected['requests_total'], {('/a',): 3, ('/b',): 1})
+        self.assertEqual(collected['latency_seconds'], {('/a',): ([1, 1, 0], 0.55)})
+
+
+class MetricsEndpointTests(AgentTestCase):
+    def setUp(self):
+        super().setUp()
+        self.staff = get_user_model().objects.create_user(email='s@example.com', password='pass', is_staff=True)
+
+    def test_metrics_are_for_staff_only(self):
+        self.assertEqual(APIClient().get('/api/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/api/metrics').status_code, 403)
+        self.client.force_authenticate(user=self.staff)
+        resp = self.client.get('/api/metrics')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        self.assertIn('# TYPE agent_tool_calls_total counter', resp.content.decode())
+
+    def test_chat_records_runs_model_requests_tools_and_request_latency(self):
+        from projects.agent.agent import agent_factory
+        from projects.agent.llm import MeteredModel, ScriptedModel
+
+        view = 'projects.views.AgentChatView'
+        before = {
+            'runs': value(metrics.AGENT_RUNS, agent='chat', outcome='ok') or 0,
+            'llm': (value(metrics.LLM_REQUEST_SECONDS, model='scripted') or [[], 0])[0],
+            'tokens': value(metrics.LLM_PROMPT_TOKENS, model='scripted') or 0,
+            'tools': value(metrics.TOOL_CALLS, tool='list_tasks', outcome='ok') or 0,
+            'requests': value(metrics.HTTP_REQUEST_SECONDS, view=view, method='POST', status=200),
+        }
+        with agent_factory().override(model=MeteredModel(ScriptedModel(LIST_THEN_ANSWER))):
+            resp = self.client.post('/api/agent/chat', {'message': 'what are my tasks?'}, format='json')
+        self.assertEqual(resp.status_code, 200)
+
+        self.assertEqual(value(metrics.AGENT_RUNS, agent='chat', outcome='ok'), before['runs'] + 1)
+        llm_counts, _ = value(metrics.LLM_REQUEST_SECONDS, model='scripted')
+        self.assertEqual(sum(llm_counts) - sum(before['llm']), 2)  # the tool call, then the answer
+        self.assertGreater(value(metrics.LLM_PROMPT_TOKENS, model='scripted'), before['tokens'])
+        self.assertEqual(value(metrics.TOOL_CALLS, tool='list_tasks', outcome='ok'), before['tools'] + 1)
+        queries, _ = value(metrics.TOOL_QUERIES, tool='list_tasks')
+        self.assertEqual(queries[0], 0)  # no call ran without a query
+        requests, seconds = value(metrics.HTTP_REQUEST_SECONDS, view=view, method='POST', status=200)
+        self.assertEqual(sum(requests) - sum(before['requests'][0] if before['requests'] else []), 1)
+        self.assertGreater(seconds, 0)
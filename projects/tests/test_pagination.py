@@ -0,0 +1,85 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase, APIClient
+
+from projects.models import Project, Task, Comment
+
+
+class KeysetPaginationTests(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.owner = User.objects.create_user(email='owner@example.com', password='pass')
+        self.project = Project.objects.create(title='P', description='d', owner=self.owner)
+        now = timezone.now()
+        # ties and NULLs in due_date exercise the id tiebreaker and NULL placement
+        for i in range(12):
+            due = None if i % 4 == 0 else now + timedelta(days=i % 3)
+            Task.objects.create(title=f'T{i:02d}', description='d', owner=self.owner, project=self.project,
+                                due_date=due, priority=['LOW', 'HIGH'][i % 2])
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.owner)
+
+    def _walk(self, url):
+        ids, pages = [], 0
+        while url:
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', resp.data)
+            ids.extend(t['id'] for t in resp.data['results'])
+            url = resp.data['next']
+            pages += 1
+        return ids, pages
+
+    def test_cursor_pages_cover_every_ordering_exactly_once(self):
+        from projects.views import TaskViewSet
+        for field in TaskViewSet.ALLOWED_ORDERING:
+            for ordering in (field, f'-{field}'):
+                expected = list(Task.objects.order_by(ordering, 'id' if ordering[0] != '-' else '-id')
+                                .values_list('id', flat=True))
+                ids, pages = self._walk(f'/api/tasks/?paginate=cursor&page_size=5&ordering={ordering}')
+                self.assertEqual(len(ids), 12, ordering)
+                self.assertEqual(len(set(ids)), 12, ordering)
+                self.assertEqual(pages, 3, ordering)
+                if field != 'due_date':  # NULL placement differs, checked below
+                    self.assertEqual(ids, expected, ordering)
+
+    def test_nulls_sort_last_ascending_and_first_descending(self):
+        ids, _ = self._walk('/api/tasks/?paginate=cursor&page_size=5&ordering=due_date')
+        dues = [Task.objects.get(id=i).due_date for i in ids]
+        self.assertEqual(dues[-3:], [None, None, None])
+        ids, _ = self._walk('/api/tasks/?paginate=cursor&page_size=5&ordering=-due_date')
+        dues = [Task.objects.get(id=i).due_date for i in ids]
+        self.assertEqual(dues[:3], [None, None, None])
+
+    def test_previous_link_and_stable_position_under_inserts(self):
+        first = self.client.get('/api/tasks/?paginate=cursor&page_size=5').data
+        second = self.client.get(first['next']).data
+        # a row inserted mid-walk neither shifts the pages already seen nor gets skipped
+        Task.objects.create(title='new', description='d', owner=self.owner, project=self.project)
+        back = self.client.get(second['previous']).data
+        self.assertEqual([t['id'] for t in back['results']], [t['id'] for t in first['results']])
+        third = self.client.get(second['next']).data
+        self.assertEqual(len(third['results']), 3)
+        self.assertEqual(third['results'][-1]['title'], 'new')
+
+    def test_invalid_or_mismatched_cursor_is_rejected(self):
+        resp = self.client.get('/api/tasks/?cursor=not-a-cursor')
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+        nxt = self.client.get('/api/tasks/?paginate=cursor&page_size=5&ordering=title').data['next']
+        resp = self.client.get(nxt.replace('ordering=title', 'ordering=status'))
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_page_number_pagination_remains_default(self):
+        resp = self.client.get('/api/tasks/')
+        self.assertEqual(resp.data['count'], 12)
+
+    def test_comment_cursor_pagination(self):
+        task = Task.objects.first()
+        for i in range(7):
+            Comment.objects.create(title=f'C{i}', description='d', owner=self.owner, task=task)
+        ids, pages = self._walk('/api/comments/?paginate=cursor&page_size=3')
+        self.assertEqual(ids, sorted(Comment.objects.values_list('id', flat=True)))
+        self.assertEqual(pages, 3)
@@ -0,0 +1,76 @@
+import json
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from rest_framework.test import APITestCase, APIClient
+
+from projects.models import Project, Task, Tag, Comment
+from projects.querybudget import QueryBudgetExceeded, fingerprint, track_queries, tracked
+from projects.views import TaskViewSet
+
+FULL_EXPANSIONS = [
+    '/api/tags/',
+    '/api/projects/?expand=owner,tags',
+    '/api/tasks/?expand=owner,project.owner,project.tags,assignees,tags',
+    '/api/tasks/rows/',
+    '/api/comments/?expand=owner,task.project.owner,task.tags,task.assignees',
+]
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class QueryBudgetTests(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(email='user@example.com', password='pass1234')
+        tag = Tag.objects.create(name='lab')
+        for i in range(6):
+            project = Project.objects.create(title=f'P{i}', description='d', owner=self.user)
+            project.tags.add(tag)
+            task = Task.objects.create(title=f'T{i}', description='d', owner=self.user, project=project)
+            task.tags.add(tag)
+            task.assignees.add(self.user)
+            Comment.objects.create(title=f'C{i}', description='d', owner=self.user, task=task)
+        self.task = task
+        self.client = APIClient()
+        self.client.login(email='user@example.com', password='pass1234')
+
+    def test_headers(self):
+        resp = self.client.get('/api/tasks/')
+        self.assertEqual(resp['X-Query-Count'], '6')  # session, user, count, page, assignees, tags
+        self.assertRegex(resp['Server-Timing'], r'^db;dur=[\d.]+;desc="6 queries", total;dur=[\d.]+$')
+
+    def test_list_endpoints_stay_within_budget(self):
+        for url in FULL_EXPANSIONS:
+            self.assertEqual(self.client.get(url).status_code, 200, url)
+        resp = self.client.get(f'/api/tasks/{self.task.id}/?expand=owner,project.owner,project.tags,assignees,tags')
+        self.assertEqual(resp.status_code, 200)
+
+    def test_strict_mode_fails_over_budget_requests(self):
+        with mock.patch.object(TaskViewSet, 'query_budget', {'list': 3}), \
+                self.assertLogs('projects.queries', 'WARNING') as logs:
+            with self.assertRaisesMessage(QueryBudgetExceeded, 'ran 6 queries, budget is 3'):
+                self.client.get('/api/tasks/')
+            with override_settings(QUERY_BUDGET_STRICT=False):
+                self.assertEqual(self.client.get('/api/tasks/').status_code, 200)
+        record = json.loads(logs.records[1].getMessage())
+        self.assertEqual((record['view'], record['budget'], record['over_budget']),
+                         ('projects.views.TaskViewSet', 3, True))
+
+    def test_repeated_statements_are_reported(self):
+        with track_queries('loop') as stats:
+            for task in Task.objects.order_by('id'):
+                task.project.title  # one project query per task
+        self.assertEqual(stats.count, 7)
+        (shape, repeats), = stats.repeated().items()
+        self.assertEqual(repeats, 6)
+        self.assertIn('FROM "projects_project"', shape)
+        self.assertEqual(fingerprint('SELECT 1 WHERE id IN (%s, %s) AND t = \'x\''),
+                         fingerprint('SELECT 2 WHERE id IN (%s)  AND t = \'y\''))
+
+    def test_tracked_tool_calls_are_logged(self):
+        tool = tracked('tool:count_tasks')(lambda: Task.objects.count())
+        with self.assertLogs('projects.queries', 'INFO') as logs:
+            self.assertEqual(tool(), 6)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record['label'], record['queries']), ('tool:count_tasks', 1))
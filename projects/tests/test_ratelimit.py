@@ -0,0 +1,105 @@
+import time
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from projects.agent.concurrency import ChatLimitExceeded
+from projects.agent.ratelimit import Short, admission, take
+from projects.models import RateBucket
+from projects.tests.test_agent_chat_api import ANSWER, parse_sse
+
+
+@override_settings(AGENT_RATE_USER_REQUESTS=2, AGENT_RATE_USER_TOKENS=1000,
+                   AGENT_RATE_GLOBAL_REQUESTS=3, AGENT_RATE_GLOBAL_TOKENS=0, AGENT_RATE_MAX_WAIT=0)
+class RateLimitTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(email='u@example.com', password='pass')
+        self.other = User.objects.create_user(email='o@example.com', password='pass')
+
+    def levels(self):
+        return {key: (round(requests, 1), round(tokens)) for key, requests, tokens
+                in RateBucket.objects.values_list('key', 'requests', 'tokens')}
+
+    def test_chats_draw_from_the_user_and_global_buckets_all_or_nothing(self):
+        take(self.user.id, 400)
+        take(self.user.id, 400)
+        self.assertEqual(self.levels(), {f'user:{self.user.id}': (0, 200), 'global': (1, 0)})
+        with self.assertRaises(Short) as short:
+            take(self.user.id, 100)  # out of requests: a minute for 2, so 30 s for one
+        self.assertEqual(short.exception.key, f'user:{self.user.id}')
+        self.assertAlmostEqual(short.exception.wait, 30, delta=0.5)
+
+        take(self.other.id, 10)
+        with self.assertRaises(Short) as short:
+            take(self.other.id, 10)  # the other user has room, the global bucket doesn't
+        self.assertEqual(short.exception.key, 'global')
+        self.assertEqual(self.levels()[f'user:{self.other.id}'], (1, 990))  # nothing drawn
+
+    def test_buckets_refill_with_time_up_to_a_minutes_worth(self):
+        take(self.user.id, 2000)  # bigger than the bucket: takes all of it
+        self.assertEqual(self.levels()[f'user:{self.user.id}'], (1, 0))
+        RateBucket.objects.update(updated=time.time() - 30)
+        take(self.user.id, 400)
+        self.assertEqual(self.levels()[f'user:{self.user.id}'], (1, 100))
+        RateBucket.objects.update(updated=time.time() - 600)
+        take(self.user.id, 0)
+        self.assertEqual(self.levels()[f'user:{self.user.id}'], (1, 1000))
+
+    @override_settings(AGENT_RATE_USER_REQUESTS=600, AGENT_RATE_MAX_WAIT=1)
+    def test_admission_waits_briefly_for_a_refill(self):
+        RateBucket.objects.create(key=f'user:{self.user.id}', requests=0.9, tokens=1000, updated=time.time())
+        started = time.monotonic()
+        async_to_sync(admission.admit)(self.user.id, 0)  # 10 requests a second: ready in 10 ms
+        self.assertLess(time.monotonic() - started, 1)
+        with override_settings(AGENT_RATE_MAX_WAITING=0), self.assertRaises(ChatLimitExceeded):
+            RateBucket.objects.filter(key=f'user:{self.user.id}').update(requests=0.9, updated=time.time())
+            async_to_sync(admission.admit)(self.user.id, 0)
+        self.assertEqual(admission.waiting, 0)
+
+    def test_chat_views_reject_with_retry_after(self):
+        from projects.agent.agent import agent_factory
+        from projects.agent.llm import ScriptedModel
+
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        with agent_factory().override(model=ScriptedModel(ANSWER)):  # no_cache: repeats would be cache hits
+            statuses = [client.post('/api/agent/chat', {'message': 'hi', 'options': {'no_cache': True}}, format='json')
+                        for _ in range(3)]
+        self.assertEqual([resp.status_code for resp in statuses], [200, 200, 429])
+        self.assertEqual(statuses[-1]['Retry-After'], '30')
+        self.assertEqual(statuses[-1].data['detail'], 'Too many chats for this user, rate limited')
+
+        # the prompt tokens count as well: the system prompt alone is more than this bucket
+        client.force_authenticate(user=self.other)
+        with override_settings(AGENT_RATE_USER_TOKENS=100):
+            self.assertEqual(client.post('/api/agent/chat', {'message': 'hi', 'options': {'async': True}},
+                                         format='json').status_code, 202)
+            resp = client.post('/api/agent/chat', {'message': 'hi'}, format='json')
+        self.assertEqual(resp.status_code, 429)
+
+    def test_stream_is_rejected_with_a_429_before_it_starts(self):
+        from projects.agent.concurrency import chat_limiter
+        RateBucket.objects.create(key=f'user:{self.user.id}', requests=0, tokens=1000, updated=time.time())
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        resp = client.post('/api/agent/chat/stream', {'message': 'hi'}, format='json')
+        self.assertEqual((resp.status_code, resp['Retry-After']), (429, '30'))
+        self.assertEqual(resp.data['detail'], 'Too many chats for this user, rate limited')
+
+        # EventSource clients get the rejection as an error event, still with the 429
+        resp = client.get('/api/agent/chat/stream', {'message': 'hi'}, HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(resp.status_code, 429)
+        self.assertEqual(parse_sse(resp.content.decode())[0][0], 'error')
+
+        # over the chat limiter's per-user cap, likewise
+        client.force_authenticate(user=self.other)
+        chat_limiter.per_user[self.other.id] += 1  # a chat of this user already in flight
+        try:
+            with override_settings(AGENT_CHAT_MAX_CONCURRENCY_PER_USER=1):
+                resp = client.post('/api/agent/chat/stream', {'message': 'hi'}, format='json')
+        finally:
+            del chat_limiter.per_user[self.other.id]
+        self.assertEqual((resp.status_code, resp['Retry-After']), (429, '1'))
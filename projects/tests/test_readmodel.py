@@ -0,0 +1,95 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import override_settings
+from rest_framework.test import APITestCase, APIClient
+
+from projects.models import Project, Task, Tag, Comment, TaskRow
+from projects.agent.tools.task import ListTasksIn, tool_list_tasks
+
+
+@override_settings(TASK_ROW_READ_MODEL=True)
+class TaskRowReadModelTests(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.owner = User.objects.create_user(email='owner@example.com', password='pass')
+        self.assignee = User.objects.create_user(email='assignee@example.com', password='pass')
+        self.project = Project.objects.create(title='Soil', description='d', owner=self.owner)
+        self.tag = Tag.objects.create(name='lab')
+        self.task = Task.objects.create(title='Sample', description='d', owner=self.owner, project=self.project)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.owner)
+
+    def row(self):
+        return TaskRow.objects.get(task=self.task)
+
+    def test_rows_follow_writes(self):
+        self.assertEqual(self.row().project_title, 'Soil')
+        self.task.assignees.add(self.assignee)
+        self.task.tags.add(self.tag)
+        self.assertEqual(self.row().assignee_emails, ['assignee@example.com'])
+        self.assertEqual(self.row().tag_names, ['lab'])
+
+        Comment.objects.create(title='c', description='d', owner=self.owner, task=self.task)
+        self.assertEqual(self.row().comment_count, 1)
+        self.assertIsNotNone(self.row().last_comment_at)
+
+        self.project.title = 'Sediment'
+        self.project.save()
+        self.tag.name = 'bench'
+        self.tag.save()
+        self.assignee.email = 'renamed@example.com'
+        self.assignee.save()
+        row = self.row()
+        self.assertEqual((row.project_title, row.tag_names, row.assignee_emails),
+                         ('Sediment', ['bench'], ['renamed@example.com']))
+
+        self.assignee.assigned_tasks.clear()
+        self.assertEqual(self.row().assignee_ids, [])
+
+        self.task.delete()
+        self.assertFalse(TaskRow.objects.filter(task_id=self.task.id).exists())
+
+    def test_rows_endpoint_matches_live_query(self):
+        self.task.assignees.add(self.assignee)
+        self.task.tags.add(self.tag)
+        for i in range(4):
+            Comment.objects.create(title=f'C{i}', description='d', owner=self.owner, task=self.task)
+        Task.objects.create(title='Other', description='d', owner=self.assignee, project=self.project)
+
+        with self.assertNumQueries(3):  # count, rows, latest comments
+            from_rows = self.client.get('/api/tasks/rows/?comments=2&ordering=-id').data
+        with override_settings(TASK_ROW_READ_MODEL=False):
+            live = self.client.get('/api/tasks/rows/?comments=2&ordering=-id').data
+        self.assertEqual(from_rows['count'], 1)
+        self.assertEqual(from_rows['results'][0]['latest_comments'], live['results'][0]['latest_comments'])
+        for key in ('id', 'assignees', 'assignee_ids', 'tags', 'comment_count', 'project_title', 'owner_email'):
+            self.assertEqual(from_rows['results'][0][key], live['results'][0][key], key)
+
+        resp = self.client.get(f'/api/tasks/rows/?tag=lab&assigned={self.assignee.id}&ordering=sort_key')
+        self.assertEqual([r['id'] for r in resp.data['results']], [self.task.id])
+
+    def test_cursor_pages_of_rows(self):
+        # TaskRow has no id: its key is task_id, which the pages must break ties on
+        for i in range(6):
+            Task.objects.create(title=f'T{i}', description='d', owner=self.owner, project=self.project,
+                                priority=['LOW', 'HIGH'][i % 2])
+        expected = list(Task.objects.order_by('-priority', '-id').values_list('id', flat=True))
+        for ordering, want in (('id', sorted(expected)), ('-priority', expected)):
+            ids, url = [], f'/api/tasks/rows/?paginate=cursor&page_size=3&ordering={ordering}'
+            while url:
+                resp = self.client.get(url)
+                self.assertEqual(resp.status_code, 200, ordering)
+                ids += [row['id'] for row in resp.data['results']]
+                url = resp.data['next']
+            self.assertEqual(ids, want, ordering)
+
+    def test_rebuild_command_and_agent_tools(self):
+        TaskRow.objects.all().delete()
+        call_command('rebuild_task_rows', stdout=StringIO())
+        self.assertEqual(TaskRow.objects.count(), 1)
+        self.task.assignees.add(self.assignee)
+        with self.assertNumQueries(2):  # tasks, rows
+            tasks = tool_list_tasks(self.owner, ListTasksIn())
+        self.assertEqual(tasks[0].assignee_ids, [self.assignee.id])
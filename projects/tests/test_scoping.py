@@ -0,0 +1,63 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase, APIClient
+
+from projects import scoping
+from projects.agent.tools.generic import QueryAction, tool_orm_action
+from projects.agent.tools.task import ListTasksIn, tool_list_tasks
+from projects.models import Project, Task, Comment
+
+
+class ScopingTests(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(email='user@example.com', password='pass')
+        self.other = User.objects.create_user(email='other@example.com', password='pass')
+        self.third = User.objects.create_user(email='third@example.com', password='pass')
+        self.staff = User.objects.create_user(email='staff@example.com', password='pass', is_staff=True)
+        project = Project.objects.create(title='P', description='d', owner=self.other)
+        # owned and assigned to self plus two others: the case a join multiplies
+        self.both = Task.objects.create(title='both', description='d', owner=self.user, project=project)
+        self.both.assignees.add(self.user, self.other, self.third)
+        self.owned = Task.objects.create(title='owned', description='d', owner=self.user, project=project)
+        self.assigned = Task.objects.create(title='assigned', description='d', owner=self.other, project=project)
+        self.assigned.assignees.add(self.user, self.third)
+        self.hidden = Task.objects.create(title='hidden', description='d', owner=self.other, project=project)
+        self.hidden.assignees.add(self.third)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_visible_tasks_are_duplicate_free_without_distinct(self):
+        qs = scoping.visible_tasks(self.user)
+        sql = str(qs.query)
+        self.assertNotIn('DISTINCT', sql)
+        self.assertNotIn('JOIN "projects_task_assignees"', sql)
+        self.assertEqual(sorted(qs.values_list('title', flat=True)), ['assigned', 'both', 'owned'])
+        self.assertEqual(qs.count(), 3)
+        self.assertEqual(scoping.visible_tasks(self.staff).count(), 4)
+        self.assertEqual(sorted(scoping.visible_tasks(self.user, include_assigned=False)
+                                .values_list('title', flat=True)), ['both', 'owned'])
+
+    def test_can_view_task(self):
+        self.assertTrue(scoping.can_view_task(self.user, self.assigned))
+        self.assertFalse(scoping.can_view_task(self.user, self.hidden))
+        self.assertTrue(scoping.can_view_task(self.staff, self.hidden))
+
+    def test_endpoints_and_tools_share_the_scope(self):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get('/api/tasks/')
+        self.assertEqual(resp.data['count'], 3)
+        self.assertEqual(len(resp.data['results']), 3)
+        self.assertFalse(any('DISTINCT' in q['sql'] for q in ctx.captured_queries))
+        self.assertEqual(self.client.get(f'/api/tasks/{self.hidden.id}/').status_code, 404)
+        self.assertEqual(self.client.get('/api/tasks/rows/').data['count'], 3)
+
+        self.assertEqual([t.title for t in tool_list_tasks(self.user, ListTasksIn())], ['both', 'owned', 'assigned'])
+        rows = tool_orm_action(self.user, QueryAction(model_name='task'))
+        self.assertEqual(sorted(r['title'] for r in rows), ['assigned', 'both', 'owned'])
+
+        Comment.objects.create(title='mine', description='d', owner=self.user, task=self.both)
+        Comment.objects.create(title='theirs', description='d', owner=self.other, task=self.both)
+        rows = tool_orm_action(self.user, QueryAction(model_name='comment'))
+        self.assertEqual([r['title'] for r in rows], ['mine'])
@@ -123,3 +123,47 @@ class TaskFiltersAPITests(APITestCase):
         self.assertEqual(resp.status_code, status.HTTP_200_OK)
         results = resp.data.get('results', resp.data)
         self.assertEqual(len(results), 0)
+
+    def test_q_filter_full_text_search(self):
+        from projects.models import Comment
+        self.client.force_authenticate(user=self.owner)
+        # comment bodies are searchable
+        Comment.objects.create(title='Note', description='calibrate the spectrometer', owner=self.owner, task=self.t2)
+        resp = self.client.get('/api/tasks/?q=spectrometer')
+        self.assertEqual([t['id'] for t in self._results(resp)], [self.t2.id])
+        # project title and prefix matching
+        resp = self.client.get('/api/tasks/?q=Pro')
+        ids = {t['id'] for t in self._results(resp)}
+        self.assertEqual(ids, {self.t1.id, self.t2.id, self.t3.id})
+        # renaming a tag re-indexes its tasks
+        self.tag_soil.name = 'sediment'
+        self.tag_soil.save()
+        resp = self.client.get('/api/tasks/?q=sediment')
+        self.assertEqual([t['id'] for t in self._results(resp)], [self.t1.id])
+        # soft-deleted tasks drop out of the index
+        self.t2.delete()
+        resp = self.client.get('/api/tasks/?q=spectrometer')
+        self.assertEqual(self._results(resp), [])
+
+    def test_q_filter_without_the_index_skips_deleted_comments(self):
+        from unittest import mock
+        from projects.models import Comment
+        self.client.force_authenticate(user=self.owner)
+        comment = Comment.objects.create(title='Note', description='calibrate the spectrometer', owner=self.owner,
+                                         task=self.t2)
+        with mock.patch('projects.search.is_available', return_value=False):
+            for q in ('spectrometer', 'Note'):  # body and title, as in the FTS document
+                resp = self.client.get(f'/api/tasks/?q={q}')
+                self.assertEqual([t['id'] for t in self._results(resp)], [self.t2.id])
+            comment.delete()
+            for q in ('spectrometer', 'Note'):
+                resp = self.client.get(f'/api/tasks/?q={q}')
+                self.assertEqual(self._results(resp), [])
+
+    def test_q_filter_ranks_title_matches_first(self):
+        self.client.force_authenticate(user=self.owner)
+        self.t2.description = 'samples of soil'
+        self.t2.save()
+        resp = self.client.get('/api/tasks/?q=soil')
+        ids = [t['id'] for t in self._results(resp)]
+        self.assertEqual(ids, [self.t1.id, self.t2.id])
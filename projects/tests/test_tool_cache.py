@@ -0,0 +1,74 @@
+from django.test import SimpleTestCase
+
+from projects.agent.tools.cache import ToolCache, read_rows, written_rows
+from projects.agent.tools.generic import QueryAction, UpdateAction
+from projects.agent.tools.project import DeleteProjectIn, ListProjectsIn
+from projects.agent.tools.task import BulkAssignIn, CreateTaskIn, GetTaskIn, ListTasksIn, UpdateTaskIn
+from projects.tests.test_agent_chat_api import AgentTestCase
+
+
+class ToolCacheInvalidationTests(SimpleTestCase):
+    def cache_with(self, *calls):
+        cache = ToolCache()
+        for key, (tool, payload) in enumerate(calls):
+            cache.put(key, read_rows(tool, payload), f'value {key}', generation=0)
+        return cache
+
+    def cached_keys(self, cache):
+        return sorted(cache._entries)
+
+    def test_writes_drop_exactly_the_affected_entries(self):
+        calls = [('get_task', GetTaskIn(task_id=1)), ('get_task', GetTaskIn(task_id=2)),
+                 ('list_tasks', ListTasksIn()), ('list_projects', ListProjectsIn()),
+                 ('orm_action', QueryAction(model_name='Comment'))]
+
+        cache = self.cache_with(*calls)
+        cache.invalidate(written_rows('update_task', UpdateTaskIn(task_id=1, status='DONE')))
+        self.assertEqual(self.cached_keys(cache), [1, 3, 4])
+
+        cache = self.cache_with(*calls)
+        cache.invalidate(written_rows('create_task', CreateTaskIn(title='t', description='d', project_id=1)))
+        self.assertEqual(self.cached_keys(cache), [0, 1, 3, 4])
+
+        cache = self.cache_with(*calls)
+        cache.invalidate(written_rows('orm_action', UpdateAction(model_name='task', id=2, data={})))
+        self.assertEqual(self.cached_keys(cache), [0, 3, 4])
+
+        # bulk writes may touch any row of the model
+        cache = self.cache_with(*calls)
+        cache.invalidate(written_rows('bulk_assign', BulkAssignIn(task_ids=[1], assignee_ids=[1])))
+        self.assertEqual(self.cached_keys(cache), [3, 4])
+
+        # deleting a project cascades to its tasks and their comments
+        cache = self.cache_with(*calls)
+        cache.invalidate(written_rows('delete_project', DeleteProjectIn(project_id=9)))
+        self.assertEqual(self.cached_keys(cache), [])
+        self.assertEqual(cache.stats(), {'hits': 0, 'misses': 0, 'invalidated': 5})
+
+    def test_reads_racing_a_write_are_not_stored(self):
+        cache = ToolCache()
+        hit, _, generation = cache.get('k')
+        self.assertFalse(hit)
+        cache.invalidate(set())
+        cache.put('k', {('task', None)}, 'stale', generation)
+        self.assertEqual(cache.get('k')[0], False)
+
+
+class MemoizedToolsTests(AgentTestCase):
+    def test_repeated_reads_hit_and_writes_invalidate(self):
+        from projects.agent.agent import AgentDeps, agent_factory
+        from projects.agent.llm import ScriptedModel
+
+        task = self.task
+        script = [
+            [('get_task', {'task_id': task.id}), ('list_projects', {})],
+            [('get_task', {'task_id': task.id}), ('list_projects', {})],
+            [('update_task', {'task_id': task.id, 'status': 'DONE'})],
+            [('get_task', {'task_id': task.id}), ('list_projects', {})],
+            lambda returns: {'status': returns['get_task'].status},
+        ]
+        deps = AgentDeps(user=self.user)
+        with agent_factory().override(model=ScriptedModel({'check': script})):
+            result = agent_factory().run_sync('check my task', deps=deps)
+        self.assertEqual(result.output, {'status': 'DONE'})
+        self.assertEqual(deps.meta()['tool_cache'], {'hits': 3, 'misses': 3, 'invalidated': 1})
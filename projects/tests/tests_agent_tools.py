@@ -1,11 +1,15 @@
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 
-from projects.models import Project, Task
+from projects.models import Comment, Project, Task, Tag
 from projects.agent.tools.task import (
-    CreateTaskIn, UpdateTaskIn, GetTaskIn, ListTasksIn, DeleteTaskIn,
-    tool_create_task, tool_get_task, tool_list_tasks, tool_update_task, tool_delete_task,
+    CreateTaskIn, UpdateTaskIn, GetTaskIn, ListTasksIn, DeleteTaskIn, SearchTasksIn,
+    BulkCreateTasksIn, BulkUpdateTasksIn, BulkAssignIn,
+    tool_create_task, tool_get_task, tool_list_tasks, tool_update_task, tool_delete_task, tool_search_tasks,
+    tool_bulk_create_tasks, tool_bulk_update_tasks, tool_bulk_assign,
 )
 from projects.agent.tools.project import (
     CreateProjectIn, UpdateProjectIn, GetProjectIn, ListProjectsIn, DeleteProjectIn,
@@ -16,9 +20,11 @@ from projects.agent.tools.tag import (
     tool_create_tag, tool_get_tag, tool_list_tags, tool_update_tag, tool_delete_tag,
 )
 from projects.agent.tools.comment import (
-    CreateCommentIn, UpdateCommentIn, GetCommentIn, ListCommentsIn, DeleteCommentIn,
+    CreateCommentIn, UpdateCommentIn, GetCommentIn, ListCommentsIn, DeleteCommentIn, BulkCreateCommentsIn,
     tool_create_comment, tool_get_comment, tool_list_comments, tool_update_comment, tool_delete_comment,
+    tool_bulk_create_comments,
 )
+from projects.tests.test_agent_chat_api import AgentTestCase
 
 
 class AgentToolsTaskTests(TestCase):
@@ -65,6 +71,16 @@ class AgentToolsTaskTests(TestCase):
         out = tool_create_task(self.admin, CreateTaskIn(title='Y', description='d', project_id=self.project.id))
         self.assertEqual(out.project_id, self.project.id)
 
+    def test_search_tasks_respects_visibility(self):
+        mine = tool_create_task(self.owner, CreateTaskIn(title='Soil moisture survey', description='d',
+                                                         project_id=self.project.id))
+        other_project = Project.objects.create(title='Other', description='d', owner=self.other)
+        tool_create_task(self.other, CreateTaskIn(title='Soil pH survey', description='d',
+                                                  project_id=other_project.id))
+        results = tool_search_tasks(self.owner, SearchTasksIn(query='soil survey'))
+        self.assertEqual([t.id for t in results], [mine.id])
+        self.assertEqual(len(tool_search_tasks(self.admin, SearchTasksIn(query='soil'))), 2)
+
     def test_project_and_tag_and_comment_tools(self):
         # Tags
         tag1 = tool_create_tag(self.owner, CreateTagIn(name='soil', color='#123456'))
@@ -105,3 +121,320 @@ class AgentToolsTaskTests(TestCase):
         self.assertEqual(com_out2.description, 'updated')
         res = tool_delete_comment(self.owner, DeleteCommentIn(comment_id=com_out.id))
         self.assertTrue(res['deleted'])
+
+
+class AgentToolsQueryCountTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.owner = User.objects.create_user(email='owner@example.com', password='pass')
+        self.assignee = User.objects.create_user(email='assignee@example.com', password='pass')
+        tag = Tag.objects.create(name='soil')
+        for i in range(30):
+            project = Project.objects.create(title=f'P{i}', description='d', owner=self.owner)
+            project.tags.add(tag)
+            task = Task.objects.create(title=f'T{i}', description='d', owner=self.owner, project=project)
+            task.assignees.add(self.owner, self.assignee)
+            task.tags.add(tag)
+
+    def test_list_tools_use_one_query_per_m2m_relation(self):
+        from projects.agent.tools.generic import QueryAction, tool_orm_action
+        # tasks + assignees + tags
+        with self.assertNumQueries(3):
+            tasks = tool_list_tasks(self.assignee, ListTasksIn())
+        self.assertEqual(len(tasks), 30)
+        self.assertEqual(tasks[0].assignee_ids, sorted([self.owner.id, self.assignee.id]))
+        # projects + tags
+        with self.assertNumQueries(2):
+            projects = tool_list_projects(self.owner, ListProjectsIn())
+        self.assertEqual(len(projects), 30)
+        self.assertEqual(len(projects[0].tag_ids), 1)
+        # orm_action query: savepoint in/out + tasks + assignees + tags
+        with self.assertNumQueries(5):
+            rows = tool_orm_action(self.owner, QueryAction(model_name='task', limit=50))
+        self.assertEqual(len(rows), 30)
+        self.assertEqual(len(rows[0]['assignees_ids']), 2)
+
+
+class AgentOrmQueryTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.owner = User.objects.create_user(email='owner@example.com', password='pass')
+        self.other = User.objects.create_user(email='other@example.com', password='pass')
+        self.project = Project.objects.create(title='P', description='d', owner=self.owner)
+        statuses = ['TODO', 'TODO', 'IN_PROGRESS', 'DONE', 'DONE', 'DONE']
+        for i, status in enumerate(statuses):
+            Task.objects.create(title=f'T{i}', description='d', owner=self.owner, project=self.project,
+                                status=status, estimated_hours=i + 0.5)
+        elsewhere = Project.objects.create(title='Q', description='d', owner=self.other)
+        Task.objects.create(title='X', description='d', owner=self.other, project=elsewhere, estimated_hours=9)
+
+    def query(self, user=None, **options):
+        from projects.agent.tools.generic import QueryAction, tool_orm_action
+        return tool_orm_action(user or self.owner, QueryAction(model_name='task', **options))
+
+    def test_aggregates_group_in_one_query(self):
+        # savepoint in/out + the GROUP BY query
+        with self.assertNumQueries(3):
+            rows = self.query(filters={'project_id': self.project.id}, aggregate=['count', 'sum:estimated_hours'],
+                              group_by=['status'], order_by=['-count', 'status'])
+        self.assertEqual(rows, [{'status': 'DONE', 'count': 3, 'sum_estimated_hours': 13.5},
+                                {'status': 'TODO', 'count': 2, 'sum_estimated_hours': 2.0},
+                                {'status': 'IN_PROGRESS', 'count': 1, 'sum_estimated_hours': 2.5}])
+        # scoped to the user's tasks; without group_by, one row
+        self.assertEqual(self.query(aggregate=['count']), [{'count': 6}])
+        self.assertEqual(self.query(self.other, aggregate=['count', 'sum:estimated_hours']),
+                         [{'count': 1, 'sum_estimated_hours': 9.0}])
+
+    def test_fields_order_and_offset(self):
+        with self.assertNumQueries(3):
+            rows = self.query(fields=['title', 'estimated_hours'], order_by=['-estimated_hours'], offset=1, limit=2)
+        self.assertEqual(rows, [{'title': 'T4', 'estimated_hours': 4.5}, {'title': 'T3', 'estimated_hours': 3.5}])
+        rows = self.query(order_by=['status', '-title'], limit=2)
+        self.assertEqual([(row['status'], row['title']) for row in rows], [('DONE', 'T5'), ('DONE', 'T4')])
+        self.assertEqual(rows[0]['assignees_ids'], [])
+
+    def test_cursor_pages_through_the_rows(self):
+        seen, cursor = [], ''
+        while cursor is not None:
+            page = self.query(fields=['title'], order_by=['-estimated_hours'], cursor=cursor, limit=4)
+            seen += [row['title'] for row in page['rows']]
+            cursor = page['next_cursor']
+        self.assertEqual(seen, ['T5', 'T4', 'T3', 'T2', 'T1', 'T0'])
+        page = self.query(order_by=['title'], cursor='', limit=5)
+        self.assertEqual(self.query(order_by=['title'], cursor=page['next_cursor'], limit=5)['rows'][0]['title'],
+                         'T5')
+        with self.assertRaisesMessage(ValueError, 'Invalid cursor'):
+            self.query(order_by=['due_date'], cursor=page['next_cursor'])
+
+    def test_only_whitelisted_fields_and_aggregates(self):
+        with self.assertRaisesMessage(ValueError, "Can't query 'owner__password' of task"):
+            self.query(fields=['title', 'owner__password'])
+        with self.assertRaisesMessage(ValueError, "Can't query 'assignees' of task"):
+            self.query(aggregate=['count'], group_by=['assignees'])
+        with self.assertRaisesMessage(ValueError, "Can't aggregate 'sum:id' of task"):
+            self.query(aggregate=['sum:id'])
+        with self.assertRaisesMessage(ValueError, "Can't aggregate 'sum:estimated_hours' of project"):
+            from projects.agent.tools.generic import QueryAction, tool_orm_action
+            tool_orm_action(self.owner, QueryAction(model_name='project', aggregate=['sum:estimated_hours']))
+
+
+class SerializerPlanTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.owner = User.objects.create_user(email='owner@example.com', password='pass')
+        self.other = User.objects.create_user(email='other@example.com', password='pass')
+        self.project = Project.objects.create(title='P', description='d', owner=self.owner)
+        self.task = Task.objects.create(title='T', description='d', owner=self.owner, project=self.project,
+                                        estimated_hours=1.5, due_date=timezone.now())
+        self.task.assignees.add(self.other)
+        self.dependent = Task.objects.create(title='D', description='d', owner=self.owner, project=self.project,
+                                             depends_on=self.task)
+        self.comment = Comment.objects.create(title='C', description='d', owner=self.owner, task=self.task)
+        Comment.objects.create(title='C2', description='d', owner=self.other, task=self.task)
+
+    def read(self, user, model_name, id):
+        from projects.agent.tools.generic import ReadAction, tool_orm_action
+        return tool_orm_action(user, ReadAction(model_name=model_name, id=id))
+
+    def test_plans_are_compiled_once_per_model(self):
+        from projects.agent.tools.generic import get_model_fields, model_schema, serializer_plan
+        self.assertIs(serializer_plan(Task), serializer_plan(Task))
+        self.assertIs(model_schema(Task), model_schema(Task))
+        self.assertEqual(model_schema(Tag)(name='x', color='#fff').name, 'x')
+        get_model_fields(Task).clear()  # callers get a copy
+        self.assertIn('title', get_model_fields(Task))
+        self.assertNotIn('password', [key for key, _, _ in serializer_plan(get_user_model()).columns])
+
+    def test_reads_include_the_reverse_relations_the_user_may_see(self):
+        # savepoint in/out + task + assignees + tags + comments + dependent tasks
+        with self.assertNumQueries(7):
+            row = self.read(self.owner, 'task', self.task.id)
+        self.assertEqual((row['id'], row['estimated_hours'], row['due_date']),
+                         (self.task.id, 1.5, self.task.due_date.isoformat()))
+        self.assertEqual((row['assignees_ids'], row['tags_ids'], row['task_ids']),
+                         ([self.other.id], [], [self.dependent.id]))
+        # comments are listed to their owners only (projects.scoping)
+        self.assertEqual(row['comment_ids'], [self.comment.id])
+
+        # the assignee sees the task, but not the dependent task, nor the owner's comment
+        row = self.read(self.other, 'task', self.task.id)
+        self.assertEqual(row['task_ids'], [])
+        self.assertNotIn(self.comment.id, row['comment_ids'])
+        self.assertEqual(len(row['comment_ids']), 1)
+
+        user = self.read(self.other, 'user', self.owner.id)
+        self.assertNotIn('password', user)
+        self.assertEqual((user['task_ids'], user['project_ids'], user['assigned_tasks_ids']), ([self.task.id], [], []))
+
+    def test_queries_leave_the_reverse_relations_out(self):
+        from projects.agent.tools.generic import QueryAction, tool_orm_action
+        rows = tool_orm_action(self.owner, QueryAction(model_name='task'))
+        self.assertEqual(len(rows), 2)
+        self.assertNotIn('comment_ids', rows[0])
+        self.assertIsInstance(rows[0]['id'], int)
+
+
+class AgentBulkToolsTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.owner = User.objects.create_user(email='owner@example.com', password='pass')
+        self.other = User.objects.create_user(email='other@example.com', password='pass')
+        self.project = Project.objects.create(title='P', description='d', owner=self.owner)
+        self.other_project = Project.objects.create(title='Q', description='d', owner=self.other)
+        self.tag = Tag.objects.create(name='soil')
+
+    def create(self, n):
+        return tool_bulk_create_tasks(self.owner, BulkCreateTasksIn(tasks=[
+            CreateTaskIn(title=f'soil sample {i}', description='d', project_id=self.project.id,
+                         assignee_ids=[self.other.id], tag_ids=[self.tag.id], estimated_hours=1.5)
+            for i in range(n)]))
+
+    def test_bulk_create_reports_per_item_errors(self):
+        out = tool_bulk_create_tasks(self.owner, BulkCreateTasksIn(tasks=[
+            CreateTaskIn(title='a', description='d', project_id=self.project.id, tag_ids=[self.tag.id]),
+            CreateTaskIn(title='b', description='d', project_id=self.other_project.id),
+            CreateTaskIn(title='c', description='d', project_id=self.project.id, tag_ids=[999]),
+            CreateTaskIn(title='d', description='d', project_id=self.project.id, assignee_ids=[self.other.id]),
+        ]))
+        self.assertEqual((out.applied, out.failed), (2, 2))
+        self.assertEqual([r.ok for r in out.results], [True, False, False, True])
+        self.assertEqual(out.results[1].error, 'Not allowed to create tasks in this project')
+        self.assertEqual(out.results[2].error, 'Unknown tag ids: [999]')
+        self.assertEqual(out.results[0].task.tag_ids, [self.tag.id])
+        self.assertEqual(out.results[3].task.assignee_ids, [self.other.id])
+        self.assertEqual(out.results[3].task.llm_context['last_action'], 'create')
+        # derived data is refreshed although bulk_create skips the signals
+        found = tool_search_tasks(self.owner, SearchTasksIn(query='soil'))
+        self.assertEqual([t.title for t in found], ['a'])
+
+        out = tool_bulk_create_tasks(self.owner, BulkCreateTasksIn(all_or_nothing=True, tasks=[
+            CreateTaskIn(title='e', description='d', project_id=self.project.id),
+            CreateTaskIn(title='f', description='d', project_id=12345),
+        ]))
+        self.assertEqual((out.applied, out.failed), (0, 2))
+        self.assertEqual(out.results[1].error, 'Project 12345 does not exist')
+        self.assertFalse(Task.objects.filter(title='e').exists())
+
+    def test_bulk_tools_use_a_fixed_number_of_queries(self):
+        counts = []
+        for n in (2, 20):
+            with CaptureQueriesContext(connection) as created:
+                out = self.create(n)
+            ids = [r.task.id for r in out.results]
+            with CaptureQueriesContext(connection) as updated:
+                tool_bulk_update_tasks(self.owner, BulkUpdateTasksIn(updates=[
+                    UpdateTaskIn(task_id=i, status='DONE', tag_ids=[]) for i in ids]))
+            counts.append((len(created), len(updated)))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(Task.objects.filter(status='DONE').count(), 22)
+        self.assertFalse(Task.tags.through.objects.exists())
+
+    def test_bulk_update_and_assign(self):
+        ids = [r.task.id for r in self.create(3).results]
+        theirs = Task.objects.create(title='theirs', description='d', owner=self.other, project=self.other_project)
+        out = tool_bulk_update_tasks(self.owner, BulkUpdateTasksIn(updates=[
+            UpdateTaskIn(task_id=ids[0], status='IN_PROGRESS', depends_on_id=ids[1], llm_notes='started'),
+            UpdateTaskIn(task_id=theirs.id, status='DONE'),
+            UpdateTaskIn(task_id=ids[0], status='DONE'),
+            UpdateTaskIn(task_id=ids[1], due_date='2030-01-01T00:00:00Z', assignee_ids=[]),
+        ]))
+        self.assertEqual([r.ok for r in out.results], [True, False, False, True])
+        self.assertIn('earlier item', out.results[2].error)
+        first = Task.objects.get(id=ids[0])
+        self.assertEqual((first.status, first.depends_on_id), ('IN_PROGRESS', ids[1]))
+        self.assertEqual(first.llm_context['summary_text'], 'started')
+        self.assertEqual(out.results[3].task.assignee_ids, [])
+        self.assertEqual(out.results[3].task.due_date[:10], '2030-01-01')
+        self.assertEqual(Task.objects.get(id=theirs.id).status, 'TODO')
+
+        out = tool_bulk_assign(self.owner, BulkAssignIn(task_ids=ids + [theirs.id], assignee_ids=[self.owner.id]))
+        self.assertEqual((out.applied, out.failed), (3, 1))
+        self.assertEqual(out.results[0].task.assignee_ids, sorted([self.owner.id, self.other.id]))
+        out = tool_bulk_assign(self.owner, BulkAssignIn(task_ids=ids, assignee_ids=[self.owner.id], replace=True))
+        self.assertTrue(all(r.task.assignee_ids == [self.owner.id] for r in out.results))
+        with self.assertRaisesMessage(ValueError, 'Unknown assignee ids: [999]'):
+            tool_bulk_assign(self.owner, BulkAssignIn(task_ids=ids, assignee_ids=[999]))
+
+    def test_bulk_create_comments(self):
+        mine = Task.objects.create(title='mine', description='d', owner=self.owner, project=self.project)
+        hidden = Task.objects.create(title='hidden', description='d', owner=self.other, project=self.other_project)
+        out = tool_bulk_create_comments(self.owner, BulkCreateCommentsIn(comments=[
+            CreateCommentIn(title='t', description='irrigation', task_id=mine.id),
+            CreateCommentIn(title='t', description='x', task_id=hidden.id),
+            CreateCommentIn(title='t', description='x', task_id=9999),
+        ]))
+        self.assertEqual([r.ok for r in out.results], [True, False, False])
+        self.assertEqual(out.results[1].error, 'Not allowed to comment on this task')
+        self.assertEqual(out.results[2].error, 'Task 9999 does not exist')
+        self.assertEqual(out.results[0].comment.owner_id, self.owner.id)
+        self.assertEqual(Comment.objects.count(), 1)
+        self.assertEqual([t.title for t in tool_search_tasks(self.owner, SearchTasksIn(query='irrigation'))], ['mine'])
+
+
+class SharedAgentTests(AgentTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = get_user_model().objects.create_user(email='o@example.com', password='pass')
+
+    def test_agents_are_built_once_and_take_the_user_from_deps(self):
+        from pydantic_ai.models.test import TestModel
+        from projects.agent.agent import AgentDeps, agent_factory, orm_agent_factory
+
+        agent = agent_factory()
+        self.assertIs(agent_factory(), agent)
+        self.assertIs(orm_agent_factory(), orm_agent_factory())
+        self.assertEqual(len(agent._function_toolset.tools), 25)
+
+        model = TestModel(call_tools=['list_tasks'])
+        with agent.override(model=model):
+            runs = [agent.run_sync('list my tasks', deps=AgentDeps(user=user)) for user in (self.user, self.other)]
+        returned = [[part.content for message in run.all_messages() for part in message.parts
+                     if part.part_kind == 'tool-return' and part.tool_name == 'list_tasks'] for run in runs]
+        self.assertEqual([[t.title for t in tasks] for tasks in returned[0]], [['T']])
+        self.assertEqual(returned[1], [[]])
+
+    def test_tool_calls_of_a_response_run_side_by_side_and_writes_one_at_a_time(self):
+        from projects.agent.agent import AgentDeps, agent_factory
+        from projects.agent.llm import ScriptedModel
+
+        script = [
+            # several writes at once: on SQLite, these used to fail with "database is locked"
+            [('create_task', {'title': f'new {i}', 'description': 'd', 'project_id': self.project.id})
+             for i in range(4)],
+            [('get_task', lambda returns: {'task_id': returns['create_task'].id}), ('list_tasks', {}),
+             ('search_tasks', {'query': 'new'}), ('list_projects', {}), ('list_tags', {})],
+            lambda returns: {'message': 'ok'},
+        ]
+        deps = AgentDeps(user=self.user)
+        with agent_factory().override(model=ScriptedModel({'add': script})):
+            agent_factory().run_sync('add four tasks', deps=deps)
+        self.assertEqual(deps.actions, ['create'] * 4)
+        self.assertEqual(Task.objects.filter(title__startswith='new ').count(), 4)
+        tool_time = deps.meta()['tool_time']
+        self.assertEqual(tool_time['calls'], 9)
+        self.assertEqual(tool_time['saved_ms'], round(tool_time['busy_ms'] - tool_time['wall_ms'], 1))
+        self.assertGreaterEqual(tool_time['saved_ms'], 0)
+
+    def test_tool_timings_compare_total_and_wall_clock_time(self):
+        from projects.agent.concurrency import ToolTimings
+        timings = ToolTimings()
+        for start, end in ((0.0, 0.1), (0.0, 0.1), (0.05, 0.2), (0.3, 0.4)):
+            timings.add(start, end)
+        self.assertEqual(timings.stats(), {'calls': 4, 'busy_ms': 450.0, 'wall_ms': 300.0, 'saved_ms': 150.0})
+
+    def test_scripted_model_replays_tool_calls_offline(self):
+        from projects.agent.agent import AgentDeps, agent_factory
+        from projects.agent.llm import ScriptedModel, build_model
+
+        deps = AgentDeps(user=self.user)
+        with agent_factory().override(model=ScriptedModel()):
+            summary = agent_factory().run_sync('a summary please', deps=AgentDeps(user=self.user))
+            triage = agent_factory().run_sync('triage my work', deps=deps)
+        self.assertEqual(summary.output, {'message': 'You have 1 tasks across 1 projects.'})
+        calls = [part.tool_name for message in triage.all_messages() for part in message.parts
+                 if part.part_kind == 'tool-call']
+        self.assertEqual(calls, ['list_tasks', 'update_task', 'create_comment', 'final_result'])
+        self.assertEqual(deps.actions, ['update', 'create'])
+        self.assertEqual(Task.objects.get(title='T').status, 'IN_PROGRESS')
+        with self.assertRaisesMessage(ValueError, "Unknown AGENT_MODEL 'gpt'"):
+            build_model('gpt')
@@ -68,3 +68,118 @@ class ProjectsAPITests(APITestCase):
         # delete comment
         resp = self.client.delete(f'/api/comments/{comment_id}/')
         self.assertEqual(resp.status_code, status.HTTP_204_NO_CONTENT)
+
+
+class TaskListQueryCountTests(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.owner = User.objects.create_user(email='owner@example.com', password='pass1234')
+        self.assignee = User.objects.create_user(email='assignee@example.com', password='pass1234')
+        self.tag = Tag.objects.create(name='soil', color='#111111')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.owner)
+
+    def _add_tasks(self, n):
+        for i in range(n):
+            p = Project.objects.create(title=f'P{i}', description='d', owner=self.owner)
+            p.tags.add(self.tag)
+            t = Task.objects.create(title=f'T{i}', description='d', owner=self.owner, project=p)
+            t.assignees.add(self.assignee)
+            t.tags.add(self.tag)
+
+    def _count_list_queries(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get('/api/tasks/')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries), len(resp.data['results'])
+
+    def test_joins_are_opt_in(self):
+        self._add_tasks(1)
+        self.assertFalse(Task.objects.all().query.select_related)
+        with self.assertNumQueries(2):  # task + owner
+            Task.objects.get(title='T0').owner
+        with self.assertNumQueries(4):  # task joined with owner and project, then assignees, tags, project tags
+            task = Task.objects.with_related().get(title='T0')
+            self.assertEqual((task.owner.email, task.project.owner.email, len(task.project.tags.all())),
+                             ('owner@example.com', 'owner@example.com', 1))
+
+    def test_task_list_query_count_is_independent_of_row_count(self):
+        self._add_tasks(2)
+        small, rows = self._count_list_queries()
+        self.assertEqual(rows, 2)
+        self._add_tasks(23)
+        large, rows = self._count_list_queries()
+        self.assertEqual(rows, 25)
+        self.assertEqual(small, large)
+
+    def test_task_rows_endpoint_has_counts_previews_and_labels(self):
+        self._add_tasks(3)
+        task = Task.objects.order_by('id').first()
+        for i in range(5):
+            Comment.objects.create(title=f'C{i}', description='d', owner=self.owner, task=task)
+        Comment.objects.create(title='gone', description='d', owner=self.owner, task=task).delete()
+
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get('/api/tasks/rows/?comments=2')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        small = len(ctx.captured_queries)
+        row = resp.data['results'][0]
+        self.assertEqual(row['id'], task.id)
+        self.assertEqual(row['comment_count'], 5)
+        self.assertEqual([c['title'] for c in row['latest_comments']], ['C4', 'C3'])
+        self.assertEqual(row['assignees'], ['assignee@example.com'])
+        self.assertEqual(row['tags'], ['soil'])
+        self.assertEqual(row['project_title'], task.project.title)
+        self.assertEqual(resp.data['results'][1]['comment_count'], 0)
+
+        self._add_tasks(20)
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get('/api/tasks/rows/?comments=2')
+        self.assertEqual(len(resp.data['results']), 23)
+        self.assertEqual(len(ctx.captured_queries), small)
+
+    def test_sparse_fields_and_expand(self):
+        self._add_tasks(3)
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get('/api/tasks/?fields=id,title,project')
+        row = resp.data['results'][0]
+        self.assertEqual(set(row), {'id', 'title', 'project'})
+        self.assertIsInstance(row['project'], int)
+        select = [q['sql'] for q in ctx.captured_queries if 'FROM "projects_task"' in q['sql']][-1]
+        self.assertNotIn('"projects_task"."description"', select)
+        self.assertNotIn('JOIN "projects_project"', select)
+        self.assertNotIn('JOIN "users_', select)
+        # no M2M prefetches when tags/assignees are not requested: count, page
+        self.assertEqual(len(ctx.captured_queries), 2)
+
+        resp = self.client.get('/api/tasks/?expand=owner,project.owner,tags')
+        row = resp.data['results'][0]
+        self.assertEqual(row['owner']['email'], 'owner@example.com')
+        self.assertEqual(row['project']['owner']['email'], 'owner@example.com')
+        self.assertEqual(row['project']['tags'], [self.tag.id])
+        self.assertEqual(row['tags'][0]['name'], 'soil')
+        self.assertEqual(row['assignees'], [self.assignee.id])
+
+        self._add_tasks(10)
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get('/api/tasks/?expand=owner,project.owner,tags')
+        self.assertEqual(len(resp.data['results']), 13)
+        large = len(ctx.captured_queries)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/api/tasks/?expand=owner,project.owner,tags&page_size=2')
+        self.assertEqual(len(ctx.captured_queries), large)
+
+    def test_expand_is_ignored_on_writes(self):
+        project = Project.objects.create(title='P', description='d', owner=self.owner)
+        resp = self.client.post('/api/tasks/?expand=project&fields=id', {
+            'title': 'T', 'description': 'd', 'owner_id': self.owner.id, 'project_id': project.id,
+        }, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(resp.data['project'], project.id)
+        self.assertIn('title', resp.data)
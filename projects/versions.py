@@ -0,0 +1,60 @@
+"""
+Data versions: counters that every write bumps, so anything derived from a user's data (e.g.
+the agent's answer cache, ``projects.agent.answers``) can be keyed on them and is never
+served after the data changed.
+
+``current(user)`` is the tuple of counters ``user``'s view of the data depends on:
+
+- ``user:<id>``  bumped by writes to tasks the user owns or is assigned to (their comments and
+                 their project included), and to the user's own projects and comments
+- ``shared``     bumped by writes to tags, which everyone sees
+- ``all``        bumped by every write; only read for staff, who see everything
+
+The bumps come from ``projects.signals`` (``tasks_changed`` covers the bulk writes too).
+Queryset ``update()`` calls bypass them, as they bypass the other signal handlers.
+"""
+from typing import Iterable
+
+from django.db.models import F
+
+from . import scoping
+from .models import DataVersion, Task
+
+
+def keys(user) -> list:
+    user_keys = [f'user:{user.id}', 'shared']
+    return user_keys + ['all'] if scoping.is_unrestricted(user) else user_keys
+
+
+def current(user, using='default') -> tuple:
+    """The versions of the data ``user`` sees (one query; counters start at 0 on first use)."""
+    wanted = keys(user)
+    versions = dict(DataVersion.objects.using(using).filter(key__in=wanted).values_list('key', 'version'))
+    missing = [key for key in wanted if key not in versions]
+    if missing:
+        # the rows must exist before anything is keyed on them, or a bump would have nothing to update
+        DataVersion.objects.using(using).bulk_create([DataVersion(key=key) for key in missing],
+                                                     ignore_conflicts=True)
+        versions.update(DataVersion.objects.using(using).filter(key__in=missing).values_list('key', 'version'))
+    return tuple(versions[key] for key in wanted)
+
+
+def bump(keys: Iterable[str], using='default'):
+    """Bump the given counters and ``all``."""
+    DataVersion.objects.using(using).filter(key__in={*keys, 'all'}).update(version=F('version') + 1)
+
+
+def bump_users(user_ids: Iterable[int], using='default'):
+    bump((f'user:{user_id}' for user_id in user_ids if user_id is not None), using)
+
+
+def bump_tasks(task_ids: Iterable[int], using='default'):
+    """Bump the owners and assignees of the given tasks."""
+    task_ids = list(task_ids)
+    if not task_ids:
+        return
+    tasks = Task.all_objects.using(using).filter(id__in=task_ids)
+    owners = tasks.values_list('owner_id', flat=True)
+    assignees = Task.assignees.through.objects.using(using).filter(task_id__in=task_ids).values_list(
+        'customuser_id', flat=True)
+    bump_users(set(owners.union(assignees)), using)
@@ -1,17 +1,33 @@
 from rest_framework import viewsets, permissions
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import action
+from rest_framework.exceptions import MethodNotAllowed, NotFound
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from asgiref.sync import sync_to_async
 from django.http import StreamingHttpResponse
-from django.db.models import Q
-from django.shortcuts import render
+from django.utils.decorators import classonlymethod
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from django.db.models import Count, Exists, F, OuterRef, Prefetch, Subquery, Window
+from django.db.models.functions import Coalesce, RowNumber
+from django.shortcuts import get_object_or_404, render
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
-import json
-import time
+from collections import defaultdict
 
-from .agent.agent import orm_agent_factory, agent_factory
-from .models import Project, Task, Tag, Comment
-from .serializers import ProjectSerializer, TaskSerializer, TagSerializer, CommentSerializer
+from . import jobs, metrics, readmodel, scoping, search
+from .agent import answers, context as chat_context, history as chat_history
+from .agent.agent import SYSTEM_PROMPT, AgentDeps, agent_factory
+from .agent.concurrency import ChatLimitExceeded, chat_limiter
+from .agent.ratelimit import admission
+from .agent.streaming import ChatSlot, EventStreamRenderer, chat_events, sse_event
+from .models import Project, Task, Tag, Comment, TaskRow, Job
+from .pagination import PageNumberOrKeysetPagination
+from .serializers import (ProjectSerializer, TaskSerializer, TagSerializer, CommentSerializer, TaskRowSerializer,
+                          TaskRowReadModelSerializer, JobSerializer, optimize_queryset)
 
 
 class IsOwnerOrReadOnly(permissions.BasePermission):
@@ -21,44 +37,60 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
         return getattr(obj, 'owner_id', None) == getattr(request.user, 'id', None)
 
 
-class TagViewSet(viewsets.ModelViewSet):
+# query_budget: most queries a view may run per request, authentication (session + user) included;
+# enforced by projects.querybudget when settings.QUERY_BUDGET_STRICT is on.
+
+class SparseFieldsetViewSetMixin:
+    """Load only what ``?fields=``/``?expand=`` make the serializer render on reads, in place of
+    the ``with_related()`` profile the viewsets start from."""
+    sparse_actions = ('list', 'retrieve')
+
+    def filter_queryset(self, queryset):
+        qs = super().filter_queryset(queryset)
+        if self.action in self.sparse_actions:
+            qs = optimize_queryset(qs, self.get_serializer())
+        return qs
+
+
+class TagViewSet(SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
     queryset = Tag.objects.all().order_by('id')
     serializer_class = TagSerializer
     permission_classes = [IsAuthenticated]
+    query_budget = {'list': 4, 'retrieve': 3}
 
 
-class ProjectViewSet(viewsets.ModelViewSet):
+class ProjectViewSet(SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
     serializer_class = ProjectSerializer
     permission_classes = [IsAuthenticated, IsOwnerOrReadOnly]
+    query_budget = {'list': 5, 'retrieve': 4}
 
     def get_queryset(self):
-        user = self.request.user
-        qs = Project.objects.all().order_by('id')
-        if not user.is_staff and self.action == 'list':
-            qs = qs.filter(owner=user)
+        qs = Project.objects.with_related().order_by('id')
+        if self.action == 'list':
+            qs = scoping.owned(self.request.user, qs)
         return qs
 
 
-class TaskViewSet(viewsets.ModelViewSet):
+class TaskViewSet(SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
     serializer_class = TaskSerializer
     permission_classes = [IsAuthenticated, IsOwnerOrReadOnly]
+    pagination_class = PageNumberOrKeysetPagination
+    # list/retrieve with every expansion; rows with live comment previews
+    query_budget = {'list': 7, 'retrieve': 6, 'rows': 7}
 
     # allow safe, whitelisted ordering fields
     ALLOWED_ORDERING = {'id', 'title', 'created', 'updated', 'due_date', 'priority', 'status'}
+    MAX_ROW_COMMENTS = 10
 
     def get_queryset(self):
         request = self.request
         user = request.user
-        qs = Task.objects.all()
-        # permission scoping
-        if not user.is_staff:
-            qs = qs.filter(Q(owner=user) | Q(assignees=user)).distinct()
+        qs = scoping.visible_tasks(user).with_related()
 
         # filters
         q = request.query_params.get('q')
         if q:
-            qs = qs.filter(Q(title__icontains=q) | Q(description__icontains=q) | Q(tags__name__icontains=q) | Q(
-                project__title__icontains=q))
+            qs = search.filter_tasks(qs, q)
 
         status_f = request.query_params.get('status')
         if status_f:
@@ -97,8 +129,11 @@ class TaskViewSet(viewsets.ModelViewSet):
             # if false, restrict to owner-only view regardless of staff flag (still harmless for staff)
             qs = qs.filter(owner=user)
 
-        # ordering
-        ordering = request.query_params.get('ordering') or 'id'
+        # ordering: by relevance when searching without an explicit ordering
+        ordering = request.query_params.get('ordering')
+        if q and not ordering and 'search_rank' in qs.query.annotations:
+            return qs.order_by('search_rank', 'id')
+        ordering = ordering or 'id'
         if ordering:
             raw = ordering
             desc = raw.startswith('-')
@@ -110,48 +145,171 @@ class TaskViewSet(viewsets.ModelViewSet):
 
         return qs
 
-
-class CommentViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['get'], url_path='rows')
+    def rows(self, request):
+        """
+        Table rows for the SPV: the list filters/ordering/pagination plus comment counts,
+        the latest ``?comments=N`` comments and flattened assignee/tag labels, in a fixed
+        number of queries. Served from the TaskRow read model when it is enabled.
+        """
+        try:
+            n_comments = min(max(int(request.query_params.get('comments', 3)), 0), self.MAX_ROW_COMMENTS)
+        except ValueError:
+            n_comments = 3
+        if readmodel.is_enabled():
+            return self._read_model_rows(request, n_comments)
+
+        live_comments = Comment.objects.filter(task=OuterRef('pk')).order_by()
+        qs = self.filter_queryset(self.get_queryset()).prefetch_related(None).prefetch_related(
+            'assignees', 'tags',
+            Prefetch('comment_set', to_attr='latest_comments',
+                     queryset=Comment.objects.select_related('owner')
+                     .order_by('-created', '-id')[:n_comments]),
+        ).annotate(
+            comment_count=Coalesce(Subquery(
+                live_comments.values('task').annotate(c=Count('id')).values('c')), 0),
+            last_comment_at=Subquery(live_comments.order_by('-created').values('created')[:1]),
+        )
+        page = self.paginate_queryset(qs)
+        serializer = TaskRowSerializer(page if page is not None else qs, many=True)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
+    def _read_model_rows(self, request, n_comments):
+        params = request.query_params
+        user = request.user
+        qs = scoping.visible_task_rows(user, TaskRow.objects.all())
+        q = params.get('q')
+        if q:
+            qs = qs.filter(task_id__in=search.filter_tasks(Task.objects.all(), q).values('id'))
+        for param in ('status', 'priority'):
+            if params.get(param):
+                qs = qs.filter(**{param: params[param]})
+        if params.get('project'):
+            qs = qs.filter(project_id=params['project'])
+        tag = params.get('tag')
+        if tag:
+            tag_filter = {'tag_id': int(tag)} if tag.isdigit() else {'tag__name': tag}
+            qs = qs.filter(Exists(Task.tags.through.objects.filter(task_id=OuterRef('task_id'), **tag_filter)))
+        assigned = params.get('assigned')
+        if assigned:
+            if not assigned.isdigit():
+                qs = qs.none()
+            else:
+                qs = qs.filter(Exists(Task.assignees.through.objects.filter(
+                    task_id=OuterRef('task_id'), customuser_id=int(assigned))))
+        if (params.get('mine', '').lower() in {'1', 'true', 'yes'}
+                or params.get('include_assigned', '').lower() in {'0', 'false', 'no'}):
+            qs = qs.filter(owner_id=user.id)
+
+        ordering = params.get('ordering') or 'id'
+        field = ordering.lstrip('-')
+        if field in self.ALLOWED_ORDERING or field == 'sort_key':
+            qs = qs.order_by(ordering.replace('id', 'task_id') if field == 'id' else ordering)
+        else:
+            qs = qs.order_by('task_id')
+
+        page = self.paginate_queryset(qs)
+        rows = page if page is not None else list(qs)
+        latest = defaultdict(list)
+        if n_comments:
+            comments = (Comment.objects.select_related('owner')
+                        .filter(task_id__in=[r.task_id for r in rows])
+                        .annotate(position=Window(RowNumber(), partition_by=F('task_id'),
+                                                  order_by=[F('created').desc(), F('id').desc()]))
+                        .filter(position__lte=n_comments).order_by('task_id', 'position'))
+            for c in comments:
+                latest[c.task_id].append(c)
+        serializer = TaskRowReadModelSerializer(rows, many=True, context={'latest_comments': latest})
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
+
+class CommentViewSet(SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
     serializer_class = CommentSerializer
     permission_classes = [IsAuthenticated, IsOwnerOrReadOnly]
+    pagination_class = PageNumberOrKeysetPagination
+    query_budget = {'list': 7, 'retrieve': 6}
 
     def get_queryset(self):
-        user = self.request.user
-        if user.is_staff:
-            return Comment.objects.all().order_by('id')
-        return Comment.objects.filter(owner=user).order_by('id')
+        return scoping.owned(self.request.user, Comment.objects.with_related().order_by('id'))
 
 
-class AgentChatView(APIView):
+class AsyncAPIView(View):
+    """
+    An APIView with async handlers: DRF authentication, permissions, parsing, exception
+    handling and rendering are reused from a plain APIView; the handler itself is awaited.
+    """
     permission_classes = [IsAuthenticated]
-
-    def post(self, request):
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        # like APIView, CSRF is enforced by SessionAuthentication instead
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        api_view = APIView(permission_classes=self.permission_classes, renderer_classes=self.renderer_classes)
+        api_view.args, api_view.kwargs, api_view.headers, api_view.format_kwarg = args, kwargs, {}, None
+        request = api_view.request = api_view.initialize_request(request, *args, **kwargs)
+        try:
+            await sync_to_async(api_view.initial)(request, *args, **kwargs)
+            handler = getattr(self, request.method.lower(), None)
+            if handler is None:
+                raise MethodNotAllowed(request.method)
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = api_view.handle_exception(exc)
+        return api_view.finalize_response(request, response, *args, **kwargs)
+
+
+def chat_prompt(ctx_summary):
+    return (f"Respond to the request using optional context and previous messages. "
+            f"\n\n{chat_context.dumps(ctx_summary)}")
+
+
+def prompt_tokens(prompt, history):
+    """Estimated prompt tokens of a chat turn, as charged to the rate limits (``projects.agent.ratelimit``)."""
+    return chat_context.estimate_tokens(SYSTEM_PROMPT) + chat_context.estimate_tokens(prompt) + history.tokens
+
+
+def compact_history(request, body, context):
+    """The chat request's ``previous_messages``, compacted (see ``projects.agent.history``)."""
+    history = chat_history.compact(body.get('previous_messages'),
+                                   f"{request.user.id}:{request.session.session_key or '-'}")
+    if (body.get('options') or {}).get('persist_summary'):
+        chat_history.persist_summary(request.user, context, history.summary)
+    return history
+
+
+class AgentChatView(AsyncAPIView):
+    """
+    POST /api/agent/chat. Async: the agent run is awaited (tools run on the bounded tool
+    pool), so slow LLM round trips don't hold a server thread. Runs are rate limited by
+    ``projects.agent.ratelimit`` and their concurrency by ``projects.agent.concurrency.chat_limiter``;
+    over a limit the view answers 429 with Retry-After.
+    The agent's output is returned with the run's ``meta`` (``AgentDeps.meta()``). Long
+    ``previous_messages`` are compacted first; ``meta.history`` reports the tokens saved.
+
+    Answers of runs that only read are cached (``projects.agent.answers``): a repeated question
+    is answered from the cache until the user's data changes, without a model call or a rate
+    limit draw; ``meta.answer_cache`` says whether it was. ``options.no_cache`` skips the cache.
+
+    With ``options.async`` the run is queued as a background job instead (``projects.jobs``):
+    the answer is a 202 with the job's id and the URLs to poll it or follow its events.
+    """
+
+    async def post(self, request):
         # Parse body
         body = request.data or {}
         message = body.get('message', '')
-        previous_messages = body.get('previous_messages', [])
         context = body.get('context', {}) or {}
         options = body.get('options', {}) or {}
 
         # Build a concise context snapshot (without hitting the LLM yet)
-        ctx_type = context.get('type', 'none')
-        ctx_id = context.get('id')
-        if ctx_type == 'task' and ctx_id:
-            try:
-                t = Task.objects.get(id=ctx_id)
-                # minimal snapshot for tests
-                ctx_summary = TaskSerializer(t).data
-            except Task.DoesNotExist:
-                ctx_summary = {'type': 'task', 'id': ctx_id, 'missing': True}
-        elif ctx_type == 'project' and ctx_id:
-            try:
-                p = Project.objects.get(id=ctx_id)
-                ctx_summary = ProjectSerializer(p).data
-            except Project.DoesNotExist:
-                ctx_summary = {'type': 'project', 'id': ctx_id, 'missing': True}
-        else:
-            ctx_summary = {'type': 'none'}
-
+        ctx_summary = dict(await sync_to_async(chat_context.snapshot)(request.user, context))
         ctx_summary['request'] = message
 
         # Test-friendly meta: allow toggling change via options
@@ -174,33 +332,126 @@ class AgentChatView(APIView):
             }
             return Response(response)
 
-        prompt = (f"Respond to the request using optional context and previous messages. "
-                  f"\n\n{ctx_summary}")
+        prompt = chat_prompt(ctx_summary)
+        history = await sync_to_async(compact_history)(request, body, context)
+        deps = AgentDeps(user=request.user, history=history)
+        answer_key = None
+        if answers.enabled(options) and not options.get('async'):
+            answer_key = await sync_to_async(answers.key)(request.user, message, context, history)
+            cached = await sync_to_async(answers.lookup)(answer_key)
+            if cached is not None:
+                metrics.AGENT_RUNS.inc(agent='chat', outcome='cached')
+                return Response({**cached['output'], 'meta': {
+                    **cached['meta'], 'history': history.meta(), 'answer_cache': {'hit': True, 'stored': False}}})
+        try:
+            await admission.admit(request.user.id, prompt_tokens(prompt, history))
+            if options.get('async'):
+                return await self.enqueue(request, prompt, history)
+            async with chat_limiter.slot(request.user.id):
+                with metrics.observe_run('chat'):
+                    result = await agent_factory().run(prompt, message_history=history.messages(SYSTEM_PROMPT),
+                                                       deps=deps)
+        except ChatLimitExceeded as exc:
+            metrics.AGENT_RUNS.inc(agent='chat', outcome='rejected')
+            return Response({'detail': str(exc)}, status=429, headers={'Retry-After': str(exc.retry_after)})
+        output = result.output if isinstance(result.output, dict) else {'message': result.output}
+        meta = deps.meta()
+        stored = answer_key is not None and answers.cacheable(deps)
+        if stored:
+            await sync_to_async(answers.store)(answer_key, output, meta)
+        return Response({**output, 'meta': {**meta, 'answer_cache': {'hit': False, 'stored': stored}}})
+
+    async def enqueue(self, request, prompt, history):
+        try:
+            job = await sync_to_async(jobs.enqueue_chat)(request.user, prompt, history)
+        except jobs.JobLimitExceeded as exc:
+            return Response({'detail': str(exc)}, status=429, headers={'Retry-After': '30'})
+        return Response({'job_id': job.id, 'status': job.status, 'url': reverse('job', args=[job.id]),
+                         'events_url': reverse('job-events', args=[job.id])}, status=202)
+
+
+class JobView(APIView):
+    """GET /api/jobs/<id>: a background job of the user's (status, progress events, result)."""
+    permission_classes = [IsAuthenticated]
+    query_budget = 3
+
+    def get(self, request, pk):
+        job = get_object_or_404(Job, id=pk, user=request.user)
+        return Response(JobSerializer(job).data)
 
-        agent = agent_factory(user=request.user)
-        response = agent.run_sync(prompt, message_history=previous_messages)
-        return Response(response.output)
 
+class JobEventsView(AsyncAPIView):
+    """
+    GET /api/jobs/<id>/events: a background job's progress as server-sent events
+    (``projects.jobs.job_events``); ``?after=n`` skips the first n progress events.
+    """
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
 
-class AgentChatStreamView(APIView):
-    permission_classes = [IsAuthenticated]
+    async def get(self, request, pk):
+        if not await Job.objects.filter(id=pk, user=request.user).aexists():
+            raise NotFound()
+        after = request.query_params.get('after', '0')
+        response = StreamingHttpResponse(jobs.job_events(pk, int(after) if after.isdigit() else 0),
+                                         content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class MetricsView(APIView):
+    """GET /api/metrics: the process metrics (``projects.metrics``) in the Prometheus text format, staff only."""
+    permission_classes = [IsAdminUser]
+    renderer_classes = [metrics.PrometheusRenderer, JSONRenderer]
 
     def get(self, request):
-        # Build an SSE stream that sends a few events and closes
-        def event_stream():
-            # event: hello
-            yield f"event: hello\n"
-            yield f"data: {json.dumps({'user_id': getattr(request.user, 'id', None)})}\n\n"
-            time.sleep(0.01)
-            # event: progress
-            yield f"event: progress\n"
-            yield f"data: {json.dumps({'stage': 'processing'})}\n\n"
-            time.sleep(0.01)
-            # event: done
-            yield f"event: done\n"
-            yield f"data: {json.dumps({'ok': True})}\n\n"
-
-        return StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+        return Response(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class AgentChatStreamView(AsyncAPIView):
+    """
+    Streamed agent chat as server-sent events (see ``projects.agent.streaming`` for the events).
+
+    POST takes the same body as /api/agent/chat; GET (for EventSource) takes ``message`` and
+    optional ``context_type`` / ``context_id`` query parameters. Without a message the stream
+    only says hello and done.
+    """
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+
+    async def get(self, request):
+        params = request.query_params
+        context = {'type': params.get('context_type', 'none'), 'id': params.get('context_id')}
+        return await self.stream(request, params.get('message', ''), context, {})
+
+    async def post(self, request):
+        body = request.data or {}
+        return await self.stream(request, body.get('message', ''), body.get('context', {}) or {}, body)
+
+    async def stream(self, request, message, context, body):
+        if message:
+            ctx_summary = dict(await sync_to_async(chat_context.snapshot)(request.user, context))
+            ctx_summary['request'] = message
+            history = await sync_to_async(compact_history)(request, body, context)
+            prompt = chat_prompt(ctx_summary)
+            try:
+                slot = await ChatSlot.take(request.user.id, prompt_tokens(prompt, history))
+            except ChatLimitExceeded as exc:
+                metrics.AGENT_RUNS.inc(agent='chat_stream', outcome='rejected')
+                return Response({'detail': str(exc)}, status=429, headers={'Retry-After': str(exc.retry_after)})
+            events = chat_events(agent_factory(), prompt, AgentDeps(user=request.user, history=history),
+                                 message_history=history.messages(SYSTEM_PROMPT), slot=slot)
+        else:
+            slot, events = None, self.greeting(request.user.id)
+        response = StreamingHttpResponse(events, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # don't let nginx buffer the stream
+        if slot is not None:
+            # closing the response releases the slot too, should the stream never have started
+            response._resource_closers.append(slot.release)
+        return response
+
+    def greeting(self, user_id):
+        yield sse_event('hello', {'user_id': user_id})
+        yield sse_event('done', {'ok': True})
 
 
 @login_required